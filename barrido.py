@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Barrido de parámetros del puente de Ambite: cotas, número de agentes y tiempos entre llegadas.
+
+Cada combinación de REJILLA (o una muestra aleatoria de ellas) se simula REPETICIONES veces con simulacion.py,
+cada vez con su propia semilla, repartiendo las simulaciones entre todos los núcleos con un Pool.
+Las métricas de todas las ejecuciones se escriben en una tabla CSV, una fila por ejecución.
+
+Uso: python barrido.py [FICHERO] [SEMILLA] [MUESTRAS] [REPETICIONES]
+
+    FICHERO         tabla de resultados (por defecto barrido.csv)
+    SEMILLA         semilla de la primera ejecución; la ejecución i usa SEMILLA + i (por defecto 0)
+    MUESTRAS        cuántas combinaciones sortear de la rejilla; 0 para recorrerla entera (por defecto 0)
+    REPETICIONES    ejecuciones de cada combinación (por defecto REPETICIONES)
+
+@author: alvarocamarafernandez
+"""
+
+import os
+import sys
+import csv
+import time
+import random
+import itertools
+from multiprocessing import Pool
+
+import practicaParalela_2 as puente
+import simulacion
+from metricas import metricas, NOMBRES
+
+#valores que se prueban de cada parámetro (los nombres son las columnas de la tabla)
+REJILLA = {
+    'cota_norte': [1, 3, 6, 12],
+    'cota_sur': [1, 3, 6, 12],
+    'cota_peatones': [1, 2, 5],
+    'ncoches': [puente.NCARS],
+    'npeatones': [puente.NPED],
+    'time_norte': [0.1, 0.5],
+    'time_sur': [0.1, 0.5],
+    'time_peatones': [1, 5],
+}
+REPETICIONES = 3
+
+
+def combinaciones(rejilla: dict = REJILLA, muestras: int = 0, semilla: int = 0) -> list:
+    """Todas las combinaciones de la rejilla como diccionarios, o muestras de ellas sorteadas sin repetir."""
+    todas = [dict(zip(rejilla, valores)) for valores in itertools.product(*rejilla.values())]
+    if muestras and muestras < len(todas):
+        todas = random.Random(semilla).sample(todas, muestras)
+    return todas
+
+
+def ejecutar(trabajo: tuple) -> dict:
+    """Una simulación: (número de ejecución, semilla, parámetros) -> fila de la tabla."""
+    indice, semilla, parametros = trabajo
+    monitor = simulacion.MonitorVirtual((parametros['cota_norte'], parametros['cota_sur'], parametros['cota_peatones']))
+    tiempos = (parametros['time_norte'], parametros['time_sur'], parametros['time_peatones'])
+    r = metricas(simulacion.registros(parametros['ncoches'], parametros['npeatones'], semilla, monitor, tiempos))
+    fila = {'ejecucion': indice, 'semilla': semilla, **parametros}
+    for clave in ('cruces', 'duracion', 'cruces_por_segundo', 'ocupacion', 'cambios_de_sentido', 'equidad'):
+        fila[clave] = r.get(clave, 0)
+    for nombre in NOMBRES.values():
+        for clave in ('p50', 'p99', 'max'):
+            fila[f'espera_{nombre}_{clave}'] = r['espera'][nombre][clave] if 'espera' in r else 0.0
+    return fila
+
+
+def barrido(fichero: str = 'barrido.csv', semilla: int = 0, muestras: int = 0, repeticiones: int = REPETICIONES) -> list:
+    trabajos = []
+    for parametros in combinaciones(REJILLA, muestras, semilla):
+        for _ in range(repeticiones):
+            trabajos.append((len(trabajos), semilla + len(trabajos), parametros))
+
+    t0 = time.perf_counter()
+    with Pool(os.cpu_count()) as pool:                      #las simulaciones son independientes: una por tarea
+        filas = sorted(pool.imap_unordered(ejecutar, trabajos, chunksize=max(1, len(trabajos) // (8 * os.cpu_count()))),
+                       key=lambda fila: fila['ejecucion'])
+    real = time.perf_counter() - t0
+
+    with open(fichero, 'w', newline='') as f:
+        escritor = csv.DictWriter(f, fieldnames=list(filas[0]))
+        escritor.writeheader()
+        escritor.writerows(filas)
+    print(f"{len(filas)} ejecuciones en {real:.1f}s con {os.cpu_count()} procesos, resultados en {fichero}", file=sys.stderr)
+    return filas
+
+
+def resumen(filas: list, cuantas: int = 5) -> None:
+    """Las combinaciones con menor p99 de espera en la peor clase (media de sus repeticiones)."""
+    parametros = list(REJILLA)
+    grupos = {}
+    for fila in filas:
+        peor = max(fila[f'espera_{nombre}_p99'] for nombre in NOMBRES.values())
+        grupos.setdefault(tuple(fila[p] for p in parametros), []).append((peor, fila['cruces_por_segundo'], fila['equidad']))
+    medias = sorted((sum(v[0] for v in valores) / len(valores), sum(v[1] for v in valores) / len(valores),
+                     sum(v[2] for v in valores) / len(valores), clave) for clave, valores in grupos.items())
+    for peor, cruces, equidad, clave in medias[:cuantas]:
+        combinacion = ' '.join(f'{p}={v}' for p, v in zip(parametros, clave))
+        print(f"p99 peor clase {peor:7.3f}s  {cruces:6.2f} cruces/s  equidad {equidad:.2f}  {combinacion}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    fichero = args[0] if len(args) > 0 else 'barrido.csv'
+    semilla = int(args[1]) if len(args) > 1 else 0
+    muestras = int(args[2]) if len(args) > 2 else 0
+    repeticiones = int(args[3]) if len(args) > 3 else REPETICIONES
+    resumen(barrido(fichero, semilla, muestras, repeticiones))
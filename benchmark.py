@@ -0,0 +1,876 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Medidas de rendimiento del puente de Ambite.
+
+Uso: python benchmark.py <prueba> [argumentos]
+
+    arranque [N]    compara un proceso por agente con el modo pool (coste de lanzar N coches y agentes/s)
+    prefork [N ...] agentes creados según llegan contra agentes preforkados (practicaParalela_2.Preforkados), con procesos
+                    y con hilos: primera admision, retraso de las llegadas, cruces/s, procesos, hilos y memoria
+                    (por defecto N = 1000 y 10000)
+    monitor [N]     coste por llamada de wants_enter_car / leaves_car sin contencion (N repeticiones), con el Monitor
+                    actual y con la referencia de un Value por contador (MonitorValores)
+    despertares [N] despertares inutiles con notify_all y con el modo selectivo (N agentes, hilos en un proceso)
+    instrumentacion [N]
+                    coste del Monitor con y sin instrumentacion, y una instantanea de los histogramas durante una carga
+    backends [N]    latencia por cruce con los backends procesos, hilos y asyncio (N cruces)
+    servicio [N] [CLIENTES]
+                    ida y vuelta y peticiones/s contra el servidor (servidor.py): de una en una, en lotes, y con
+                    CLIENTES hilos repartidos en varios procesos
+    pelotones [N]   admision de uno en uno contra pelotones de K y adaptativos, con la carga 'atasco' (N semillas)
+    descartes [N]   sin limites, con plazo y con cola maxima, con la carga 'oleadas_peatones' (N semillas)
+    cotas [N]       cotas fijas contra cotas adaptativas con todas las CARGAS (N semillas)
+    estres [N] [AGENTES]
+                    AGENTES agentes con N peticiones cada uno y plazos al azar, con cada backend y combinacion de opciones
+                    (ESTRES): comprueba que nunca hay dos clases dentro ni contadores negativos y que todo acaba a 0
+    registro [N]    coste de anunciar un suceso con print() y con el registro binario (registro.py)
+    comparar [FICHERO] [SEMILLA]
+                    los monitores con y sin cotas bajo las mismas cargas (CARGAS); escribe las metricas en FICHERO (JSON)
+
+@author: alvarocamarafernandez
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import random
+import threading
+import subprocess
+from threading import Thread
+from contextlib import contextmanager
+from multiprocessing import Process, Queue, Lock, Condition, Value
+
+import practicaParalela_2 as puente
+import practicaParalela_con_inanicion as inanicion
+from registro import Registro, anillos, leer as leer_registro
+from metricas import metricas, percentil, NOMBRES
+
+
+@contextmanager
+def sin_salida():
+    """
+    Los coches y peatones escriben por pantalla en cada paso. Para medir, redirigimos el descriptor 1
+    (que heredan los procesos hijos) a /dev/null y lo restauramos al terminar.
+    """
+    sys.stdout.flush()
+    guardado = os.dup(1)
+    nulo = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(nulo, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(guardado, 1)
+        os.close(nulo)
+        os.close(guardado)
+
+
+def arranque_procesos(n: int) -> tuple:
+    """Lanza n coches del norte con un proceso por coche. Devuelve (tiempo en lanzarlos, tiempo total)."""
+    monitor = puente.Monitor()
+    t0 = time.perf_counter()
+    plst = []
+    for cid in range(n):
+        p = Process(target=puente.car, args=(cid, puente.NORTH, monitor))
+        p.start()
+        plst.append(p)
+    t1 = time.perf_counter()
+    for p in plst:
+        p.join()
+    return t1 - t0, time.perf_counter() - t0
+
+
+def arranque_pool(n: int, nworkers: int = puente.NWORKERS, nhilos: int = puente.HILOS_POR_WORKER) -> tuple:
+    """Lo mismo que arranque_procesos, pero con los workers del modo pool (ya arrancados antes de medir)."""
+    monitor = puente.Monitor()
+    cola = Queue()
+    workers = [Process(target=puente.worker, args=(cola, monitor, nhilos)) for _ in range(nworkers)]
+    for w in workers:
+        w.start()
+    t0 = time.perf_counter()
+    for cid in range(n):
+        cola.put(('car', cid, puente.NORTH, None))
+    t1 = time.perf_counter()
+    for _ in range(nworkers * nhilos):
+        cola.put(None)
+    for w in workers:
+        w.join()
+    return t1 - t0, time.perf_counter() - t0
+
+
+def arranque(n: int = 500) -> None:
+    with sin_salida():
+        lanzar_p, total_p = arranque_procesos(n)
+        lanzar_w, total_w = arranque_pool(n)
+    print(f"{n} coches, un proceso por agente: lanzar {lanzar_p:.3f}s, total {total_p:.3f}s, {n/total_p:.0f} agentes/s")
+    print(f"{n} coches, pool {puente.NWORKERS}x{puente.HILOS_POR_WORKER}: lanzar {lanzar_w:.3f}s, total {total_w:.3f}s, {n/total_w:.0f} agentes/s")
+    print(f"lanzar es {lanzar_p/lanzar_w:.0f} veces mas rapido, {total_p/total_w:.1f} veces mas agentes/s")
+
+
+INTERVALO_LLEGADAS = 0.0005                                 #prefork(): una llegada cada medio milisegundo
+MEMORIA_HIJO = 2 << 20                                      #memoria propia de cada proceso hijo (aquí, unos 1.8MB de PSS)
+
+
+def huella() -> tuple:
+    """
+    (procesos, hilos, memoria en MB) de este proceso y sus hijos, leídos de /proc (solo Linux). La memoria es la PSS:
+    lo que comparten padre e hijos desde el fork se reparte entre ellos en vez de contarse entero en cada uno.
+    """
+    pid = os.getpid()
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        pids = [pid] + [int(hijo) for hijo in f.read().split()]
+    memoria = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                memoria += next(int(linea.split()[1]) for linea in f if linea.startswith('Pss:'))
+        except OSError:                                     #ya ha terminado
+            pass
+    return len(pids), threading.active_count(), memoria / 1024
+
+
+def arrancar(llegadas: list, backend: str, prefork: bool) -> dict:
+    """
+    Una ejecución de prefork(): los agentes se crean según llegan (trazas.reproducir) o antes de empezar (Preforkados).
+    Los tiempos salen del registro binario y se cuentan desde el inicio: con prefork, desde que empieza a soltarse
+    a los agentes, así que crearlos no cuenta. La huella con prefork es la de cuando ya están todos esperando; sin prefork, la mayor
+    de las que se ven durante la ejecución.
+    """
+    import trazas
+    monitor = puente.Monitor(backend=backend)
+    registro = Registro(nanillos=anillos(backend))
+    fichero = f'/tmp/benchmark_{os.getpid()}.bin'
+    registro.empezar_volcado(fichero)
+    preparacion = 0.0
+    if prefork:
+        t0 = time.perf_counter()
+        agentes = puente.Preforkados(llegadas, monitor, registro)
+        agentes.esperar()
+        preparacion = time.perf_counter() - t0
+        pico = huella()
+        inicio = agentes.soltar()
+        agentes.terminar()
+    else:
+        pico = huella()
+        terminado = threading.Event()
+        def vigilar() -> None:
+            nonlocal pico
+            while not terminado.wait(0.1):
+                pico = max(pico, huella(), key=lambda h: h[2])
+        vigilante = Thread(target=vigilar)
+        vigilante.start()
+        inicio = time.monotonic()
+        trazas.reproducir(llegadas, monitor, None, registro)
+        terminado.set()
+        vigilante.join()
+    perdidos = registro.terminar_volcado()
+
+    programada, ids = {}, [0, 0, 0]                         #los mismos ids que ponen reproducir y Preforkados
+    for t, clase, _ in llegadas:
+        ids[clase] += 1
+        programada[clase, ids[clase]] = inicio + t
+    retrasos, entradas, salidas = [], [], []
+    for _, t, aid, clase, suceso, *_ in leer_registro(fichero):
+        if suceso == puente.LLEGA:
+            retrasos.append(t - programada[clase, aid])
+        elif suceso == puente.ENTRA:
+            entradas.append(t)
+        elif suceso == puente.SALE:
+            salidas.append(t)
+    os.unlink(fichero)
+    retrasos.sort()
+    return {'preparacion': preparacion, 'primera': min(entradas) - inicio,
+            'retraso_p50': percentil(retrasos, 50), 'retraso_p99': percentil(retrasos, 99),
+            'cruces_por_segundo': len(salidas) / (max(salidas) - inicio), 'huella': pico, 'perdidos': perdidos}
+
+
+def faltan(n: int, prefork: bool) -> str:
+    """
+    Con un proceso por agente, lo que no alcanza para n agentes (o None): cada Process tiene dos descriptores abiertos
+    hasta que se le hace join, y todos siguen vivos a la vez si están preforkados (MEMORIA_HIJO cada uno).
+    """
+    import resource
+    descriptores = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if 2 * n + 64 > descriptores:
+        return f"harian falta unos {2 * n + 64} descriptores de fichero y el limite es {descriptores}"
+    libre = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    if prefork and n * MEMORIA_HIJO > 0.8 * libre:
+        return f"harian falta unos {n * MEMORIA_HIJO >> 20}MB y hay {libre >> 20}MB libres"
+    return None
+
+
+def prefork(*ns: int) -> None:
+    """
+    n coches, uno cada INTERVALO_LLEGADAS segundos alternando norte y sur y sin tiempo dentro del puente, con un agente
+    por coche: creados según llegan (como los generadores) o preforkados. Si crear cada agente tarda más que el tiempo
+    entre llegadas, las llegadas se retrasan y los cruces por segundo miden lo que cuesta crear procesos, no el monitor.
+    Con procesos, si no caben (ver faltan) no se prueba.
+    """
+    for n in ns or (1000, 10000):
+        llegadas = [(i * INTERVALO_LLEGADAS, (puente.NORTH, puente.SOUTH)[i % 2], 0.0) for i in range(n)]
+        print(f"{n} coches, {n * INTERVALO_LLEGADAS:.1f}s de llegadas ({1 / INTERVALO_LLEGADAS:.0f} llegadas/s):")
+        for backend in ('procesos', 'hilos'):
+            for modo in (False, True):
+                nombre = f"{backend}, {'preforkados' if modo else 'segun llegan'}"
+                falta = None if backend == 'hilos' else faltan(n, modo)
+                if falta is not None:
+                    print(f"  {nombre:23} no caben: {falta}")
+                    continue
+                r = arrancar(llegadas, backend, modo)
+                procesos, hilos, memoria = r['huella']
+                print(f"  {nombre:23} preparar {r['preparacion']:5.2f}s  primera admision {r['primera'] * 1e3:7.2f}ms  "
+                      f"retraso de las llegadas p50 {r['retraso_p50'] * 1e3:7.1f}ms p99 {r['retraso_p99'] * 1e3:7.1f}ms  "
+                      f"{r['cruces_por_segundo']:6.0f} cruces/s  {procesos:5} procesos {hilos:5} hilos {memoria:6.0f}MB"
+                      f"{'  %d sucesos perdidos' % r['perdidos'] if r['perdidos'] else ''}")
+
+
+class MonitorValores():
+    """
+    Referencia para monitor(): los coches del Monitor de antes de estado[...], con un Value('i') por contador
+    (y cada Value con su propio lock, que se coge además del mutex en cada lectura y escritura).
+    """
+    def __init__(self):
+        self.mutex = Lock()
+        self.patata = Value('i', 0)
+        self.cochesNorteDentro = Value('i', 0)
+        self.cochesSurDentro = Value('i', 0)
+        self.peatonesDentro = Value('i', 0)
+        self.cochesNorteEsperando = Value('i', 0)
+        self.cochesSurEsperando = Value('i', 0)
+        self.peatonesEsperando = Value('i', 0)
+        self.pasanNorte = Condition(self.mutex)
+        self.pasanSur = Condition(self.mutex)
+        self.pasanPeatones = Condition(self.mutex)
+        self.esperanNorte = Condition(self.mutex)
+        self.esperanSur = Condition(self.mutex)
+
+    def adelanteNorte(self) -> bool:
+        return self.cochesSurDentro.value == 0 and self.peatonesDentro.value == 0
+
+    def adelanteSur(self) -> bool:
+        return self.cochesNorteDentro.value == 0 and self.peatonesDentro.value == 0
+
+    def esperandoCochesNorte(self) -> bool:
+        return self.cochesSurEsperando.value <= puente.COTA_COCHES_SUR and self.peatonesEsperando.value <= puente.COTA_PEATONES
+
+    def esperandoCochesSur(self) -> bool:
+        return self.cochesNorteEsperando.value <= puente.COTA_COCHES_NORTE and self.peatonesEsperando.value <= puente.COTA_PEATONES
+
+    def wants_enter_car(self, direction: int) -> None:
+        self.mutex.acquire()
+        self.patata.value += 1
+        if direction == puente.NORTH:
+            self.cochesNorteEsperando.value = self.cochesNorteEsperando.value + 1
+            self.esperanNorte.wait_for(self.esperandoCochesNorte)
+            self.pasanNorte.wait_for(self.adelanteNorte)
+            self.cochesNorteDentro.value = self.cochesNorteDentro.value + 1
+            self.cochesNorteEsperando.value = self.cochesNorteEsperando.value - 1
+            if self.cochesNorteEsperando.value <= puente.COTA_COCHES_NORTE:
+                self.pasanSur.notify_all()
+                self.pasanPeatones.notify_all()
+        else:
+            self.cochesSurEsperando.value = self.cochesSurEsperando.value + 1
+            self.esperanSur.wait_for(self.esperandoCochesSur)
+            self.pasanSur.wait_for(self.adelanteSur)
+            self.cochesSurDentro.value = self.cochesSurDentro.value + 1
+            self.cochesSurEsperando.value = self.cochesSurEsperando.value - 1
+            if self.cochesSurEsperando.value <= puente.COTA_COCHES_SUR:
+                self.pasanPeatones.notify_all()
+                self.pasanNorte.notify_all()
+        self.mutex.release()
+
+    def leaves_car(self, direction: int) -> None:
+        self.mutex.acquire()
+        self.patata.value += 1
+        if direction == puente.NORTH:
+            self.cochesNorteDentro.value = self.cochesNorteDentro.value - 1
+            if self.cochesNorteDentro.value == 0:
+                self.pasanSur.notify_all()
+                self.pasanPeatones.notify_all()
+        else:
+            self.cochesSurDentro.value = self.cochesSurDentro.value - 1
+            if self.cochesSurDentro.value == 0:
+                self.pasanNorte.notify_all()
+                self.pasanPeatones.notify_all()
+        self.mutex.release()
+
+
+def monitor(n: int = 200000) -> None:
+    """El Monitor actual contra MonitorValores (la misma lógica con un Value por contador), con la mejor de 5 tandas."""
+    costes = {}
+    for nombre, crear in (('valores', MonitorValores), ('estado', puente.Monitor)):
+        mejor_entrar = mejor_salir = float('inf')
+        for _ in range(5):                                  #nos quedamos con la mejor de 5 tandas
+            m = crear()
+            t0 = time.perf_counter()
+            for _ in range(n):
+                m.wants_enter_car(puente.NORTH)
+            t1 = time.perf_counter()
+            for _ in range(n):
+                m.leaves_car(puente.NORTH)
+            t2 = time.perf_counter()
+            mejor_entrar = min(mejor_entrar, t1 - t0)
+            mejor_salir = min(mejor_salir, t2 - t1)
+        costes[nombre] = (mejor_entrar / n * 1e9, mejor_salir / n * 1e9)
+        print(f"{nombre:8} wants_enter_car: {costes[nombre][0]:6.0f} ns por llamada  leaves_car: {costes[nombre][1]:6.0f} ns por llamada")
+    print(f"estado[...] contra un Value por contador: wants_enter_car x{costes['valores'][0] / costes['estado'][0]:.1f}, "
+          f"leaves_car x{costes['valores'][1] / costes['estado'][1]:.1f}")
+
+
+def instrumentacion(n: int = 200000) -> None:
+    costes = {}
+    for instrumentar in (False, True):
+        mejor = float('inf')
+        for _ in range(5):
+            m = puente.Monitor(instrumentar=instrumentar)
+            t0 = time.perf_counter()
+            for _ in range(n):
+                m.wants_enter_car(puente.NORTH)
+                m.leaves_car(puente.NORTH)
+            mejor = min(mejor, time.perf_counter() - t0)
+        costes[instrumentar] = mejor / n * 1e9
+        print(f"{'con' if instrumentar else 'sin'} instrumentacion: {costes[instrumentar]:.0f} ns por entrada y salida")
+    print(f"sobrecoste sin contencion: {(costes[True] / costes[False] - 1) * 100:.1f}%")
+
+    #con contencion, mientras se ejecuta una carga, se van pidiendo instantaneas
+    llegadas = calendario(CARGAS['equilibrada'], 0)
+    tiempos = {}
+    for instrumentar in (False, True):
+        m = puente.Monitor(instrumentar=instrumentar)
+        t0 = time.perf_counter()
+        hilo = Thread(target=ejecutar, args=(m, llegadas))
+        hilo.start()
+        while hilo.is_alive():
+            m.instantanea()
+            hilo.join(0.1)
+        tiempos[instrumentar] = time.perf_counter() - t0
+    print(f"carga 'equilibrada': {tiempos[False]:.2f}s sin instrumentacion, {tiempos[True]:.2f}s con ella")
+    for clase, medidas in m.instantanea().items():
+        print(clase, ' '.join(f"{nombre}: n={h['n']} media={h['media']:.1f}" for nombre, h in medidas.items()))
+
+
+def latencias(valores: list) -> str:
+    valores = sorted(valores)
+    return f"p50 {valores[len(valores) // 2] * 1e6:7.1f}us  p99 {valores[int(len(valores) * 0.99)] * 1e6:8.1f}us"
+
+
+async def cruces_asincronos(monitor, clases: list, tiempos: list, ceder: bool = False) -> None:
+    for clase in clases:
+        t0 = time.perf_counter()
+        if clase == puente.PEDESTRIAN:
+            await monitor.wants_enter_pedestrian()
+            if ceder:
+                await asyncio.sleep(0)
+            await monitor.leaves_pedestrian()
+        else:
+            await monitor.wants_enter_car(clase)
+            if ceder:
+                await asyncio.sleep(0)
+            await monitor.leaves_car(clase)
+        tiempos.append(time.perf_counter() - t0)
+
+
+def cruces(monitor, clases: list, tiempos: list, ceder: bool = False) -> None:
+    for clase in clases:
+        t0 = time.perf_counter()
+        if clase == puente.PEDESTRIAN:
+            monitor.wants_enter_pedestrian()
+            if ceder:
+                time.sleep(0)
+            monitor.leaves_pedestrian()
+        else:
+            monitor.wants_enter_car(clase)
+            if ceder:
+                time.sleep(0)
+            monitor.leaves_car(clase)
+        tiempos.append(time.perf_counter() - t0)
+
+
+def backends(n: int = 20000, nagentes: int = 64) -> None:
+    """
+    Latencia de un cruce (de pedir entrar a haber salido) con cada backend. Primero un solo agente sin tiempo dentro
+    del puente (solo el coste del monitor), y luego nagentes a la vez (hilos, o corrutinas con asyncio) con clases al azar,
+    que dentro del puente ceden el procesador (sleep(0)) para que los demás tengan que esperarles.
+    Con 'procesos' los agentes también son hilos, para medir solo el coste de las primitivas de multiprocessing.
+    """
+    rnd = random.Random(0)
+    clases = [rnd.choice((puente.NORTH, puente.SOUTH, puente.NORTH, puente.SOUTH, puente.PEDESTRIAN)) for _ in range(n)]
+    for backend in ('procesos', 'hilos', 'asyncio'):
+        solo, juntos = [], []
+        monitor = puente.crear_monitor(backend, selectivo=True)
+        t0 = time.perf_counter()
+        if backend == 'asyncio':
+            asyncio.run(cruces_asincronos(monitor, [puente.NORTH] * n, solo))
+        else:
+            cruces(monitor, [puente.NORTH] * n, solo)
+        t_solo = time.perf_counter() - t0
+
+        monitor = puente.crear_monitor(backend, selectivo=True)
+        partes = [clases[i::nagentes] for i in range(nagentes)]
+        t0 = time.perf_counter()
+        if backend == 'asyncio':
+            async def todos():
+                await asyncio.gather(*(cruces_asincronos(monitor, parte, juntos, True) for parte in partes))
+            asyncio.run(todos())
+        else:
+            hilos = [Thread(target=cruces, args=(monitor, parte, juntos, True)) for parte in partes]
+            for h in hilos:
+                h.start()
+            for h in hilos:
+                h.join()
+        t_juntos = time.perf_counter() - t0
+        print(f"{backend:9} un agente:   {latencias(solo)}  {n / t_solo:8.0f} cruces/s")
+        print(f"{backend:9} {nagentes} agentes: {latencias(juntos)}  {n / t_juntos:8.0f} cruces/s")
+
+    #con asyncio cada agente es una corrutina: muchos a la vez, cada uno cruzando una vez
+    monitor = puente.MonitorAsincrono(selectivo=True)
+    tiempos = []
+    t0 = time.perf_counter()
+    async def muchos():
+        await asyncio.gather(*(cruces_asincronos(monitor, [clase], tiempos, True) for clase in clases))
+    asyncio.run(muchos())
+    print(f"asyncio   {n} agentes a la vez: {latencias(tiempos)}  {n / (time.perf_counter() - t0):8.0f} cruces/s")
+
+
+def clientes_servicio(ruta: str, partes: list, cola) -> None:
+    """Un generador de carga independiente: un Cliente con sus conexiones y un hilo por parte, cada uno cruzando."""
+    import servidor
+    cliente = servidor.Cliente(ruta)
+    tiempos = []
+    hilos = [Thread(target=cruces, args=(cliente, parte, tiempos, True)) for parte in partes]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    cliente.cerrar()
+    cola.put(tiempos)
+
+
+def servicio(n: int = 20000, nclientes: int = 256, nprocesos: int = 4) -> None:
+    """
+    El puente como servicio (servidor.py). Primero un cliente con una sola conexión: ida y vuelta de cada petición
+    de una en una, y luego en lotes (muchas peticiones por la conexión sin esperar respuesta). Después nclientes
+    hilos repartidos en nprocesos procesos, cada proceso con su Cliente, cruzando con clases al azar como en backends.
+    """
+    import servidor
+    ruta = f'/tmp/benchmark_{os.getpid()}.sock'
+    s = Process(target=servidor.servir, args=(ruta,))
+    s.start()
+    try:
+        cliente = servidor.Cliente(ruta, 1)
+        tiempos = []
+        t0 = time.perf_counter()
+        for _ in range(n // 2):
+            t1 = time.perf_counter()
+            cliente.wants_enter_car(puente.NORTH)
+            t2 = time.perf_counter()
+            cliente.leaves_car(puente.NORTH)
+            tiempos += [t2 - t1, time.perf_counter() - t2]
+        print(f"de una en una:   {latencias(tiempos)}  {n / (time.perf_counter() - t0):8.0f} peticiones/s")
+        for tam in (16, 256):
+            tiempos = []
+            t0 = time.perf_counter()
+            for _ in range(n // (2 * tam)):
+                for orden in (servidor.ENTRAR, servidor.SALIR):
+                    t1 = time.perf_counter()
+                    cliente.lote([(orden, puente.NORTH)] * tam)
+                    tiempos.append(time.perf_counter() - t1)
+            print(f"lotes de {tam:3}:    {latencias(tiempos)}  {n // (2 * tam) * 2 * tam / (time.perf_counter() - t0):8.0f} "
+                  f"peticiones/s (latencia del lote)")
+        cliente.cerrar()
+
+        rnd = random.Random(0)
+        clases = [rnd.choice((puente.NORTH, puente.SOUTH, puente.NORTH, puente.SOUTH, puente.PEDESTRIAN)) for _ in range(n)]
+        partes = [clases[i::nclientes] for i in range(nclientes)]
+        cola = Queue()
+        procesos = [Process(target=clientes_servicio, args=(ruta, partes[i::nprocesos], cola)) for i in range(nprocesos)]
+        t0 = time.perf_counter()
+        for p in procesos:
+            p.start()
+        tiempos = [t for _ in procesos for t in cola.get()]
+        real = time.perf_counter() - t0
+        for p in procesos:
+            p.join()
+        print(f"{nclientes} clientes en {nprocesos} procesos: {latencias(tiempos)} por cruce  {2 * n / real:8.0f} peticiones/s")
+    finally:
+        s.terminate()
+        s.join()
+
+
+def despertares(n: int = 600) -> None:
+    for selectivo in (False, True):
+        m = puente.Monitor(selectivo=selectivo)
+        rnd = random.Random(0)
+        hilos = []
+        t0 = time.perf_counter()
+        for _ in range(n):
+            clase = rnd.choice((puente.NORTH, puente.SOUTH, puente.NORTH, puente.SOUTH, puente.PEDESTRIAN))
+            h = Thread(target=puente.cruzar, args=(m, clase, rnd.random() * 0.005))
+            h.start()
+            hilos.append(h)
+            time.sleep(rnd.expovariate(1 / 0.0002))
+        for h in hilos:
+            h.join()
+        total, inutiles = m.despertares()
+        modo = 'selectivo' if selectivo else 'notify_all'
+        print(f"{modo}: {n} agentes en {time.perf_counter() - t0:.2f}s, {total} despertares, {inutiles} inutiles")
+
+
+def registro(n: int = 100000) -> None:
+    """
+    Coste de anunciar un suceso con print() y con el registro binario, con el volcado en marcha como en una ejecución
+    de verdad. Si el volcado no da abasto, el anillo da la vuelta y se pierden sucesos: se dice cuántos.
+    """
+    m = puente.Monitor()
+    r = Registro()
+    fichero = f'/tmp/benchmark_{os.getpid()}.bin'
+    with sin_salida():
+        t0 = time.perf_counter()
+        for i in range(n):
+            puente.anunciar(i, puente.NORTH, puente.ENTRA, m)
+        sys.stdout.flush()
+        t_print = time.perf_counter() - t0
+    r.empezar_volcado(fichero)
+    t0 = time.perf_counter()
+    for i in range(n):
+        puente.anunciar(i, puente.NORTH, puente.ENTRA, m, r)
+    t_registro = time.perf_counter() - t0
+    perdidos = r.terminar_volcado()
+    volcados = sum(1 for _ in leer_registro(fichero))
+    os.unlink(fichero)
+    print(f"print(): {t_print / n * 1e9:.0f} ns por suceso")
+    print(f"registro binario: {t_registro / n * 1e9:.0f} ns por suceso, {volcados} volcados y {perdidos} perdidos "
+          f"(anillo de {r.capacidad})")
+
+
+#Cargas para comparar monitores: por cada clase, (cuántos, tiempo medio entre llegadas, cuántos llegan a la vez).
+#Los tiempos están en la escala de practicaParalela_2.py y se multiplican por ESCALA al ejecutarlas.
+CARGAS = {
+    'equilibrada': {puente.NORTH: (200, 0.5, 1), puente.SOUTH: (200, 0.5, 1), puente.PEDESTRIAN: (20, 5, 1)},
+    'norte': {puente.NORTH: (400, 0.1, 1), puente.SOUTH: (40, 1.0, 1), puente.PEDESTRIAN: (16, 5, 1)},
+    'rafagas_peatones': {puente.NORTH: (150, 0.5, 1), puente.SOUTH: (150, 0.5, 1), puente.PEDESTRIAN: (60, 10, 10)},
+    'saturada': {puente.NORTH: (300, 0.05, 1), puente.SOUTH: (300, 0.05, 1), puente.PEDESTRIAN: (30, 0.5, 1)},
+    'atasco': {puente.NORTH: (600, 0.01, 1), puente.SOUTH: (600, 0.01, 1), puente.PEDESTRIAN: (60, 0.1, 1)},
+    'oleadas_peatones': {puente.NORTH: (600, 0.01, 1), puente.SOUTH: (600, 0.01, 1), puente.PEDESTRIAN: (300, 1.0, 100)},
+}
+ESCALA = 0.02
+LIMITE = 60                                                 #segundos reales antes de dar una ejecución por bloqueada
+
+MONITORES = {
+    'con_inanicion': inanicion.Monitor,
+    'cotas': puente.Monitor,
+    'cotas_selectivo': lambda: puente.Monitor(selectivo=True),
+    'cotas_adaptativas': lambda: puente.Monitor(selectivo=True, cotas='adaptativas', espera_maxima=puente.ESPERA_MAXIMA * ESCALA),
+}
+
+
+def calendario(carga: dict, semilla: int = None) -> list:
+    """Lista ordenada de llegadas (t, clase, duracion) de una carga; cada clase tiene su propio generador aleatorio."""
+    llegadas = []
+    for clase, (n, media, rafaga) in carga.items():
+        rnd = random.Random(None if semilla is None else semilla + clase)
+        factor = puente.FACTOR_PEATONES if clase == puente.PEDESTRIAN else puente.FACTOR_COCHES
+        t = 0.0
+        cuantos = 0
+        while cuantos < n:
+            for _ in range(min(rafaga, n - cuantos)):
+                llegadas.append((t, clase, rnd.random() * factor))
+                cuantos += 1
+            t += rnd.expovariate(1/media)
+    llegadas.sort()
+    return llegadas
+
+
+def ejecutar(monitor, llegadas: list, escala: float = ESCALA, limite: float = LIMITE) -> tuple:
+    """
+    Lanza un hilo por agente en el instante que le toca (multiplicado por escala) y apunta (clase, llegada, entrada, salida).
+    Devuelve (registros, completa); completa es False si algún agente seguía bloqueado pasado el límite.
+    Los que se van sin entrar (monitores con plazo o cola_maxima) no se apuntan.
+    """
+    registros = []
+    hilos = []
+    t0 = time.perf_counter()
+    for t, clase, duracion in llegadas:
+        espera = t0 + t * escala - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        h = Thread(target=puente.cruzar, args=(monitor, clase, duracion * escala, registros), daemon=True)
+        h.start()
+        hilos.append(h)
+    fin = time.perf_counter() + limite
+    for h in hilos:
+        h.join(max(0, fin - time.perf_counter()))
+    return list(registros), all(not h.is_alive() for h in hilos)
+
+
+#politicas de admision que compara pelotones(): valor de Monitor(peloton=...)
+PELOTONES = {'uno_a_uno': None, 'k16': 16, 'k64': 64, 'adaptativo': 'adaptativo'}
+
+
+def pelotones(n: int = 5) -> None:
+    """Mediana de n semillas de los cruces por segundo y del p99 de espera de la peor clase, en modo selectivo."""
+    resultados = {nombre: [] for nombre in PELOTONES}
+    for semilla in range(n):
+        llegadas = calendario(CARGAS['atasco'], semilla)
+        for nombre, peloton in PELOTONES.items():
+            registros, completa = ejecutar(puente.Monitor(selectivo=True, peloton=peloton), llegadas)
+            r = metricas(registros)
+            peor = max(r['espera'][nombre_clase]['p99'] for nombre_clase in NOMBRES.values())
+            resultados[nombre].append((r['cruces_por_segundo'], peor, r['cambios_de_sentido'], completa))
+    base = sorted(v[0] for v in resultados['uno_a_uno'])[n // 2]
+    for nombre, valores in resultados.items():
+        cruces = sorted(v[0] for v in valores)[n // 2]
+        peor = sorted(v[1] for v in valores)[n // 2]
+        cambios = sorted(v[2] for v in valores)[n // 2]
+        print(f"{nombre:11} {cruces:8.1f} cruces/s ({(cruces / base - 1) * 100:+.0f}%)  p99 peor clase {peor * 1000:6.1f}ms  "
+              f"cambios {cambios:3}{'' if all(v[3] for v in valores) else '  BLOQUEADO'}")
+
+
+#limites que compara descartes(): opciones de Monitor, con los tiempos en la escala de practicaParalela_2.py (se multiplican por ESCALA)
+DESCARTES = {'sin_limites': {}, 'plazo_05s': {'plazo': 0.5}, 'cola_20': {'cola_maxima': 20}, 'plazo_05s_cola_20': {'plazo': 0.5, 'cola_maxima': 20}}
+
+
+def descartes(n: int = 5) -> None:
+    """
+    Con oleadas de peatones, la espera sin límites crece con cada oleada. Con plazo o cola máxima se descarta a parte
+    de los agentes y la espera de los que entran queda acotada. Mediana de n semillas, en modo selectivo.
+    """
+    resultados = {nombre: [] for nombre in DESCARTES}
+    for semilla in range(n):
+        llegadas = calendario(CARGAS['oleadas_peatones'], semilla)
+        for nombre, opciones in DESCARTES.items():
+            opciones = {clave: valor * ESCALA if clave == 'plazo' else valor for clave, valor in opciones.items()}
+            monitor = puente.Monitor(selectivo=True, **opciones)
+            registros, completa = ejecutar(monitor, llegadas)
+            r = metricas(registros)
+            peor = max(r['espera'][nombre_clase]['p99'] for nombre_clase in NOMBRES.values())
+            maxima = max(r['espera'][nombre_clase]['max'] for nombre_clase in NOMBRES.values())
+            caducados = sum(d['caducados'] for d in monitor.descartes().values())
+            rechazados = sum(d['rechazados'] for d in monitor.descartes().values())
+            resultados[nombre].append((r['cruces_por_segundo'], peor, maxima, r['cruces'], caducados, rechazados, completa))
+    for nombre, valores in resultados.items():
+        cruces, peor, maxima, servidos, caducados, rechazados = (sorted(v[k] for v in valores)[n // 2] for k in range(6))
+        print(f"{nombre:17} {cruces:8.1f} cruces/s  p99 peor clase {peor * 1000:6.1f}ms  maximo {maxima * 1000:6.1f}ms  "
+              f"cruzan {servidos:4}  caducados {caducados:4}  rechazados {rechazados:4}"
+              f"{'' if all(v[6] for v in valores) else '  BLOQUEADO'}")
+
+
+def cotas(n: int = 5) -> None:
+    """
+    Las cotas fijas (COTA_*) contra las adaptativas, con las mismas llegadas (n semillas) de cada carga y en modo selectivo.
+    Mediana de los cruces por segundo, del p99 y del máximo de espera de la peor clase y de los cambios de sentido.
+    ESPERA_MAXIMA se multiplica por ESCALA, como los tiempos de las cargas.
+    """
+    for nombre_carga, carga in CARGAS.items():
+        resultados = {'fijas': [], 'adaptativas': []}
+        for semilla in range(n):
+            llegadas = calendario(carga, semilla)
+            for nombre, monitor in (('fijas', puente.Monitor(selectivo=True)),
+                                    ('adaptativas', MONITORES['cotas_adaptativas']())):
+                registros, completa = ejecutar(monitor, llegadas)
+                r = metricas(registros)
+                peor = max(r['espera'][nombre_clase]['p99'] for nombre_clase in NOMBRES.values())
+                maxima = max(r['espera'][nombre_clase]['max'] for nombre_clase in NOMBRES.values())
+                resultados[nombre].append((r['cruces_por_segundo'], peor, maxima, r['cambios_de_sentido'], completa, monitor.cotas()))
+        base = sorted(v[0] for v in resultados['fijas'])[n // 2]
+        for nombre, valores in resultados.items():
+            cruces, peor, maxima, cambios = (sorted(v[k] for v in valores)[n // 2] for k in range(4))
+            print(f"{nombre_carga:17} {nombre:11} {cruces:8.1f} cruces/s ({(cruces / base - 1) * 100:+4.0f}%)  "
+                  f"p99 peor clase {peor * 1000:6.1f}ms  maximo {maxima * 1000:6.1f}ms  cambios {cambios:4}  "
+                  f"cotas al final {valores[-1][5]}{'' if all(v[4] for v in valores) else '  BLOQUEADO'}")
+
+
+#estres(): opciones de cada combinación, que se prueba con cada backend y con y sin selectivo
+ESTRES = {'sin_limites': {}, 'cotas_adaptativas': {'cotas': 'adaptativas', 'espera_maxima': 0.005},
+          'peloton_16': {'peloton': 16}, 'peloton_adaptativo': {'peloton': 'adaptativo'},
+          'plazo_2ms': {'plazo': 0.002}, 'cola_4': {'cola_maxima': 4},
+          'todo': {'cotas': 'adaptativas', 'espera_maxima': 0.005, 'peloton': 'adaptativo', 'plazo': 0.002,
+                   'cola_maxima': 4}}
+PLAZOS_ESTRES = (None, 0.0005, 0.002, 0.01)                 #plazo de cada petición, al azar (None: el del monitor)
+DENTRO_ESTRES = 0.0003                                      #como mucho, segundos dentro del puente
+#contadores que tienen que acabar a 0: dentro, esperando, bloqueados en cada condición, avisados y pases
+FINALES = (*range(puente.NORTE_DENTRO, puente.DESPERTARES), *range(puente.AVISADOS_NORTE, puente.FASE))
+
+
+def revisar(estado, fallos: list) -> None:
+    """Lo que no puede pasar nunca: más de una clase dentro del puente o algún contador negativo (FASE puede ser -1)."""
+    if sum(1 for c in puente.DENTRO_CLASE if estado[c]) > 1:
+        fallos.append(f"clases dentro a la vez {[estado[c] for c in puente.DENTRO_CLASE]}")
+    negativos = [i for i in range(puente.NCONTADORES) if i != puente.FASE and estado[i] < 0]
+    if negativos:
+        fallos.append(f"contadores negativos {negativos}")
+
+
+def vigilar(estado, parar, fallos: list, muestras: list) -> None:
+    """Revisa el estado sin coger el mutex (muestreo.leer, el monitor es muestreable) hasta que se pide parar."""
+    from muestreo import leer
+    while not parar.is_set():
+        copia, _ = leer(estado)
+        revisar(copia, fallos)
+        muestras[0] += 1
+        time.sleep(0.0001)
+
+
+def agente_estres(monitor, semilla: int, n: int, dentro: list, lock, cuenta: list, fallos: list) -> None:
+    """
+    n peticiones de una clase y un plazo al azar. Los que entran se apuntan en dentro (lo que ve el agente,
+    aparte de los contadores del monitor) y comprueban que no hay otra clase en el puente.
+    """
+    rnd = random.Random(semilla)
+    for _ in range(n):
+        clase = rnd.choice((puente.NORTH, puente.SOUTH, puente.NORTH, puente.SOUTH, puente.PEDESTRIAN))
+        plazo = rnd.choice(PLAZOS_ESTRES)
+        if clase == puente.PEDESTRIAN:
+            entra = monitor.wants_enter_pedestrian(plazo)
+        else:
+            entra = monitor.wants_enter_car(clase, plazo)
+        cuenta[0 if entra else 1] += 1
+        if not entra:
+            continue
+        with lock:
+            dentro[clase] += 1
+            if sum(1 for d in dentro if d) > 1:
+                fallos.append(f"agentes de clases distintas dentro a la vez {dentro}")
+        time.sleep(rnd.random() * DENTRO_ESTRES)
+        with lock:
+            dentro[clase] -= 1
+        if clase == puente.PEDESTRIAN:
+            monitor.leaves_pedestrian()
+        else:
+            monitor.leaves_car(clase)
+
+
+async def agente_estres_asincrono(monitor, semilla: int, n: int, dentro: list, cuenta: list, fallos: list) -> None:
+    rnd = random.Random(semilla)
+    for _ in range(n):
+        clase = rnd.choice((puente.NORTH, puente.SOUTH, puente.NORTH, puente.SOUTH, puente.PEDESTRIAN))
+        plazo = rnd.choice(PLAZOS_ESTRES)
+        if clase == puente.PEDESTRIAN:
+            entra = await monitor.wants_enter_pedestrian(plazo)
+        else:
+            entra = await monitor.wants_enter_car(clase, plazo)
+        cuenta[0 if entra else 1] += 1
+        if not entra:
+            continue
+        dentro[clase] += 1
+        if sum(1 for d in dentro if d) > 1:
+            fallos.append(f"agentes de clases distintas dentro a la vez {dentro}")
+        await asyncio.sleep(rnd.random() * DENTRO_ESTRES)
+        dentro[clase] -= 1
+        if clase == puente.PEDESTRIAN:
+            await monitor.leaves_pedestrian()
+        else:
+            await monitor.leaves_car(clase)
+
+
+def estres(n: int = 150, nagentes: int = 48) -> None:
+    """
+    nagentes agentes (hilos, o corrutinas con asyncio; con 'procesos' también hilos) que hacen n peticiones cada uno
+    con plazos al azar, con cada backend, con y sin selectivo y con cada combinación de ESTRES. Mientras tanto
+    se revisa el estado sin mutex (revisar), y al final ningún agente puede seguir bloqueado y los contadores
+    de FINALES tienen que estar a 0. Si algo falla se dice qué y se sale con 1.
+    """
+    malas = 0
+    for backend in ('procesos', 'hilos', 'asyncio'):
+        for selectivo in (False, True):
+            for nombre, opciones in ESTRES.items():
+                monitor = puente.crear_monitor(backend, selectivo=selectivo, muestreable=True, **opciones)
+                dentro, cuenta, fallos, muestras = [0, 0, 0], [0, 0], [], [0]
+                parar = threading.Event()
+                vigia = Thread(target=vigilar, args=(monitor.estado, parar, fallos, muestras))
+                vigia.start()
+                t0 = time.perf_counter()
+                if backend == 'asyncio':
+                    #a los bloqueados no se les cancela: el monitor no suelta el mutex si se cancela a quien lo tiene,
+                    #y cerrar el bucle (que cancela lo pendiente) se quedaría esperando. Se deja el bucle sin cerrar.
+                    bucle = asyncio.new_event_loop()
+                    tareas = [bucle.create_task(agente_estres_asincrono(monitor, i, n, dentro, cuenta, fallos))
+                              for i in range(nagentes)]
+                    hechas, bloqueadas = bucle.run_until_complete(asyncio.wait(tareas, timeout=LIMITE))
+                    fallos.extend(f"excepcion {t.exception()!r}" for t in hechas if t.exception() is not None)
+                    if bloqueadas:
+                        fallos.append(f"{len(bloqueadas)} agentes bloqueados pasados {LIMITE}s")
+                    else:
+                        bucle.close()
+                else:
+                    lock = threading.Lock()
+                    hilos = [Thread(target=agente_estres, args=(monitor, i, n, dentro, lock, cuenta, fallos), daemon=True)
+                             for i in range(nagentes)]
+                    for h in hilos:
+                        h.start()
+                    fin = time.perf_counter() + LIMITE
+                    for h in hilos:
+                        h.join(max(0, fin - time.perf_counter()))
+                    bloqueados = sum(h.is_alive() for h in hilos)
+                    if bloqueados:
+                        fallos.append(f"{bloqueados} agentes bloqueados pasados {LIMITE}s")
+                t = time.perf_counter() - t0
+                parar.set()
+                vigia.join()
+                revisar(monitor.estado, fallos)
+                restos = {i: monitor.estado[i] for i in FINALES if monitor.estado[i]}
+                if restos:
+                    fallos.append(f"contadores que no han vuelto a 0 {restos}")
+                malas += bool(fallos)
+                print(f"{backend:9} {'selectivo' if selectivo else 'notify_all':10} {nombre:18} {t:6.2f}s  "
+                      f"entran {cuenta[0]:5}  se van {cuenta[1]:5}  muestras {muestras[0]:6}  "
+                      f"{'OK' if not fallos else 'FALLA: ' + '; '.join(sorted(set(fallos))[:5])}", flush=True)
+    if malas:
+        print(f"{malas} combinaciones con fallos")
+        sys.exit(1)
+
+
+def version() -> str:
+    """Commit actual, para poder comparar los resultados entre commits (None si no estamos en un repositorio git)."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(fichero: str = 'benchmark.json', semilla: int = 0) -> None:
+    resultados = {}
+    for nombre_carga, carga in CARGAS.items():
+        llegadas = calendario(carga, semilla)
+        resultados[nombre_carga] = {}
+        for nombre_monitor, crear in MONITORES.items():
+            registros, completa = ejecutar(crear(), llegadas)
+            r = metricas(registros)
+            r['completa'] = completa
+            resultados[nombre_carga][nombre_monitor] = r
+            p99 = ' '.join(f"{NOMBRES[c]}={r['espera'][NOMBRES[c]]['p99'] * 1000:.1f}ms" for c in NOMBRES) if registros else ''
+            print(f"{nombre_carga:17} {nombre_monitor:16} {r.get('cruces_por_segundo', 0):8.1f} cruces/s  "
+                  f"ocupacion {r.get('ocupacion', 0):.2f}  cambios {r.get('cambios_de_sentido', 0):4}  p99 {p99}"
+                  f"{'' if completa else '  BLOQUEADO'}")
+    with open(fichero, 'w') as f:
+        cargas = {nombre: {NOMBRES[c]: v for c, v in carga.items()} for nombre, carga in CARGAS.items()}
+        json.dump({'commit': version(), 'semilla': semilla, 'escala': ESCALA, 'cargas': cargas,
+                   'resultados': resultados}, f, indent=2)
+    print(f"resultados en {fichero}")
+
+
+PRUEBAS = {
+    'arranque': arranque,
+    'prefork': prefork,
+    'monitor': monitor,
+    'despertares': despertares,
+    'instrumentacion': instrumentacion,
+    'backends': backends,
+    'servicio': servicio,
+    'pelotones': pelotones,
+    'cotas': cotas,
+    'descartes': descartes,
+    'estres': estres,
+    'registro': registro,
+    'comparar': comparar,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in PRUEBAS:
+        print(__doc__)
+        sys.exit(1)
+    PRUEBAS[sys.argv[1]](*(int(a) if a.isdigit() else a for a in sys.argv[2:]))
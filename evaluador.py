@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Evaluador vectorizado (numpy) de las políticas de admisión del puente, para muchos escenarios a la vez.
+
+Hace lo mismo que simulacion.py (mismas reglas: puerta de prioridad esperan*, luego entra el grupo con más gente
+esperando entre los que pueden), pero con todos los escenarios avanzando a la vez, paso a paso, sobre arrays:
+el estado de cada escenario son unos cuantos contadores por clase (cuántos han llegado, cuántos han entrado,
+cuántos han pasado la puerta de prioridad), quién tiene el puente y cuándo se vacía. Los agentes de una clase
+entran en orden de llegada, así que no hace falta ningún objeto por agente.
+
+Políticas: 'cotas' (Monitor de practicaParalela_2.py, con las cotas de cada escenario) y 'simple'
+(practicaParalela_con_inanicion.py, sin prioridades).
+
+Uso: python evaluador.py [NESCENARIOS] [SEMILLA]     evalúa escenarios al azar y escribe los mejores
+     python evaluador.py comprobar [SEMILLA]         compara con simulacion.py con las mismas llegadas
+
+@author: alvarocamarafernandez
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import practicaParalela_2 as puente
+from practicaParalela_2 import NORTH, SOUTH, PEDESTRIAN
+from metricas import NOMBRES
+
+CLASES = (NORTH, SOUTH, PEDESTRIAN)
+FACTORES = np.array([puente.FACTOR_COCHES, puente.FACTOR_COCHES, puente.FACTOR_PEATONES])
+
+
+def escenarios(nescenarios: int, ncoches: int = puente.NCARS, npeatones: int = puente.NPED, tiempos = None,
+               semilla: int = None) -> tuple:
+    """
+    Llegadas y duraciones de nescenarios escenarios, sorteadas de una vez: arrays (escenario, clase, agente).
+    Como en los generadores, la primera llegada de cada clase es en t=0 y luego los tiempos entre llegadas son
+    exponenciales de media tiempos (norte, sur, peatones), que puede ser un array (nescenarios, 3).
+    Las clases con menos agentes se rellenan con llegadas en infinito.
+    """
+    rnd = np.random.default_rng(semilla)
+    if tiempos is None:
+        tiempos = (puente.TIME_CARS_NORTH, puente.TIME_CARS_SOUTH, puente.TIME_PED)
+    tiempos = np.broadcast_to(np.asarray(tiempos, dtype=float), (nescenarios, 3))
+    n = max(ncoches, npeatones)
+    huecos = rnd.exponential(1.0, (nescenarios, 3, n)) * tiempos[:, :, None]
+    huecos[:, :, 0] = 0.0
+    llegada = np.cumsum(huecos, axis=2)
+    llegada[:, :2, ncoches:] = np.inf
+    llegada[:, 2, npeatones:] = np.inf
+    duracion = rnd.random((nescenarios, 3, n)) * FACTORES[None, :, None]
+    return llegada, duracion
+
+
+def desde_llegadas(llegadas) -> tuple:
+    """Arrays (1, clase, agente) de un solo escenario a partir de una lista de (t, clase, duracion), p. ej. una traza."""
+    por_clase = [[(t, d) for t, c, d in llegadas if c == clase] for clase in CLASES]
+    n = max(len(p) for p in por_clase)
+    llegada = np.full((1, 3, n), np.inf)
+    duracion = np.zeros((1, 3, n))
+    for clase, p in zip(CLASES, por_clase):
+        if p:
+            llegada[0, clase, :len(p)], duracion[0, clase, :len(p)] = zip(*p)
+    return llegada, duracion
+
+
+def prioridades(esperando: np.ndarray, cotas: np.ndarray) -> np.ndarray:
+    """Los predicados esperando* del Monitor para todos los escenarios: (escenario, clase) -> bool."""
+    sobre = esperando > cotas
+    return sobre | ~(sobre.sum(axis=1, keepdims=True) - sobre).astype(bool)
+
+
+def evaluar(llegada: np.ndarray, duracion: np.ndarray, politica: str = 'cotas', cotas = None) -> np.ndarray:
+    """
+    Devuelve el instante de entrada de cada agente, con la misma forma que llegada (infinito en el relleno).
+    En cada paso, cada escenario o admite a un agente o avanza hasta el siguiente suceso (una llegada o que el
+    puente se vacíe; las salidas intermedias no cambian ningún predicado). cotas es (norte, sur, peatones)
+    o un array (nescenarios, 3); por defecto, las COTA_* de practicaParalela_2.py.
+    """
+    nescenarios, _, n = llegada.shape
+    if cotas is None:
+        cotas = (puente.COTA_COCHES_NORTE, puente.COTA_COCHES_SUR, puente.COTA_PEATONES)
+    cotas = np.broadcast_to(np.asarray(cotas), (nescenarios, 3))
+    filas = np.arange(nescenarios)
+    clases = np.arange(3)
+
+    llegados = np.zeros((nescenarios, 3), dtype=np.int64)
+    admitidos = np.zeros((nescenarios, 3), dtype=np.int64)
+    pasados = np.zeros((nescenarios, 3), dtype=np.int64)   #los que ya han pasado la puerta de prioridad (esperan*)
+    dueno = np.full(nescenarios, -1)                        #clase que está en el puente (-1 si está vacío)
+    fin = np.full(nescenarios, -np.inf)                     #cuándo sale el último de los que están dentro
+    t = np.zeros(nescenarios)
+    entrada = np.full(llegada.shape, np.inf)
+    activos = np.ones(nescenarios, dtype=bool)
+
+    while activos.any():
+        esperando = llegados - admitidos
+        if politica == 'cotas':
+            pasados = np.where(prioridades(esperando, cotas), esperando, pasados)
+        else:
+            pasados = esperando
+        candidatos = (pasados > 0) & ((dueno[:, None] == -1) | (dueno[:, None] == clases))
+        elegida = np.argmax(np.where(candidatos, esperando, -1), axis=1)   #a igualdad, norte, sur, peatones
+        admite = candidatos.any(axis=1) & activos
+
+        #los que pueden, admiten a uno de la clase elegida
+        s, c = filas[admite], elegida[admite]
+        i = admitidos[s, c]
+        entrada[s, c, i] = t[s]
+        fin[s] = np.where(dueno[s] == c, np.maximum(fin[s], t[s] + duracion[s, c, i]), t[s] + duracion[s, c, i])
+        dueno[s] = c
+        admitidos[s, c] += 1
+        pasados[s, c] -= 1
+
+        #los demás avanzan hasta el siguiente suceso
+        avanza = ~admite & activos
+        s = filas[avanza]
+        proxima = np.take_along_axis(llegada[s], np.minimum(llegados[s], n - 1)[:, :, None], axis=2)[:, :, 0]
+        proxima[llegados[s] >= n] = np.inf
+        clase_proxima = np.argmin(proxima, axis=1)
+        t_llegada = proxima[np.arange(len(s)), clase_proxima]
+        t_vacio = np.where(dueno[s] >= 0, fin[s], np.inf)
+        vacia = (dueno[s] >= 0) & (t_vacio <= t_llegada)
+        llega = ~vacia & np.isfinite(t_llegada)
+        t[s] = np.where(vacia, t_vacio, np.where(llega, t_llegada, t[s]))
+        dueno[s[vacia]] = -1
+        llegados[s[llega], clase_proxima[llega]] += 1
+        activos[s[~vacia & ~llega]] = False             #ni llega nadie ni hay nadie en el puente: terminado
+    return entrada
+
+
+def resumen(llegada: np.ndarray, duracion: np.ndarray, entrada: np.ndarray, ncoches: int, npeatones: int) -> dict:
+    """Métricas de cada escenario, como arrays: cruces por segundo, espera media, p99 y máxima por clase, y equidad."""
+    validos = np.isfinite(llegada)
+    salida = np.where(validos, entrada + duracion, -np.inf).max(axis=(1, 2))
+    cruces = validos.sum(axis=(1, 2))
+    espera = np.where(validos, entrada - np.where(validos, llegada, 0.0), 0.0)
+    resultado = {'cruces_por_segundo': cruces / salida}
+    medias = []
+    for clase, n in ((NORTH, ncoches), (SOUTH, ncoches), (PEDESTRIAN, npeatones)):
+        e = espera[:, clase, :n]
+        medias.append(e.mean(axis=1) if n else np.zeros(len(e)))
+        resultado[f'espera_{NOMBRES[clase]}_media'] = medias[-1]
+        resultado[f'espera_{NOMBRES[clase]}_p99'] = np.percentile(e, 99, axis=1, method='inverted_cdf') if n else medias[-1]
+        resultado[f'espera_{NOMBRES[clase]}_max'] = e.max(axis=1) if n else medias[-1]
+    medias = np.array([m for m, n in zip(medias, (ncoches, ncoches, npeatones)) if n]).T
+    cuadrados = (medias ** 2).sum(axis=1)
+    resultado['equidad'] = np.where(cuadrados > 0, medias.sum(axis=1) ** 2 / (medias.shape[1] * np.where(cuadrados > 0, cuadrados, 1)), 1.0)
+    return resultado
+
+
+def comprobar(semilla: int = 0) -> None:
+    """Las mismas llegadas (las de los generadores con esa semilla) en simulacion.py y aquí: las esperas deben coincidir."""
+    import simulacion
+    import trazas
+    llegadas = list(trazas.desde_generadores(puente.NCARS, puente.NPED, semilla))
+    llegada, duracion = desde_llegadas(llegadas)
+    for politica, monitor in (('cotas', simulacion.MonitorVirtual()), ('simple', simulacion.MonitorVirtualSimple())):
+        entrada = evaluar(llegada, duracion, politica)
+        registros = simulacion.registros(semilla=semilla, monitor=monitor)
+        diferencia = 0.0
+        for clase in CLASES:
+            esperas_sim = sorted(e - l for c, l, e, _ in registros if c == clase)
+            n = len(esperas_sim)
+            esperas = np.sort(entrada[0, clase, :n] - llegada[0, clase, :n])
+            diferencia = max(diferencia, float(np.abs(esperas - esperas_sim).max()) if n else 0.0)
+        print(f"{politica}: diferencia máxima en las esperas con simulacion.py {diferencia:.2e}s")
+
+
+def main(nescenarios: int = 10000, semilla: int = 0) -> None:
+    rnd = np.random.default_rng(semilla)
+    cotas = rnd.integers(1, 13, (nescenarios, 3))
+    tiempos = rnd.choice([0.1, 0.5, 1.0], (nescenarios, 3)) * np.array([1, 1, 10])
+    llegada, duracion = escenarios(nescenarios, puente.NCARS, puente.NPED, tiempos, semilla)
+    for politica in ('simple', 'cotas'):
+        t0 = time.perf_counter()
+        entrada = evaluar(llegada, duracion, politica, cotas)
+        real = time.perf_counter() - t0
+        r = resumen(llegada, duracion, entrada, puente.NCARS, puente.NPED)
+        peor = np.max([r[f'espera_{nombre}_p99'] for nombre in NOMBRES.values()], axis=0)
+        print(f"{politica}: {nescenarios} escenarios en {real:.2f}s ({nescenarios / real:.0f} escenarios/s), "
+              f"p99 de la peor clase: mediana {np.median(peor):.3f}s, máximo {peor.max():.3f}s")
+    mejores = np.argsort(peor)[:5]
+    for i in mejores:
+        print(f"  cotas {tuple(cotas[i].tolist())} tiempos {tuple(tiempos[i].tolist())}: p99 peor clase {peor[i]:.3f}s, "
+              f"{r['cruces_por_segundo'][i]:.2f} cruces/s, equidad {r['equidad'][i]:.2f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'comprobar':
+        comprobar(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    else:
+        main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Métricas de una ejecución del puente a partir de lo que ha hecho cada agente.
+
+Cada registro es una tupla (clase, llegada, entrada, salida) con los instantes en segundos, sean reales
+(benchmark.py) o virtuales (simulacion.py). La clase es NORTH, SOUTH o PEDESTRIAN.
+
+@author: alvarocamarafernandez
+"""
+
+import math
+
+from practicaParalela_2 import NORTH, SOUTH, PEDESTRIAN
+
+NOMBRES = {NORTH: 'norte', SOUTH: 'sur', PEDESTRIAN: 'peatones'}
+
+
+def percentil(ordenados: list, p: float) -> float:
+    """Percentil p (de 0 a 100) por el método del rango más cercano; la lista tiene que venir ordenada."""
+    if not ordenados:
+        return 0.0
+    k = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[k]
+
+
+def esperas(registros: list) -> dict:
+    """p50, p95, p99 y máximo del tiempo de espera (entrada - llegada) de cada clase."""
+    resultado = {}
+    for clase, nombre in NOMBRES.items():
+        valores = sorted(entrada - llegada for c, llegada, entrada, _ in registros if c == clase)
+        resultado[nombre] = {
+            'n': len(valores),
+            'p50': percentil(valores, 50),
+            'p95': percentil(valores, 95),
+            'p99': percentil(valores, 99),
+            'max': valores[-1] if valores else 0.0,
+        }
+    return resultado
+
+
+def ocupacion(registros: list) -> float:
+    """Tiempo con alguien en el puente (unión de los intervalos [entrada, salida]) entre el tiempo total."""
+    if not registros:
+        return 0.0
+    intervalos = sorted((entrada, salida) for _, _, entrada, salida in registros)
+    ocupado = 0.0
+    inicio, fin = intervalos[0]
+    for a, b in intervalos[1:]:
+        if a > fin:
+            ocupado += fin - inicio
+            inicio, fin = a, b
+        else:
+            fin = max(fin, b)
+    ocupado += fin - inicio
+    total = max(r[3] for r in registros) - min(r[1] for r in registros)
+    return ocupado / total if total > 0 else 1.0
+
+
+def cambios(registros: list) -> int:
+    """Cuántas veces cambia el grupo que está usando el puente (en orden de entrada)."""
+    clases = [c for c, _, _, _ in sorted(registros, key=lambda r: r[2])]
+    return sum(1 for a, b in zip(clases, clases[1:]) if a != b)
+
+
+def equidad(registros: list) -> float:
+    """
+    Índice de Jain de la espera media de cada clase: 1 si todas las clases esperan lo mismo de media,
+    1/3 si solo espera una. Las clases sin registros no cuentan.
+    """
+    medias = []
+    for clase in NOMBRES:
+        valores = [entrada - llegada for c, llegada, entrada, _ in registros if c == clase]
+        if valores:
+            medias.append(sum(valores) / len(valores))
+    cuadrados = sum(m * m for m in medias)
+    return sum(medias) ** 2 / (len(medias) * cuadrados) if cuadrados > 0 else 1.0
+
+
+def metricas(registros: list) -> dict:
+    """Todas las métricas juntas, en un diccionario que se puede volcar a JSON."""
+    if not registros:
+        return {'cruces': 0}
+    total = max(r[3] for r in registros) - min(r[1] for r in registros)
+    return {
+        'cruces': len(registros),
+        'duracion': total,
+        'cruces_por_segundo': len(registros) / total if total > 0 else 0.0,
+        'espera': esperas(registros),
+        'ocupacion': ocupacion(registros),
+        'cambios_de_sentido': cambios(registros),
+        'equidad': equidad(registros),
+    }
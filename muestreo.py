@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Muestreo periódico del estado del puente de Ambite, para ver cómo evoluciona durante una ejecución.
+
+Un Muestreador copia los contadores del monitor cada cierto intervalo sin coger su mutex, así que no retrasa
+a ningún coche ni peatón: el monitor tiene que ser muestreable (Monitor(muestreable=True)), y entonces estado[SECUENCIA]
+funciona como un seqlock. Se lee la secuencia, se copia el estado y se vuelve a leer la secuencia; si era impar
+(alguien estaba cambiando el estado) o ha cambiado entre medias, la copia puede estar a medias y se repite.
+
+Las muestras se van escribiendo en un CSV, una fila por muestra y una columna por contador (COLUMNAS),
+y analizar() saca de él la ocupación del puente, los huecos con el puente vacío en cada cambio de sentido
+y los percentiles de la cola de cada clase.
+
+Uso: python muestreo.py analizar FICHERO       resumen de un fichero de muestras
+     python muestreo.py ejecutar FICHERO [INTERVALO] [SEMILLA]
+                                                main() o main_pool() de practicaParalela_2.py (según MODO) muestreando
+
+@author: alvarocamarafernandez
+"""
+
+import sys
+import csv
+import time
+import threading
+from multiprocessing import Process, Event, Value
+
+import practicaParalela_2 as puente
+from practicaParalela_2 import NORTH, SOUTH, PEDESTRIAN, SECUENCIA
+from metricas import percentil, NOMBRES
+
+INTERVALO = 0.001                                           #segundos entre muestras
+BLOQUE = 1024                                               #muestras que se escriben de una vez
+CLASES = (NORTH, SOUTH, PEDESTRIAN)
+
+#columnas del fichero, después del instante: (nombre, índice en Monitor.estado)
+COLUMNAS = (('operaciones', puente.PATATA),
+            *((f'{NOMBRES[c]}_dentro', puente.DENTRO_CLASE[c]) for c in CLASES),
+            *((f'{NOMBRES[c]}_esperando', puente.ESPERANDO_CLASE[c]) for c in CLASES),
+            *((f'{NOMBRES[c]}_cota', puente.COTA_CLASE[c]) for c in CLASES),
+            *((f'{NOMBRES[c]}_caducados', puente.CADUCADOS_CLASE[c]) for c in CLASES),
+            *((f'{NOMBRES[c]}_rechazados', puente.RECHAZADOS_CLASE[c]) for c in CLASES),
+            ('fase', puente.FASE),
+            ('despertares', puente.DESPERTARES))
+
+
+def leer(estado) -> tuple:
+    """
+    Copia coherente del estado sin coger el mutex: (copia, intentos que no han valido).
+    Si quien tiene el mutex tarda, se cede la CPU en vez de insistir, para no quitársela a él.
+    """
+    fallos = 0
+    while True:
+        secuencia = estado[SECUENCIA]
+        if secuencia % 2 == 0:
+            copia = estado[:]
+            if estado[SECUENCIA] == secuencia:
+                return copia, fallos
+        fallos += 1
+        time.sleep(0)
+
+
+class Muestreador():
+    def __init__(self, monitor: puente.Monitor, fichero: str, intervalo: float = INTERVALO):
+        """
+        Como el volcado de registro.py: muestrea en un proceso aparte si el monitor es del backend 'procesos'
+        y en un hilo si no (con 'hilos' y 'asyncio' el estado no se ve desde otro proceso).
+        """
+        if not monitor.muestreable:
+            raise ValueError("el monitor no es muestreable: Monitor(muestreable=True)")
+        self.estado = monitor.estado
+        self.fichero = fichero
+        self.intervalo = intervalo
+        self.hilo = monitor.backend != 'procesos'
+        self.parar = threading.Event() if self.hilo else Event()
+        self.muestras = Value('Q', 0, lock=False)
+        self.fallos = Value('Q', 0, lock=False)             #lecturas repetidas porque el estado estaba cambiando
+        self.muestreador = None
+
+    def muestrear(self) -> None:
+        """
+        Una muestra cada intervalo hasta que se pide parar. Si se va con retraso no se recupera el tiempo perdido
+        con muestras seguidas: se sigue desde ahora.
+        """
+        t0 = siguiente = time.monotonic()
+        filas = []
+        with open(self.fichero, 'w', newline='') as f:
+            escritor = csv.writer(f)
+            escritor.writerow(['t'] + [nombre for nombre, _ in COLUMNAS])
+            while not self.parar.is_set():
+                copia, fallos = leer(self.estado)
+                ahora = time.monotonic()
+                filas.append([f'{ahora - t0:.6f}'] + [copia[i] for _, i in COLUMNAS])
+                self.muestras.value += 1
+                self.fallos.value += fallos
+                if len(filas) == BLOQUE:
+                    escritor.writerows(filas)
+                    filas.clear()
+                siguiente = max(siguiente + self.intervalo, ahora)
+                time.sleep(max(0.0, siguiente - time.monotonic()))
+            escritor.writerows(filas)
+
+    def empezar(self) -> None:
+        self.parar.clear()
+        Muestreo = threading.Thread if self.hilo else Process
+        self.muestreador = Muestreo(target=self.muestrear, daemon=True)
+        self.muestreador.start()
+
+    def terminar(self) -> tuple:
+        """Para el muestreo cuando ya está todo en el fichero; devuelve (muestras, lecturas repetidas)."""
+        self.parar.set()
+        self.muestreador.join()
+        return self.muestras.value, self.fallos.value
+
+
+def cargar(fichero: str) -> tuple:
+    """(instantes, {columna: valores}) de un fichero de muestras."""
+    with open(fichero, newline='') as f:
+        lector = csv.reader(f)
+        cabecera = next(lector)
+        columnas = list(zip(*([float(v) for v in fila] for fila in lector))) or [()] * len(cabecera)
+    valores = dict(zip(cabecera, columnas))
+    return valores.pop('t'), valores
+
+
+def analizar(fichero: str) -> dict:
+    """
+    Con cada muestra valiendo hasta la siguiente:
+        ocupacion        fracción del tiempo con alguien en el puente, en total y de cada clase
+        huecos           tiempo con el puente vacío entre la última muestra de una clase y la primera de otra
+                         (cambios de sentido, o de coches a peatones): número, p50, p99 y máximo
+        cola             p50, p90, p99 y máximo de los que esperan de cada clase, muestra a muestra
+    """
+    t, valores = cargar(fichero)
+    dentro = [valores[f'{NOMBRES[c]}_dentro'] for c in CLASES]
+    duraciones = [b - a for a, b in zip(t, t[1:])]
+    total = sum(duraciones)
+    ocupado = [0.0, 0.0, 0.0]
+    huecos = []
+    anterior, salida = None, None                           #última clase que estuvo en el puente y cuándo se la vio
+    for i, d in enumerate(duraciones):
+        clase = next((c for c in CLASES if dentro[c][i] > 0), None)
+        if clase is None:
+            continue
+        ocupado[clase] += d
+        if anterior is not None and clase != anterior:
+            huecos.append(t[i] - salida)
+        anterior, salida = clase, t[i + 1]
+    huecos.sort()
+    resultado = {'duracion': total, 'muestras': len(t),
+                 'ocupacion': sum(ocupado) / total if total else 0.0,
+                 'ocupacion_clase': {NOMBRES[c]: ocupado[c] / total if total else 0.0 for c in CLASES},
+                 'huecos': {'n': len(huecos), 'p50': percentil(huecos, 50), 'p99': percentil(huecos, 99),
+                            'max': huecos[-1] if huecos else 0.0},
+                 'cola': {}}
+    for c in CLASES:
+        cola = sorted(valores[f'{NOMBRES[c]}_esperando'])
+        resultado['cola'][NOMBRES[c]] = {'p50': percentil(cola, 50), 'p90': percentil(cola, 90),
+                                         'p99': percentil(cola, 99), 'max': cola[-1] if cola else 0}
+    return resultado
+
+
+def texto(resultado: dict) -> str:
+    lineas = [f"{resultado['muestras']} muestras en {resultado['duracion']:.2f}s",
+              f"ocupacion {resultado['ocupacion']:.2f} (" +
+              ', '.join(f"{nombre} {o:.2f}" for nombre, o in resultado['ocupacion_clase'].items()) + ")"]
+    h = resultado['huecos']
+    lineas.append(f"huecos en los cambios: {h['n']}, p50 {h['p50'] * 1e3:.1f}ms, p99 {h['p99'] * 1e3:.1f}ms, "
+                  f"max {h['max'] * 1e3:.1f}ms")
+    for nombre, cola in resultado['cola'].items():
+        lineas.append(f"cola {nombre}: p50 {cola['p50']:.0f}, p90 {cola['p90']:.0f}, p99 {cola['p99']:.0f}, "
+                      f"max {cola['max']:.0f}")
+    return '\n'.join(lineas)
+
+
+if __name__ == '__main__':
+    args = sys.argv[2:]
+    orden = sys.argv[1] if len(sys.argv) > 1 else None
+    if orden == 'analizar' and args:
+        print(texto(analizar(args[0])))
+    elif orden == 'ejecutar' and args:
+        puente.MUESTREO = args[0]
+        puente.INTERVALO_MUESTREO = float(args[1]) if len(args) > 1 else INTERVALO
+        semilla = int(args[2]) if len(args) > 2 else puente.SEMILLA
+        if puente.MODO == 'pool':
+            puente.main_pool(semilla=semilla)
+        else:
+            puente.main(semilla=semilla)
+        print(texto(analizar(args[0])), file=sys.stderr)
+    else:
+        print(__doc__)
+        sys.exit(1)
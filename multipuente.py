@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Muchos puentes independientes a la vez, como en una red de carreteras con muchos puentes de un solo carril.
+
+Cada puente tiene su propio Monitor y sus propias corrientes de llegadas (las de gen_cars / gen_pedestrian, con su
+propia semilla). Los puentes se reparten entre un número fijo de procesos: cada proceso lleva varios puentes, saca
+las llegadas de todos ellos de un único calendario y lanza cada coche o peatón como un hilo de ese proceso.
+Cada Monitor solo lo usan hilos de su proceso, así que es del backend 'hilos' (locks de threading).
+Así, con N puentes hay NPROCESOS procesos, en vez de 3N generadores y un proceso por vehículo.
+Al final se escriben las métricas de cada puente (metricas.py) y las de todos juntos.
+
+Uso: python multipuente.py [NPUENTES] [NPROCESOS] [SEMILLA] [ESCALA]
+
+    ESCALA multiplica todos los tiempos (llegadas y cruces): con 0.1 todo va 10 veces más rápido.
+
+@author: alvarocamarafernandez
+"""
+
+import os
+import sys
+import time
+import heapq
+from threading import Thread
+from multiprocessing import Pool
+
+import practicaParalela_2 as puente
+import simulacion
+from metricas import metricas, NOMBRES
+
+NPUENTES = 24
+NPROCESOS = os.cpu_count()
+ESCALA = 1.0
+
+
+def semilla_puente(semilla: int, p: int) -> int:
+    """Cada puente usa tres semillas seguidas (norte, sur y peatones), así que el puente p empieza en semilla + 3p."""
+    return None if semilla is None else semilla + 3 * p
+
+
+def grupo(trabajo: tuple) -> dict:
+    """
+    Lo que hace cada proceso: (puentes, semilla, escala) -> {puente: métricas}.
+    Las llegadas de todos sus puentes van en un montículo por tiempo, y se sortean en el mismo orden que en gen_cars
+    (primero la duración y luego el tiempo hasta la siguiente), así que cada puente ve lo mismo que main(semilla).
+    """
+    puentes, semilla, escala = trabajo
+    monitores = {p: puente.Monitor(backend='hilos', selectivo=puente.SELECTIVO) for p in puentes}
+    registros = {p: [] for p in puentes}
+    corrientes = {p: simulacion.llegadas(puente.NCARS, puente.NPED, semilla_puente(semilla, p)) for p in puentes}
+    pendientes = []                                         #montículo de (t, puente, clase, id)
+    for p in puentes:
+        for clase, n, _, _, _ in corrientes[p]:
+            if n > 0:
+                heapq.heappush(pendientes, (0.0, p, clase, 1))
+
+    hilos = []
+    t0 = time.perf_counter()
+    while pendientes:
+        t, p, clase, aid = heapq.heappop(pendientes)
+        _, n, media, factor, rnd = corrientes[p][clase]
+        duracion = rnd.random() * factor
+        if aid < n:
+            heapq.heappush(pendientes, (t + rnd.expovariate(1/media), p, clase, aid + 1))
+        espera = t0 + t * escala - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        h = Thread(target=puente.cruzar, args=(monitores[p], clase, duracion * escala, registros[p]))
+        h.start()
+        hilos.append(h)
+    for h in hilos:
+        h.join()
+    return {p: metricas(registros[p]) for p in puentes}
+
+
+def main(npuentes: int = NPUENTES, nprocesos: int = NPROCESOS, semilla: int = None, escala: float = ESCALA) -> dict:
+    """Ejecuta los npuentes repartidos entre nprocesos procesos y devuelve {puente: métricas}."""
+    nprocesos = min(nprocesos, npuentes)
+    trabajos = [(list(range(i, npuentes, nprocesos)), semilla, escala) for i in range(nprocesos)]
+    with Pool(nprocesos) as pool:
+        resultado = {}
+        for parte in pool.map(grupo, trabajos):
+            resultado.update(parte)
+    return dict(sorted(resultado.items()))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    npuentes = int(args[0]) if len(args) > 0 else NPUENTES
+    nprocesos = int(args[1]) if len(args) > 1 else NPROCESOS
+    semilla = int(args[2]) if len(args) > 2 else puente.SEMILLA
+    escala = float(args[3]) if len(args) > 3 else ESCALA
+
+    t0 = time.perf_counter()
+    resultado = main(npuentes, nprocesos, semilla, escala)
+    real = time.perf_counter() - t0
+    for p, r in resultado.items():
+        p99 = ' '.join(f"{nombre}={r['espera'][nombre]['p99']:.3f}s" for nombre in NOMBRES.values())
+        print(f"puente {p:3}: {r['cruces']} cruces, {r['cruces_por_segundo']:.2f} cruces/s, "
+              f"ocupacion {r['ocupacion']:.2f}, equidad {r['equidad']:.2f}, p99 {p99}")
+    cruces = sum(r['cruces'] for r in resultado.values())
+    peor = max(r['espera'][nombre]['p99'] for r in resultado.values() for nombre in NOMBRES.values())
+    print(f"{len(resultado)} puentes en {min(nprocesos, npuentes)} procesos: {cruces} cruces en {real:.2f}s "
+          f"({cruces / real:.0f} cruces/s reales), peor p99 {peor:.3f}s")
@@ -7,13 +7,20 @@ Solution to the one-way tunnel
 @author: alvarocamarafernandez
 """
 
+import sys
 import time
+import array
 import random
-from multiprocessing import Lock, Condition, Process
-from multiprocessing import Value
+import asyncio
+import threading
+from time import perf_counter_ns
+from threading import Thread
+from multiprocessing import Lock, Condition, Process, Queue, Semaphore
+from multiprocessing.sharedctypes import RawArray
 
 SOUTH = 1
 NORTH = 0
+PEDESTRIAN = 2 #clase de los peatones cuando hay que distinguirlos de los coches (medidas, simulacion)
 
 NCARS = 60
 NPED = 10
@@ -23,6 +30,19 @@ TIME_PED = 5 # a new pedestrian enters each 5s
 TIME_IN_BRIDGE_CARS = (1, 0.5) # normal 1s, 0.5s
 TIME_IN_BRIDGE_PEDESTRIAN = (30, 10) # normal 1s, 0.5s
 
+#modo de ejecucion: 'procesos' lanza un proceso por cada coche o peaton (como en la plantilla),
+#'pool' reparte los coches y peatones entre NWORKERS procesos fijos que atienden HILOS_POR_WORKER agentes a la vez cada uno.
+MODO = 'procesos'
+SEMILLA = None                                          #con una semilla fija se repiten las llegadas (ver main)
+REGISTRO = None                                         #fichero donde volcar los sucesos en binario (registro.py); con None se escriben por pantalla
+IMPRIMIR = True                                         #con REGISTRO, escribir también los sucesos por pantalla según se vuelcan
+MUESTREO = None                                         #fichero CSV donde guardar el estado del monitor cada INTERVALO_MUESTREO segundos (muestreo.py)
+INTERVALO_MUESTREO = 0.001
+NWORKERS = 4
+HILOS_POR_WORKER = 32
+#con PREFORK = True (fuera del modo pool) todos los coches y peatones se crean antes de empezar, y no según llegan (ver main_prefork)
+PREFORK = False
+
 #cotas: Estas cotas nos ayudarán a saber a quién tendremos que dar prioridad a la hora de dejar pasar a la gente.
 #por ejemplo, si tenemos 3 coches (o mas) en el norte esperando, hay que darles prioridad para que pasen puesto que se están acumulando demasiados.
 
@@ -30,236 +50,1216 @@ COTA_COCHES_NORTE = 3
 COTA_COCHES_SUR = 3
 COTA_PEATONES = 2
 
+#con COTAS = 'adaptativas' el monitor ajusta las cotas según las llegadas que va viendo (ver Monitor._ajustar_cota),
+#procurando que nadie espere mucho más de ESPERA_MAXIMA segundos; con None se usan las COTA_* de arriba.
+COTAS = None
+ESPERA_MAXIMA = 2.0
+COTA_MINIMA = 1
+COTA_MAXIMA = 64
+ALFA = 0.1                                              #peso de cada nueva muestra en las medias móviles de las cotas adaptativas
+
+#backend del Monitor, con el que se crean el mutex, las condiciones y los contadores: 'procesos' (multiprocessing, como en la
+#plantilla; los agentes son procesos), 'hilos' (threading, todo en un proceso) o 'asyncio' (los agentes son corrutinas: MonitorAsincrono).
+BACKEND = 'procesos'
+
+#con SELECTIVO = True el monitor solo despierta a los que pueden avanzar, en vez de hacer notify_all() (ver Monitor._avisar)
+SELECTIVO = False
+
+#admisión por pelotones (fases): None admite de uno en uno como siempre; un entero K da a cada clase fases de hasta K entradas,
+#y 'adaptativo' hace K igual a los que estén esperando cuando empieza la fase. Una fase dura como mucho FASE_MAXIMA segundos.
+PELOTON = None
+FASE_MAXIMA = 1.0
+
+#descartes: con PLAZO (segundos) quien no consigue entrar a tiempo se va sin cruzar, y con COLA_MAXIMA quien llega
+#y ya hay tantos de su clase esperando se va sin esperar. None es sin límite, como siempre.
+PLAZO = None
+COLA_MAXIMA = None
+
+#posiciones de cada contador dentro del array compartido del monitor (Monitor.estado).
+PATATA = 0
+NORTE_DENTRO = 1
+SUR_DENTRO = 2
+PEATONES_DENTRO = 3
+NORTE_ESPERANDO = 4
+SUR_ESPERANDO = 5
+PEATONES_ESPERANDO = 6
+#procesos dormidos en cada variable condicion (para saber a cuantos hay que despertar)
+BLOQ_ESPERAN_NORTE = 7
+BLOQ_ESPERAN_SUR = 8
+BLOQ_ESPERAN_PEATONES = 9
+BLOQ_PASAN_NORTE = 10
+BLOQ_PASAN_SUR = 11
+BLOQ_PASAN_PEATONES = 12
+#despertares totales y despertares inutiles (el proceso se despierta, su predicado sigue siendo falso y vuelve a dormir)
+DESPERTARES = 13
+DESPERTARES_INUTILES = 14
+#modo selectivo: procesos a los que ya se ha despertado para entrar en el puente y todavía no han vuelto a coger el mutex
+AVISADOS_NORTE = 15
+AVISADOS_SUR = 16
+AVISADOS_PEATONES = 17
+#modo selectivo: pases para saltarse esperan* que reparte quien despierta (ya ha comprobado el predicado por ellos)
+PASES_NORTE = 18
+PASES_SUR = 19
+PASES_PEATONES = 20
+#modo pelotones: clase que tiene la fase (SIN_FASE si ninguna), entradas en la fase y cuántas se permiten como mucho
+FASE = 21
+FASE_ADMITIDOS = 22
+FASE_LIMITE = 23
+COTA_ACTUAL_NORTE = 24                                  #las cotas van en el array para poder cambiarlas en marcha (cotas adaptativas)
+COTA_ACTUAL_SUR = 25
+COTA_ACTUAL_PEATONES = 26
+#descartes: los que se han ido por el plazo (caducados) o porque la cola estaba llena (rechazados)
+CADUCADOS_NORTE = 27
+CADUCADOS_SUR = 28
+CADUCADOS_PEATONES = 29
+RECHAZADOS_NORTE = 30
+RECHAZADOS_SUR = 31
+RECHAZADOS_PEATONES = 32
+CON_PLAZOS = 33                                         #1 desde que alguien espera con plazo (ver _avisar_fase)
+SECUENCIA = 34                                          #con muestreable=True: impar mientras alguien cambia el estado (muestreo.py)
+NCONTADORES = 35
+SIN_FASE = -1
+DENTRO_CLASE = (NORTE_DENTRO, SUR_DENTRO, PEATONES_DENTRO)             #los contadores de cada clase (NORTH, SOUTH, PEDESTRIAN)
+ESPERANDO_CLASE = (NORTE_ESPERANDO, SUR_ESPERANDO, PEATONES_ESPERANDO)
+COTA_CLASE = (COTA_ACTUAL_NORTE, COTA_ACTUAL_SUR, COTA_ACTUAL_PEATONES)
+CADUCADOS_CLASE = (CADUCADOS_NORTE, CADUCADOS_SUR, CADUCADOS_PEATONES)
+RECHAZADOS_CLASE = (RECHAZADOS_NORTE, RECHAZADOS_SUR, RECHAZADOS_PEATONES)
+
+#medias móviles de las cotas adaptativas, por clase (Monitor.estimadores, un bloque de NESTIMADORES por clase)
+ULTIMA_LLEGADA = 0                                      #instante (time.monotonic) de la última llegada
+INTERVALO = 1                                           #media del tiempo entre llegadas
+COLA = 2                                                #media de los que ya esperaban al llegar uno
+NESTIMADORES = 3
+
+#instrumentación (Monitor(instrumentar=True)): un histograma por clase y medida, en memoria compartida.
+#En las medidas de tiempo, la cubeta k cuenta los valores entre 2^(k-1) y 2^k microsegundos (la 0, los de menos de 1µs).
+ESPERA_PRIORIDAD = 0                                    #tiempo dormido en esperan*
+ESPERA_PASO = 1                                         #tiempo dormido en pasan*
+MUTEX_COGIDO = 2                                        #tiempo con el mutex cogido (sin contar lo dormido), 1 de cada MUESTREO_MUTEX operaciones
+DESPERTARES_ENTRADA = 3                                 #despertares por cada entrada (aquí la cubeta k es 'k despertares')
+MEDIDAS = ('espera_prioridad', 'espera_paso', 'mutex', 'despertares')
+NCUBETAS = 32
+MUESTREO_MUTEX = 16                                     #medir el mutex en todas las operaciones costaría más que la propia operación
+
+def ceros(tipo: str, n: int) -> array.array:
+    """Array de n ceros para los backends de un solo proceso (se puede usar como buffer, igual que un RawArray)."""
+    return array.array(tipo, [0]) * n
+
+def primitivas(backend: str) -> tuple:
+    """(Lock, Condition, contadores) de un backend; contadores(tipo, n) crea un array de n ceros."""
+    if backend == 'procesos':
+        return Lock, Condition, RawArray
+    if backend == 'hilos':
+        return threading.Lock, threading.Condition, ceros
+    if backend == 'asyncio':
+        return asyncio.Lock, asyncio.Condition, ceros
+    raise ValueError(f"backend desconocido: {backend}")
+
 class Monitor():
-    def __init__(self): #introducirmos aquí las variables que tenemos que inicializar.
+    def __init__(self, selectivo: bool = False, instrumentar: bool = False, cotas: tuple = None,
+                 peloton = None, fase_maxima: float = FASE_MAXIMA, backend: str = 'procesos',
+                 espera_maxima: float = ESPERA_MAXIMA, plazo: float = None, cola_maxima: int = None,
+                 muestreable: bool = False): #introducirmos aquí las variables que tenemos que inicializar.
         """
         Necesitamos meter un Lock() por la definicion de monitor. 
         Es decir, si varias operaciones de un mismo monitor son llamadas por un mismo proceso => este lock garantiza que no se ejecuten a la vez (hay exclusión mutua)
         Pero, sin embargo, si se llaman a operaciones de distintos monitores => las ejecuciones de estas operaciones pueden entremezclarse por ser distintos monitores.
         Cada vez que ejecutamos un método
+        
+        Todos los contadores van en un único array compartido sin lock propio (RawArray): solo se leen y escriben
+        con self.mutex cogido, así que un lock por contador (como el que trae cada Value) sería redundante.
+        
+        El backend (ver BACKEND) decide de qué tipo son el mutex, las condiciones y los arrays. Con 'hilos' el monitor
+        solo sirve dentro de un proceso, y 'asyncio' solo se puede usar con MonitorAsincrono.
+        
+        Con selectivo=True, en vez de hacer notify_all() sobre todas las condiciones que podrían verse afectadas,
+        solo se despierta a los procesos que de verdad pueden avanzar (ver _avisar y _ceder).
+        
+        cotas = (norte, sur, peatones) cambia las cotas de este monitor; por defecto, COTA_COCHES_NORTE, COTA_COCHES_SUR, COTA_PEATONES.
+        Con cotas='adaptativas' las cotas empiezan en esos valores y se ajustan en cada llegada (ver _ajustar_cota).
+        
+        Con peloton (ver PELOTON) se cambia la política de admisión por la de fases: ver _llegar_en_fase.
+        
+        Con plazo (segundos), wants_enter_* se rinde si no ha entrado a tiempo, y con cola_maxima no espera si ya hay
+        cola_maxima de su clase esperando: en los dos casos devuelve False sin haber entrado (ver descartes).
+        
+        Con muestreable=True el estado se puede leer desde fuera sin coger el mutex, como un seqlock: quien tiene el mutex
+        deja estado[SECUENCIA] impar mientras cambia el estado, y la vuelve a dejar par al soltarlo o al dormirse (muestreo.py).
+        
+        Con instrumentar=True se miden las esperas, el tiempo con el mutex cogido y los despertares (ver instantanea).
+        Los histogramas tampoco llevan lock: solo se tocan con self.mutex cogido.
         """
-        self.mutex = Lock() 
-        self.patata = Value('i', 0)
+        if backend == 'asyncio' and not isinstance(self, MonitorAsincrono):
+            raise ValueError("el backend 'asyncio' necesita MonitorAsincrono")
+        self.backend = backend
+        Cerrojo, Condicion, contadores = primitivas(backend)
+        self.mutex = Cerrojo() 
+        self.estado = contadores('i', NCONTADORES)              #estado[PATATA] es el contador de operaciones del monitor
+        self.selectivo = selectivo
+        self.adaptativas = cotas == 'adaptativas'
+        if cotas is None or self.adaptativas:
+            cotas = (COTA_COCHES_NORTE, COTA_COCHES_SUR, COTA_PEATONES)
+        self.estado[COTA_ACTUAL_NORTE], self.estado[COTA_ACTUAL_SUR], self.estado[COTA_ACTUAL_PEATONES] = cotas
+        self.esperaMaxima = espera_maxima
+        self.estimadores = contadores('d', 3 * NESTIMADORES) if self.adaptativas else None
+        self.plazo = plazo
+        self.colaMaxima = cola_maxima
+        self.muestreable = muestreable
+        self.epocas = contadores('i', BLOQ_PASAN_PEATONES - BLOQ_ESPERAN_NORTE + 1)   #avisos hechos en cada condición (ver _esperar)
+        self.peloton = peloton
+        self.faseMaxima = fase_maxima
+        self.inicioFase = contadores('d', 1)                    #instante (time.monotonic) en que empezó la fase
+        self.estado[FASE] = SIN_FASE
+        self.instrumentar = instrumentar
+        self.histogramas = contadores('q', 3 * len(MEDIDAS) * NCUBETAS) if instrumentar else None
+        self.sumas = contadores('q', 3 * len(MEDIDAS)) if instrumentar else None   #suma de los valores (para la media)
+        self.entradas = contadores('q', 3) if instrumentar else None                #entradas de cada clase
         
-        #inicializamos los coches en cada una de las direcciones y los peatones a 0 -> inicialmente no tenemos ni coches ni peatones.
-        self.cochesNorteDentro = Value('i', 0)                  #numero de coches provenientes del NORTE dentro del puente
-        self.cochesSurDentro = Value('i', 0)                    #numero de coches provenientes del SUR dentro del puente
-        self.peatonesDentro = Value('i', 0)                     #numero de peatones dentro del puente.
+        #inicialmente (el array empieza a 0) no tenemos ni coches ni peatones:
+        #estado[NORTE_DENTRO]       numero de coches provenientes del NORTE dentro del puente
+        #estado[SUR_DENTRO]         numero de coches provenientes del SUR dentro del puente
+        #estado[PEATONES_DENTRO]    numero de peatones dentro del puente.
         
         #inicializamos las variables condicion, que son una funcion del multiprocessing. Estas expresiones deben evaluarse como verdaderas o falsas.
-        self.pasanNorte = Condition(self.mutex)                 #condición que evalúa si pasan coches del Norte
-        self.pasanSur = Condition(self.mutex)                   #condición que evalúa si pasan coches del Sur
-        self.pasanPeatones = Condition(self.mutex)              #condición que evalúa si pasan peatones.
+        self.pasanNorte = Condicion(self.mutex)                 #condición que evalúa si pasan coches del Norte
+        self.pasanSur = Condicion(self.mutex)                   #condición que evalúa si pasan coches del Sur
+        self.pasanPeatones = Condicion(self.mutex)              #condición que evalúa si pasan peatones.
         
         #añadimos para evitar la inanición: pondremos una especie de 'cota' para que cuando haya demasiados esperando, se les de prioridad de algun modo
-        self.cochesNorteEsperando = Value('i', 0)               #numero de coches en el norte esperando para entrar
-        self.cochesSurEsperando = Value('i', 0)                 #numero de coches en el sur esperando para entrar
-        self.peatonesEsperando = Value('i', 0)                  #numero de peatones esperando para entrar
+        #estado[NORTE_ESPERANDO]    numero de coches en el norte esperando para entrar
+        #estado[SUR_ESPERANDO]      numero de coches en el sur esperando para entrar
+        #estado[PEATONES_ESPERANDO] numero de peatones esperando para entrar
         
             #Finalmente, añadimos sus correspondientes variables de condicion y, analogamente, deben evaluarse como verdaderas o falsas.
-        self.esperanNorte = Condition(self.mutex)               #para saber si los coches del norte podrían pasar o todavia no (indica, en cierto modo, la prioridad)
-        self.esperanSur = Condition(self.mutex)                 #para saber si los coches del sur podrían pasar o todavia no
-        self.esperanPeatones = Condition(self.mutex)            #para saber si los peatones podrían pasar o todavia no
+        self.esperanNorte = Condicion(self.mutex)               #para saber si los coches del norte podrían pasar o todavia no (indica, en cierto modo, la prioridad)
+        self.esperanSur = Condicion(self.mutex)                 #para saber si los coches del sur podrían pasar o todavia no
+        self.esperanPeatones = Condicion(self.mutex)            #para saber si los peatones podrían pasar o todavia no
+        
+        #argumentos de _esperar / _avisar para la condicion esperan* de cada grupo: (condicion, bloqueados, predicado, pases)
+        self.prioridadNorte = (self.esperanNorte, BLOQ_ESPERAN_NORTE, self.esperandoCochesNorte, PASES_NORTE)
+        self.prioridadSur = (self.esperanSur, BLOQ_ESPERAN_SUR, self.esperandoCochesSur, PASES_SUR)
+        self.prioridadPeatones = (self.esperanPeatones, BLOQ_ESPERAN_PEATONES, self.esperandoPeatones, PASES_PEATONES)
+        
+        #lo que necesita _ceder de cada grupo: (condicion pasan*, bloqueados, predicado, avisados, esperando)
+        self.norte = (self.pasanNorte, BLOQ_PASAN_NORTE, self.adelanteNorte, AVISADOS_NORTE, NORTE_ESPERANDO)
+        self.sur = (self.pasanSur, BLOQ_PASAN_SUR, self.adelanteSur, AVISADOS_SUR, SUR_ESPERANDO)
+        self.peatones = (self.pasanPeatones, BLOQ_PASAN_PEATONES, self.adelantePeatones, AVISADOS_PEATONES, PEATONES_ESPERANDO)
+        
+        #en el modo pelotones se espera en pasan* a que sea la fase de la clase: (condicion, bloqueados, predicado, avisados), por clase
+        self.fases = ((self.pasanNorte, BLOQ_PASAN_NORTE, self.faseNorte, AVISADOS_NORTE),
+                      (self.pasanSur, BLOQ_PASAN_SUR, self.faseSur, AVISADOS_SUR),
+                      (self.pasanPeatones, BLOQ_PASAN_PEATONES, self.fasePeatones, AVISADOS_PEATONES))
     
     #definimos los siguientes métodos para evaluar las variables condición. Siempre van a devolver un booleano.
     
+    #los AVISADOS_* solo son distintos de 0 en el modo selectivo: si ya se ha despertado a un grupo para que entre,
+    #los que llegan nuevos de otro grupo no se le pueden adelantar (si no, los despertados volverían a dormir para nada).
+    
     def adelanteNorte(self) ->bool:
-        return self.cochesSurDentro.value == 0 and self.peatonesDentro.value == 0
+        return self.estado[SUR_DENTRO] == 0 and self.estado[PEATONES_DENTRO] == 0 and \
+            self.estado[AVISADOS_SUR] == 0 and self.estado[AVISADOS_PEATONES] == 0
     
     def adelanteSur(self) -> bool:
-        return self.cochesNorteDentro.value == 0 and self.peatonesDentro.value == 0
+        return self.estado[NORTE_DENTRO] == 0 and self.estado[PEATONES_DENTRO] == 0 and \
+            self.estado[AVISADOS_NORTE] == 0 and self.estado[AVISADOS_PEATONES] == 0
     
     def adelantePeatones(self) -> bool:
-        return self.cochesNorteDentro.value == 0 and self.cochesSurDentro.value == 0
+        return self.estado[NORTE_DENTRO] == 0 and self.estado[SUR_DENTRO] == 0 and \
+            self.estado[AVISADOS_NORTE] == 0 and self.estado[AVISADOS_SUR] == 0
+    
+    #un grupo que ya ha superado su propia cota tiene prioridad, aunque los otros también la hayan superado:
+    #si no, con coches del norte y del sur por encima de la cota a la vez, cada grupo esperaría al otro para siempre (deadlock).
     
     def esperandoCochesNorte(self) ->bool:
-        return self.cochesSurEsperando.value <= COTA_COCHES_SUR and self.peatonesEsperando.value <= COTA_PEATONES
+        return self.estado[NORTE_ESPERANDO] > self.estado[COTA_ACTUAL_NORTE] or \
+            (self.estado[SUR_ESPERANDO] <= self.estado[COTA_ACTUAL_SUR] and self.estado[PEATONES_ESPERANDO] <= self.estado[COTA_ACTUAL_PEATONES])
     
     def esperandoCochesSur(self) -> bool:
-        return self.cochesNorteEsperando.value <= COTA_COCHES_NORTE and self.peatonesEsperando.value <= COTA_PEATONES
+        return self.estado[SUR_ESPERANDO] > self.estado[COTA_ACTUAL_SUR] or \
+            (self.estado[NORTE_ESPERANDO] <= self.estado[COTA_ACTUAL_NORTE] and self.estado[PEATONES_ESPERANDO] <= self.estado[COTA_ACTUAL_PEATONES])
     
     def esperandoPeatones(self) -> bool:
-        return self.cochesNorteEsperando.value <= COTA_COCHES_NORTE and self.cochesSurEsperando.value <= COTA_COCHES_SUR
+        return self.estado[PEATONES_ESPERANDO] > self.estado[COTA_ACTUAL_PEATONES] or \
+            (self.estado[NORTE_ESPERANDO] <= self.estado[COTA_ACTUAL_NORTE] and self.estado[SUR_ESPERANDO] <= self.estado[COTA_ACTUAL_SUR])
+    
+    #modo pelotones: una clase puede entrar si tiene la fase y la fase no se ha agotado (K entradas, o FASE_MAXIMA segundos:
+    #el tiempo solo se mira al admitir a alguien, para que los predicados no cambien sin que nadie coja el mutex).
+    #Mientras ninguna otra clase espere, la fase no se agota: solo se corta un pelotón si hay alguien a quien ceder el puente.
+    
+    def _en_fase(self, clase: int) -> bool:
+        return self.estado[FASE] == clase and (not self._esperan_otros(clase) or not self._fase_agotada())
+    
+    def faseNorte(self) -> bool:
+        return self._en_fase(NORTH)
+    
+    def faseSur(self) -> bool:
+        return self._en_fase(SOUTH)
+    
+    def fasePeatones(self) -> bool:
+        return self._en_fase(PEDESTRIAN)
     
-    def wants_enter_car(self, direction: int) -> None: #esto indica que direccion es un entero y que no vamos a devolver nada
+    def _esperan_otros(self, clase: int) -> bool:
+        return any(self.estado[ESPERANDO_CLASE[c]] > 0 for c in (NORTH, SOUTH, PEDESTRIAN) if c != clase)
     
+    def _fase_agotada(self) -> bool:
+        return self.estado[FASE_ADMITIDOS] >= self.estado[FASE_LIMITE]
     
+    def _puente_vacio(self) -> bool:
+        return self.estado[NORTE_DENTRO] == 0 and self.estado[SUR_DENTRO] == 0 and self.estado[PEATONES_DENTRO] == 0
+    
+    def _esperar(self, condicion, bloqueados: int, predicado, avisados: int = None, pase: bool = False,
+                 limite: float = None):
         """
-        Método que nos dice cuándo un determinado coche va a querer entrar al puente. Se pondrá a esperar hasta que le toque pasar.
+        Hace lo mismo que condicion.wait_for(predicado), pero apuntando en estado[bloqueados] cuántos procesos
+        duermen en la condición y contando los despertares inútiles (al despertar el predicado sigue siendo falso).
+        Es un generador: no duerme él, sino que cada vez que hay que dormir hace yield (condicion, segundos como mucho,
+        o None sin plazo), y quien lo recorre (_recorrer, que es lo único que cambia con cada backend) espera en ella.
+        El contador de bloqueados lo pone a 0 quien despierta (_avisar), no el que se despierta.
+        Con pase=True, estado[avisados] son pases: si al despertar queda alguno, se gasta y se sigue sin mirar el predicado.
+        Solo se usa con esperan*, que marcan prioridades; la seguridad del puente la siguen dando pasan*.
+        Devuelve (cuántas veces se ha despertado, ns dormido); el tiempo solo se mide con instrumentación.
+        
+        Con limite (un instante de time.monotonic) se espera como mucho hasta entonces, y si no se puede seguir
+        se devuelve (None, ns dormido). El que se rinde tiene que saber si alguien le ha contado ya como despertado (al avisar
+        se pone bloqueados a 0 y se reparten los avisados entre todos): cada aviso suma uno a la época de la condición.
+        Si la época no ha cambiado, nadie le ha contado y se quita él de bloqueados; si ha cambiado, hace lo mismo
+        que cualquier despertado (gastar su avisado) antes de irse.
+        """
+        if predicado():
+            return 0, 0
+        desde = perf_counter_ns() if self.instrumentar else 0
+        veces = 0
+        while True:
+            self.estado[bloqueados] += 1
+            if self.muestreable:
+                self.estado[SECUENCIA] += 1             #mientras se duerme, otros cogen el mutex: la secuencia vuelve a ser par
+            if limite is None:
+                yield condicion, None
+            else:
+                epoca = self.epocas[bloqueados - BLOQ_ESPERAN_NORTE]
+                yield condicion, max(0.0, limite - time.monotonic())
+            if self.muestreable:
+                self.estado[SECUENCIA] += 1
+            if limite is not None:
+                if self.epocas[bloqueados - BLOQ_ESPERAN_NORTE] == epoca:     #nadie nos ha avisado: se ha acabado el plazo
+                    self.estado[bloqueados] -= 1
+                    if not predicado():
+                        return None, (perf_counter_ns() - desde if self.instrumentar else 0)
+                    break
+            veces += 1
+            self.estado[DESPERTARES] += 1
+            if avisados is not None and self.estado[avisados] > 0:
+                self.estado[avisados] -= 1
+                if pase:
+                    break
+            if predicado():
+                break
+            self.estado[DESPERTARES_INUTILES] += 1
+            if limite is not None and time.monotonic() >= limite:
+                return None, (perf_counter_ns() - desde if self.instrumentar else 0)
+        return veces, (perf_counter_ns() - desde if self.instrumentar else 0)
+    
+    def _esperar_turno(self, clase: int, prioridad: tuple, paso: tuple, limite: float = None):
+        """
+        Las dos esperas de una entrada (generador, como _esperar): primero la prioridad (esperan*) y luego el puente (pasan*).
+        En el modo pelotones no hay espera de prioridad (prioridad=None) y paso es la espera de la fase.
+        Con instrumentación apunta la entrada y, si ha tenido que dormir, cuánto ha durado cada espera y los despertares.
+        Devuelve (si puede entrar, tiempo total dormido en ns): no puede si se ha acabado el plazo (limite) antes.
+        El tiempo dormido se descuenta del tiempo con el mutex cogido, también si se ha rendido.
+        """
+        veces_prioridad, dormido_prioridad = 0, 0
+        if prioridad is not None:
+            veces_prioridad, dormido_prioridad = yield from self._esperar(*prioridad, pase=True, limite=limite)
+        if veces_prioridad is None:
+            return False, dormido_prioridad
+        veces_paso, dormido_paso = yield from self._esperar(*paso[:4], limite=limite)
+        if veces_paso is None:
+            return False, dormido_prioridad + dormido_paso
+        if not self.instrumentar:
+            return True, 0
+        self.entradas[clase] += 1                       #las entradas sin dormir van a la cubeta 0 (ver instantanea)
+        if veces_prioridad or veces_paso:
+            self._medir(clase, ESPERA_PRIORIDAD, dormido_prioridad)
+            self._medir(clase, ESPERA_PASO, dormido_paso)
+            self._medir(clase, DESPERTARES_ENTRADA, veces_prioridad + veces_paso)
+        return True, dormido_prioridad + dormido_paso
+    
+    def _medir(self, clase: int, medida: int, valor: int) -> None:
+        if medida == DESPERTARES_ENTRADA:
+            cubeta = min(valor, NCUBETAS - 1)
+        else:
+            cubeta = min((valor // 1000).bit_length(), NCUBETAS - 1)
+        i = clase * len(MEDIDAS) + medida
+        self.histogramas[i * NCUBETAS + cubeta] += 1
+        self.sumas[i] += valor
+    
+    def _coger(self) -> int:
+        """Coge el mutex; si a esta operación le toca medir el mutex, devuelve el instante en que se ha cogido (si no, 0)."""
+        self.mutex.acquire()
+        return self._cogido()
+    
+    def _cogido(self) -> int:
+        """Lo que hay que hacer nada más coger el mutex, con cualquier backend (ver _coger)."""
+        if self.muestreable:
+            self.estado[SECUENCIA] += 1                 #impar: el estado está cambiando
+        if self.instrumentar and self.estado[PATATA] % MUESTREO_MUTEX == 0:
+            return perf_counter_ns()
+        return 0
+    
+    def _soltar(self, clase: int, cogido: int, dormido: int = 0) -> None:
+        if cogido:
+            self._medir(clase, MUTEX_COGIDO, perf_counter_ns() - cogido - dormido)
+        if self.muestreable:
+            self.estado[SECUENCIA] += 1
+        self.mutex.release()
+    
+    def _avisar(self, condicion, bloqueados: int, predicado, avisados: int = None) -> None:
+        """
+        En el modo clásico se despierta a todos con notify_all(), como en la plantilla.
+        En el modo selectivo no se despierta a nadie si no hay nadie dormido o si su predicado es todavía falso.
+        Todos los que duermen en una misma condición comparten predicado, así que si uno puede avanzar, pueden todos.
+        """
+        if not self.selectivo:
+            condicion.notify_all()
+        elif self.estado[bloqueados] > 0 and predicado():
+            condicion.notify(self.estado[bloqueados])
+            if avisados is not None:
+                self.estado[avisados] += self.estado[bloqueados]
+        else:
+            return
+        if self.estado[bloqueados] > 0:                 #si no duerme nadie, no hay nada que apuntar
+            self.estado[bloqueados] = 0
+            self.epocas[bloqueados - BLOQ_ESPERAN_NORTE] += 1
+    
+    def _ceder(self, a: tuple, b: tuple) -> None:
+        """
+        Un grupo acaba de dejar el puente vacío y hay que avisar a los otros dos (a y b son self.norte, self.sur o self.peatones).
+        Como esos dos grupos no pueden estar a la vez en el puente, en el modo selectivo solo se despierta a uno:
+        el que tenga más gente esperando entre los que tienen a alguien dormido en su condición pasan*.
+        """
+        if not self.selectivo:
+            self._avisar(*a[:4])
+            self._avisar(*b[:4])
+            return
+        if self.estado[b[1]] > 0 and (self.estado[a[1]] == 0 or self.estado[b[4]] > self.estado[a[4]]):
+            a, b = b, a
+        if self.estado[a[1]] > 0 and a[2]():
+            self._avisar(*a[:4])
+        else:                                                   #si nadie de 'a' está dormido en pasan*, probamos con 'b'
+            self._avisar(*b[:4])
+    
+    def _turno(self) -> None:
+        """
+        El puente está vacío y la fase actual ya no sirve: la fase pasa a la siguiente clase (norte, sur, peatones,
+        en rueda) que tenga a alguien esperando, y se la despierta. Si no espera nadie, no hay fase.
+        Como las fases van en rueda y cada una se agota, nadie espera más de dos fases ajenas por cada pelotón propio.
+        """
+        actual = self.estado[FASE]
+        for i in (1, 2, 3):
+            clase = (actual + i) % 3
+            esperando = self.estado[ESPERANDO_CLASE[clase]]
+            if esperando > 0:
+                self.estado[FASE] = clase
+                self.estado[FASE_ADMITIDOS] = 0
+                self.estado[FASE_LIMITE] = esperando if self.peloton == 'adaptativo' else self.peloton
+                self.inicioFase[0] = time.monotonic()
+                self._avisar_fase(clase)
+                return
+        self.estado[FASE] = SIN_FASE
+    
+    def _avisar_fase(self, clase: int) -> None:
+        """
+        Despierta a los de la clase que tiene la fase. En el modo selectivo, si la fase se puede agotar, solo a los que
+        todavía caben en el pelotón (descontando los ya avisados que no han entrado): si se despertase a todos, la mayoría
+        volvería a dormir. Cada vez que entra uno se vuelve a llamar, por si ahora caben más.
+        Desde que alguien espera con plazo (CON_PLAZOS) se despierta siempre a todos: el que se rinde tiene que poder
+        saber por la época si le han contado como despertado (ver _esperar), y con avisos a unos pocos no podría.
+        """
+        condicion, bloqueados, predicado, avisados = self.fases[clase]
+        if not self.selectivo:
+            condicion.notify_all()
+            self.estado[bloqueados] = 0
+            self.epocas[bloqueados - BLOQ_ESPERAN_NORTE] += 1
+            return
+        if not predicado():
+            return
+        n = self.estado[bloqueados]
+        if self._esperan_otros(clase) and not self.estado[CON_PLAZOS]:
+            n = min(n, self.estado[FASE_LIMITE] - self.estado[FASE_ADMITIDOS] - self.estado[avisados])
+        if n > 0:
+            condicion.notify(n)
+            self.estado[bloqueados] -= n
+            self.estado[avisados] += n
+            self.epocas[bloqueados - BLOQ_ESPERAN_NORTE] += 1
+    
+    def _llegar_en_fase(self, clase: int) -> tuple:
+        """
+        Llegada en el modo pelotones (con el mutex cogido). En vez de las cotas, el puente se reparte por fases:
+        la clase que tiene la fase entra hasta agotarla y, cuando el puente se vacía, la fase pasa a la siguiente (_turno).
+        """
+        self.estado[ESPERANDO_CLASE[clase]] += 1
+        if self._puente_vacio():
+            self._cambiar_fase()                            #nadie va a salir del puente para cambiar la fase: se mira aquí
+        return None, self.fases[clase]
+    
+    def _entrar_en_fase(self, clase: int) -> None:
+        self.estado[DENTRO_CLASE[clase]] += 1
+        self.estado[ESPERANDO_CLASE[clase]] -= 1
+        self.estado[FASE_ADMITIDOS] += 1
+        if time.monotonic() - self.inicioFase[0] > self.faseMaxima:
+            self.estado[FASE_LIMITE] = min(self.estado[FASE_LIMITE], self.estado[FASE_ADMITIDOS])
+        if self.selectivo and self.estado[self.fases[clase][1]] > 0:
+            self._avisar_fase(clase)
+    
+    def _salir_de_fase(self, clase: int) -> None:
+        self.estado[DENTRO_CLASE[clase]] -= 1
+        if self._puente_vacio():
+            self._cambiar_fase()
+    
+    def _cambiar_fase(self) -> None:
+        """Con el puente vacío, se pasa la fase a otra clase si la que la tiene ya no va a entrar nadie más."""
+        fase = self.estado[FASE]
+        if fase == SIN_FASE or self.estado[ESPERANDO_CLASE[fase]] == 0 or not self._en_fase(fase):
+            self._turno()
+    
+    def _ajustar_cota(self, clase: int) -> None:
+        """
+        Cotas adaptativas: al llegar uno de la clase (ya contado en *_ESPERANDO) se actualizan dos medias móviles
+        (peso ALFA), la del tiempo entre llegadas y la de cuántos esperaban ya, y con ellas la cota de la clase:
+        
+            cota = ESPERA_MAXIMA / intervalo medio - cola media
+        
+        Si hay más de ESPERA_MAXIMA / intervalo esperando, el primero de la cola lleva ya unos ESPERA_MAXIMA segundos
+        esperando, así que la clase tiene que tener prioridad antes. Se le resta la cola normal de la clase porque esos
+        ya tienen por delante su propia espera. Con mucho tráfico las cotas suben y el puente cambia menos de sentido
+        (más cruces por segundo); con poco, bajan y se cede antes. La cota queda entre COTA_MINIMA y COTA_MAXIMA.
+        Si la cota cambia, cambian los predicados esperando* de todos, así que se avisa a las tres condiciones esperan*.
+        """
+        i = clase * NESTIMADORES
+        e = self.estimadores
+        ultima, media, cola = e[i:i + NESTIMADORES]     #una sola lectura del array compartido
+        ahora = time.monotonic()
+        if ultima > 0:
+            media = ahora - ultima if media == 0 else media + ALFA * (ahora - ultima - media)
+        cola += ALFA * (self.estado[ESPERANDO_CLASE[clase]] - 1 - cola)
+        e[i + ULTIMA_LLEGADA], e[i + INTERVALO], e[i + COLA] = ahora, media, cola
+        if media <= 0:                                  #aún no hay dos llegadas (o todas han llegado a la vez)
+            return
+        cota = min(max(int(self.esperaMaxima / media - cola), COTA_MINIMA), COTA_MAXIMA)
+        if cota != self.estado[COTA_CLASE[clase]]:
+            self.estado[COTA_CLASE[clase]] = cota
+            self._avisar(*self.prioridadNorte)
+            self._avisar(*self.prioridadSur)
+            self._avisar(*self.prioridadPeatones)
+    
+    #Descartes: antes de _llegar se mira si la cola está llena (_rechazar), y si se acaba el plazo esperando, _abandonar
+    #deshace lo que hizo _llegar en vez de _entrar.
+    
+    def _rechazar(self, clase: int) -> bool:
+        if self.estado[ESPERANDO_CLASE[clase]] < self.colaMaxima:
+            return False
+        self.estado[RECHAZADOS_CLASE[clase]] += 1
+        return True
+    
+    def _limite(self, plazo: float) -> float:
+        """Instante (time.monotonic) en que se acaba el plazo de una entrada, o None si no tiene."""
+        if plazo is None:
+            plazo = self.plazo
+            if plazo is None:
+                return None
+        self.estado[CON_PLAZOS] = 1
+        return time.monotonic() + plazo
+    
+    def _abandonar(self, clase: int) -> None:
+        """
+        Un coche o peatón se va sin entrar porque se le ha acabado el plazo: deja de contar como esperando.
+        Con uno menos esperando pueden cambiar los predicados de los demás (esperando* con cotas; _en_fase y el cambio
+        de fase con pelotones, que miran si esperan otros), así que se avisa a quien pueda avanzar ahora.
+        """
+        self.estado[ESPERANDO_CLASE[clase]] -= 1
+        self.estado[CADUCADOS_CLASE[clase]] += 1
+        if self.peloton is not None:
+            if self._puente_vacio():
+                self._cambiar_fase()
+            if self.estado[FASE] != SIN_FASE:
+                self._avisar_fase(self.estado[FASE])
+        elif clase == NORTH:
+            self._avisar(*self.prioridadSur)
+            self._avisar(*self.prioridadPeatones)
+        elif clase == SOUTH:
+            self._avisar(*self.prioridadPeatones)
+            self._avisar(*self.prioridadNorte)
+        else:
+            self._avisar(*self.prioridadNorte)
+            self._avisar(*self.prioridadSur)
+    
+    #Cada entrada se hace en tres pasos, todos con el mutex cogido: _llegar (antes de esperar), las esperas (_esperar_turno)
+    #y _entrar (después de esperar), y _pedir_entrada los junta. Así los backends solo tienen que cambiar cómo se coge
+    #el mutex y cómo se espera (_coger y _recorrer, ver MonitorAsincrono), y la lógica del puente es la misma para todos.
+    
+    def _llegar(self, clase: int) -> tuple:
+        """
+        Lo que hace un coche o peatón al llegar, antes de esperar. Devuelve (prioridad, paso), las esperas que tiene que hacer.
         La dirección no se tendrá en cuenta, en el sentido de que el código es simétrico si el coche quiere entrar del sur que del norte.
-        Empezaremos distinguiendo si es o no del norte.
         En el caso de los coches que vienen por el sur, el caso es análogo => no comentamos dicho caso.
         """
+        if self.peloton is not None:
+            return self._llegar_en_fase(clase)
         
-        self.mutex.acquire() #solo puede ejecutarse 1 método a la vez por cómo son los monitores, por eso se pone este Lock inicial en cada uno de los métodos que se definen
-        self.patata.value += 1
-        
-        if direction == NORTH:                                                      #suponemos que el coche que quiere entrar viene del norte
-            self.cochesNorteEsperando.value = self.cochesNorteEsperando.value + 1   #incrementamos el contador de coches que hay esperando en 1 unidad
+        if clase == NORTH:                                                          #suponemos que el coche que quiere entrar viene del norte
+            self.estado[NORTE_ESPERANDO] = self.estado[NORTE_ESPERANDO] + 1         #incrementamos el contador de coches que hay esperando en 1 unidad
+            if self.adaptativas:
+                self._ajustar_cota(NORTH)                                           #con cotas adaptativas, la cota del norte se recalcula con esta llegada
+            if self.estado[NORTE_ESPERANDO] > self.estado[COTA_ACTUAL_NORTE]:       #si con este coche superamos la cota, los del norte pasan a tener prioridad
+                self._avisar(*self.prioridadNorte)
             
-            self.esperanNorte.wait_for(self.esperandoCochesNorte)                   #tenemos que asegurarnos de que no hay mas coches del sur (ni peatones) de la cuenta para darles permiso y que pasen
-            self.pasanNorte.wait_for(self.adelanteNorte)                            #cuando ya sabemos que pueden pasar los del norte (nadie tiene preferencia), 
+            return self.prioridadNorte, self.norte                                  #tenemos que asegurarnos de que no hay mas coches del sur (ni peatones) de la cuenta para darles permiso y que pasen
+                                                                                    #cuando ya sabemos que pueden pasar los del norte (nadie tiene preferencia), 
                                                                                     #tenemos que esperar a que no haya ningun coche proveniente del sur ni ningun peatón
+        
+        elif clase == SOUTH:
+            self.estado[SUR_ESPERANDO] = self.estado[SUR_ESPERANDO] + 1 
+            if self.adaptativas:
+                self._ajustar_cota(SOUTH)
+            if self.estado[SUR_ESPERANDO] > self.estado[COTA_ACTUAL_SUR]:
+                self._avisar(*self.prioridadSur)
             
-            self.cochesNorteDentro.value = self.cochesNorteDentro.value + 1         #una vez ya puedan pasar los coches del norte, 
+            return self.prioridadSur, self.sur
+        
+        else:                                                                       #los peatones: lo mismo que si fuesen "otro coche", pues cuando va a pasar
+            self.estado[PEATONES_ESPERANDO] = self.estado[PEATONES_ESPERANDO] +1    #un peatón no puede haber ningún vehículo dentro del puente
+            if self.adaptativas:
+                self._ajustar_cota(PEDESTRIAN)
+            if self.estado[PEATONES_ESPERANDO] > self.estado[COTA_ACTUAL_PEATONES]:
+                self._avisar(*self.prioridadPeatones)
+            
+            return self.prioridadPeatones, self.peatones
+    
+    def _entrar(self, clase: int) -> None:
+        """Lo que hace un coche o peatón cuando ya le toca pasar, antes de soltar el mutex."""
+        if self.peloton is not None:
+            self._entrar_en_fase(clase)
+        
+        elif clase == NORTH:
+            self.estado[NORTE_DENTRO] = self.estado[NORTE_DENTRO] + 1               #una vez ya puedan pasar los coches del norte, 
                                                                                     #aumentamos el contador de coches en 1 unidad
-            self.cochesNorteEsperando.value = self.cochesNorteEsperando.value - 1   #y bajamos el contador de vehículos del norte esperando en 1 unidad 
+            self.estado[NORTE_ESPERANDO] = self.estado[NORTE_ESPERANDO] - 1         #y bajamos el contador de vehículos del norte esperando en 1 unidad 
                                                                                     #(pues está pasando el puente y ya no espera)
             
             
-            if self.cochesNorteEsperando.value <= COTA_COCHES_NORTE:                #si llegamos al caso en el que el numero de coches que hay esperando
+            if self.estado[NORTE_ESPERANDO] <= self.estado[COTA_ACTUAL_NORTE]:      #si llegamos al caso en el que el numero de coches que hay esperando
                                                                                     #en el norte es menor que la cota que hemos puesto inicialmente
                 
-                self.pasanSur.notify_all()                                          #tenemos que notificar de esto a los coches que hay en el Sur
-                self.pasanPeatones.notify_all()                                     #y tenemos que notificar también a los peatones
+                self._avisar(*self.prioridadSur)                                    #tenemos que notificar de esto a los coches que hay en el Sur
+                self._avisar(*self.prioridadPeatones)                               #y tenemos que notificar también a los peatones
         
         
-        else:
-            self.cochesSurEsperando.value = self.cochesSurEsperando.value + 1 
-            
-            self.esperanSur.wait_for(self.esperandoCochesSur)
-            self.pasanSur.wait_for(self.adelanteSur)
+        elif clase == SOUTH:
+            self.estado[SUR_DENTRO] = self.estado[SUR_DENTRO] + 1
+            self.estado[SUR_ESPERANDO] = self.estado[SUR_ESPERANDO] - 1
             
-            self.cochesSurDentro.value = self.cochesSurDentro.value + 1
-            self.cochesSurEsperando.value = self.cochesSurEsperando.value - 1
             
-            
-            if self.cochesSurEsperando.value <= COTA_COCHES_NORTE:
+            if self.estado[SUR_ESPERANDO] <= self.estado[COTA_ACTUAL_SUR]:
                 
-                self.pasanPeatones.notify_all()
-                self.pasanNorte.notify_all()
-
-        self.mutex.release()
-
-    def leaves_car(self, direction: int) -> None: #un determinado coche en una direccion quiere (va a) salir del puente.
-        self.mutex.acquire() 
-        self.patata.value += 1
+                self._avisar(*self.prioridadPeatones)
+                self._avisar(*self.prioridadNorte)
         
-        if direction == NORTH:                                                      #si el coche que quiere salir del puente viene del norte
-            self.cochesNorteDentro.value = self.cochesNorteDentro.value -1          #disminuimos en 1 unidad el valor de los coches del norte que hay dentro del puente
+        else:
+            self.estado[PEATONES_DENTRO] = self.estado[PEATONES_DENTRO] + 1
+            self.estado[PEATONES_ESPERANDO] = self.estado[PEATONES_ESPERANDO] -1
+            
+            if self.estado[PEATONES_ESPERANDO] <= self.estado[COTA_ACTUAL_PEATONES]:
+                self._avisar(*self.prioridadNorte)
+                self._avisar(*self.prioridadSur)
+    
+    def _salir(self, clase: int) -> None:
+        """Un coche o peatón sale del puente."""
+        if self.peloton is not None:
+            self._salir_de_fase(clase)
+        
+        elif clase == NORTH:                                                        #si el coche que quiere salir del puente viene del norte
+            self.estado[NORTE_DENTRO] = self.estado[NORTE_DENTRO] -1                #disminuimos en 1 unidad el valor de los coches del norte que hay dentro del puente
             
-            if self.cochesNorteDentro.value == 0:                                   #si al disminuir esta variable (coches del norte dentro del puente) llegamos a 0, entonces...
-                self.pasanSur.notify_all()                                          #tenemos que avisar a los coches del sur que ya no hay coches del norte en el puente
-                self.pasanPeatones.notify_all()                                     #y, analogamente, avisar a los peatones.
+            if self.estado[NORTE_DENTRO] == 0:                                      #si al disminuir esta variable (coches del norte dentro del puente) llegamos a 0, entonces...
+                self._ceder(self.sur, self.peatones)                                #tenemos que avisar a los coches del sur que ya no hay coches del norte en el puente
+                                                                                    #y, analogamente, avisar a los peatones.
                 
-        else:
-            self.cochesSurDentro.value = self.cochesSurDentro.value -1
+        elif clase == SOUTH:
+            self.estado[SUR_DENTRO] = self.estado[SUR_DENTRO] -1
             
-            if self.cochesSurDentro.value == 0:
-                self.pasanNorte.notify_all()
-                self.pasanPeatones.notify_all()
+            if self.estado[SUR_DENTRO] == 0:
+                self._ceder(self.norte, self.peatones)
         
-        self.mutex.release()
+        else:
+            self.estado[PEATONES_DENTRO] = self.estado[PEATONES_DENTRO] - 1
+            if self.estado[PEATONES_DENTRO] == 0:
+                self._ceder(self.norte, self.sur)
+    
+    def _pedir_entrada(self, clase: int, plazo: float = None):
+        """
+        Todo lo que hace wants_enter_* con el mutex cogido: si la cola está llena se va sin esperar; si no, llega,
+        espera su turno y entra, o se va si se le acaba el plazo. Si no tiene que esperar devuelve ya (si ha entrado, 0);
+        si tiene que esperar, devuelve la espera (_esperar_entrada), que hay que recorrer (_recorrer) y al terminar
+        devuelve lo mismo con el tiempo dormido en ns. Así la entrada sin esperar no crea ningún generador.
+        """
+        self.estado[PATATA] += 1
+        if self.colaMaxima is not None and self._rechazar(clase):
+            return False, 0
+        prioridad, paso = self._llegar(clase)
+        if (prioridad is None or prioridad[2]()) and paso[2]():
+            if self.instrumentar:
+                self.entradas[clase] += 1
+            self._entrar(clase)
+            return True, 0
+        return self._esperar_entrada(clase, prioridad, paso,
+                                     None if plazo is None and self.plazo is None else self._limite(plazo))
+
+    def _esperar_entrada(self, clase: int, prioridad: tuple, paso: tuple, limite: float = None):
+        entra, dormido = yield from self._esperar_turno(clase, prioridad, paso, limite)
+        if entra:
+            self._entrar(clase)
+        else:
+            self._abandonar(clase)
+        return entra, dormido
 
-    def wants_enter_pedestrian(self) -> None: #un peatón quiere entrar en el puente
+    def _dejar(self, clase: int) -> None:
+        """Lo que hace leaves_* con el mutex cogido."""
+        self.estado[PATATA] += 1
+        self._salir(clase)
+
+    def _recorrer(self, pasos) -> tuple:
+        """Recorre una espera (_pedir_entrada) durmiendo en cada condición que pide; devuelve lo que devuelve ella."""
+        if type(pasos) is tuple:                        #no ha hecho falta esperar
+            return pasos
+        try:
+            condicion, segundos = next(pasos)
+            while True:
+                condicion.wait(segundos)
+                condicion, segundos = pasos.send(None)
+        except StopIteration as fin:
+            return fin.value
+
+    def wants_enter_car(self, direction: int, plazo: float = None) -> bool: #esto indica que direccion es un entero y que devolvemos si ha entrado
+    
+    
         """
-        Se repite el mismo procedimiento que si el peaton fuese "otro coche", pues el razonamiento serñia análogo ya que
-        cuando va a pasar un peaton, no puede haber ningún vehiculo dentro del puente.
+        Método que nos dice cuándo un determinado coche va a querer entrar al puente. Se pondrá a esperar hasta que le toque pasar.
+        Lo que hace en cada paso está en _llegar y _entrar.
+        Devuelve True si ha entrado, o False si se ha ido sin entrar: cola llena (cola_maxima) o plazo agotado
+        (plazo, en segundos; si no se da, el del monitor).
         """
-        self.mutex.acquire()
-        self.patata.value += 1
         
-        self.peatonesEsperando.value = self.peatonesEsperando.value +1
-        
-        self.esperanPeatones.wait_for(self.esperandoPeatones)
-        self.pasanPeatones.wait_for(self.adelantePeatones)
-        
-        self.peatonesDentro.value = self.peatonesDentro.value + 1
-        self.peatonesEsperando.value = self.peatonesEsperando.value -1
-        
-        if self.peatonesEsperando.value <= COTA_PEATONES:
-            self.esperanNorte.notify_all()
-            self.esperanSur.notify_all()
-        
-        self.mutex.release()
+        cogido = self._coger() #solo puede ejecutarse 1 método a la vez por cómo son los monitores, por eso se pone este Lock inicial en cada uno de los métodos que se definen
+        entra, dormido = self._recorrer(self._pedir_entrada(direction, plazo))
+        self._soltar(direction, cogido, dormido)
+        return entra
+
+    def leaves_car(self, direction: int) -> None: #un determinado coche en una direccion quiere (va a) salir del puente.
+        cogido = self._coger()
+        self._dejar(direction)
+        self._soltar(direction, cogido)
+
+    def wants_enter_pedestrian(self, plazo: float = None) -> bool: #un peatón quiere entrar en el puente
+        cogido = self._coger()
+        entra, dormido = self._recorrer(self._pedir_entrada(PEDESTRIAN, plazo))
+        self._soltar(PEDESTRIAN, cogido, dormido)
+        return entra
 
     def leaves_pedestrian(self) -> None: #un peaton quiere salir del puente
-        self.mutex.acquire()
-        self.patata.value += 1
-        
-        self.peatonesDentro.value = self.peatonesDentro.value - 1
-        if self.peatonesDentro.value == 0:
-            self.pasanNorte.notify_all()
-            self.pasanSur.notify_all()
-        
-        self.mutex.release()
+        cogido = self._coger()
+        self._dejar(PEDESTRIAN)
+        self._soltar(PEDESTRIAN, cogido)
+
+    def descartes(self) -> dict:
+        """Los que se han ido sin entrar, por clase: {'norte': {'caducados': n, 'rechazados': n}, 'sur': ..., 'peatones': ...}."""
+        return {nombre: {'caducados': self.estado[CADUCADOS_CLASE[clase]], 'rechazados': self.estado[RECHAZADOS_CLASE[clase]]}
+                for clase, nombre in ((NORTH, 'norte'), (SOUTH, 'sur'), (PEDESTRIAN, 'peatones'))}
+
+    def cotas(self) -> tuple:
+        """Las cotas (norte, sur, peatones) que se están usando ahora, que con cotas adaptativas van cambiando."""
+        return tuple(self.estado[c] for c in COTA_CLASE)
+
+    def despertares(self) -> tuple:
+        """Devuelve (despertares totales, despertares inútiles) desde que se creó el monitor."""
+        return self.estado[DESPERTARES], self.estado[DESPERTARES_INUTILES]
+
+    def instantanea(self) -> dict:
+        """
+        Copia de los histogramas de la instrumentación, que se puede pedir en cualquier momento de la ejecución.
+        Se lee sin coger el mutex, así que puede faltar la operación que se esté apuntando en ese instante.
+        Para cada clase y medida: n, media (µs, o despertares) y la lista de cubetas. En 'mutex', n son las muestras.
+        Las entradas que no han dormido solo se cuentan en self.entradas, y aquí se suman a la cubeta 0 de las esperas.
+        """
+        if not self.instrumentar:
+            return {}
+        histogramas = self.histogramas[:]
+        sumas = self.sumas[:]
+        entradas = self.entradas[:]
+        resultado = {}
+        for clase, nombre in ((NORTH, 'norte'), (SOUTH, 'sur'), (PEDESTRIAN, 'peatones')):
+            resultado[nombre] = {}
+            for medida, nombre_medida in enumerate(MEDIDAS):
+                i = clase * len(MEDIDAS) + medida
+                cubetas = histogramas[i * NCUBETAS:(i + 1) * NCUBETAS]
+                if medida != MUTEX_COGIDO:
+                    cubetas[0] += max(0, entradas[clase] - sum(cubetas))
+                n = sum(cubetas)
+                unidad = 1 if medida == DESPERTARES_ENTRADA else 1000
+                resultado[nombre][nombre_medida] = {'n': n, 'media': sumas[i] / unidad / n if n else 0.0, 'cubetas': cubetas}
+        return resultado
 
     def __repr__(self) -> str:
-        return f'Monitor: {self.patata.value}'
+        return f'Monitor: {self.estado[PATATA]}'
+
+
+class MonitorAsincrono(Monitor):
+    """
+    El Monitor con el backend 'asyncio': wants_enter_* y leaves_* son corrutinas (hay que hacer await), así que cada
+    coche o peatón puede ser una corrutina en vez de un hilo o un proceso, y caben decenas de miles en un proceso.
+    Los predicados, los avisos y lo que se hace al llegar, entrar y salir son los del Monitor (_pedir_entrada y _dejar);
+    solo cambia cómo se coge el mutex (_coger) y cómo se espera (_recorrer). Hay que usarlo siempre desde el mismo
+    bucle de eventos.
+    """
+    def __init__(self, selectivo: bool = False, instrumentar: bool = False, cotas: tuple = None,
+                 peloton = None, fase_maxima: float = FASE_MAXIMA, espera_maxima: float = ESPERA_MAXIMA,
+                 plazo: float = None, cola_maxima: int = None, muestreable: bool = False):
+        super().__init__(selectivo, instrumentar, cotas, peloton, fase_maxima, 'asyncio', espera_maxima, plazo, cola_maxima,
+                         muestreable)
+
+    async def _recorrer(self, pasos) -> tuple:
+        """Monitor._recorrer, pero esperando con await (y con asyncio.wait_for si hay plazo)."""
+        if type(pasos) is tuple:
+            return pasos
+        try:
+            condicion, segundos = next(pasos)
+            while True:
+                if segundos is None:
+                    await condicion.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(condicion.wait(), segundos)
+                    except asyncio.TimeoutError:
+                        pass
+                condicion, segundos = pasos.send(None)
+        except StopIteration as fin:
+            return fin.value
+
+    async def _coger(self) -> int:
+        await self.mutex.acquire()
+        return self._cogido()
+
+    async def wants_enter_car(self, direction: int, plazo: float = None) -> bool:
+        cogido = await self._coger()
+        entra, dormido = await self._recorrer(self._pedir_entrada(direction, plazo))
+        self._soltar(direction, cogido, dormido)
+        return entra
+
+    async def leaves_car(self, direction: int) -> None:
+        cogido = await self._coger()
+        self._dejar(direction)
+        self._soltar(direction, cogido)
+
+    async def wants_enter_pedestrian(self, plazo: float = None) -> bool:
+        cogido = await self._coger()
+        entra, dormido = await self._recorrer(self._pedir_entrada(PEDESTRIAN, plazo))
+        self._soltar(PEDESTRIAN, cogido, dormido)
+        return entra
+
+    async def leaves_pedestrian(self) -> None:
+        cogido = await self._coger()
+        self._dejar(PEDESTRIAN)
+        self._soltar(PEDESTRIAN, cogido)
+
+
+def crear_monitor(backend: str = BACKEND, **opciones) -> Monitor:
+    """Un Monitor del backend que se pida (MonitorAsincrono con 'asyncio'), con las opciones de Monitor."""
+    if backend == 'asyncio':
+        return MonitorAsincrono(**opciones)
+    return Monitor(backend=backend, **opciones)
+
+def opciones() -> dict:
+    """Las opciones de Monitor según la configuración de arriba (SELECTIVO, PELOTON, COTAS, PLAZO, COLA_MAXIMA y MUESTREO)."""
+    return dict(selectivo=SELECTIVO, peloton=PELOTON, cotas=COTAS, plazo=PLAZO, cola_maxima=COLA_MAXIMA,
+                muestreable=MUESTREO is not None)
+
+def empezar_muestreo(monitor: Monitor):
+    """Con MUESTREO, empieza a muestrear el estado del monitor (que tiene que ser muestreable) y devuelve el Muestreador."""
+    if MUESTREO is None:
+        return None
+    from muestreo import Muestreador
+    muestreador = Muestreador(monitor, MUESTREO, INTERVALO_MUESTREO)
+    muestreador.empezar()
+    return muestreador
+
+def terminar_muestreo(muestreador) -> None:
+    if muestreador is not None:
+        muestreador.terminar()
 
 
 #completamos estas funciones, para darles un delay a los coches o peatores respectivamente. Suponemos que un peaton tarda mas en cruzar que un coche (delay mas alto)
-def delay_car_north(factor = 0.15) -> None:
+FACTOR_COCHES = 0.15
+FACTOR_PEATONES = 0.3
+
+def delay_car_north(factor = FACTOR_COCHES) -> None:
     time.sleep(random.random() * factor)
 
-def delay_car_south(factor = 0.15) -> None:
+def delay_car_south(factor = FACTOR_COCHES) -> None:
     time.sleep(random.random() * factor)
 
-def delay_pedestrian(factor = 0.3) -> None:
+def delay_pedestrian(factor = FACTOR_PEATONES) -> None:
     time.sleep(random.random() * factor)
 
-def car(cid: int, direction: int, monitor: Monitor)  -> None:
-    print(f"car {cid} heading {direction} wants to enter. {monitor}")
-    monitor.wants_enter_car(direction)
-    print(f"car {cid} heading {direction} enters the bridge. {monitor}")
-    if direction==NORTH :
+#sucesos de un coche o peaton: lo que se escribe por pantalla o lo que se apunta en el registro binario (registro.py)
+LLEGA = 0
+ENTRA = 1
+SALIENDO = 2
+SALE = 3
+DESCARTADO = 4                                          #se va sin cruzar (cola llena o plazo agotado)
+MENSAJES = ('wants to enter', 'enters the bridge', 'leaving the bridge', 'out of the bridge', 'gives up without crossing')
+
+def texto(aid: int, clase: int, suceso: int) -> str:
+    if clase == PEDESTRIAN:
+        return f"pedestrian {aid} {MENSAJES[suceso]}."
+    return f"car {aid} heading {clase} {MENSAJES[suceso]}."
+
+def anunciar(aid: int, clase: int, suceso: int, monitor: Monitor, registro = None) -> None:
+    """
+    Sin registro se escribe por pantalla, como en la plantilla. Con registro se apunta un suceso de tamaño fijo
+    en memoria compartida, sin tocar stdout ni coger el mutex del monitor (los contadores se copian sin lock).
+    """
+    if registro is None:
+        print(f"{texto(aid, clase, suceso)} {monitor}")
+    else:
+        registro.apuntar(aid, clase, suceso, monitor.estado)
+
+#si nos dan la duracion (la sortean los generadores), el coche o peaton tarda eso en cruzar en vez de sortearla con el delay.
+def car(cid: int, direction: int, monitor: Monitor, duracion: float = None, registro = None)  -> None:
+    anunciar(cid, direction, LLEGA, monitor, registro)
+    if monitor.wants_enter_car(direction) is False:
+        anunciar(cid, direction, DESCARTADO, monitor, registro)
+        return
+    anunciar(cid, direction, ENTRA, monitor, registro)
+    if duracion is not None:
+        time.sleep(duracion)
+    elif direction==NORTH :
         delay_car_north()
     else:
         delay_car_south()
-    print(f"car {cid} heading {direction} leaving the bridge. {monitor}")
+    anunciar(cid, direction, SALIENDO, monitor, registro)
     monitor.leaves_car(direction)
-    print(f"car {cid} heading {direction} out of the bridge. {monitor}")
-
-def pedestrian(pid: int, monitor: Monitor) -> None:
-    print(f"pedestrian {pid} wants to enter. {monitor}")
-    monitor.wants_enter_pedestrian()
-    print(f"pedestrian {pid} enters the bridge. {monitor}")
-    delay_pedestrian()
-    print(f"pedestrian {pid} leaving the bridge. {monitor}")
+    anunciar(cid, direction, SALE, monitor, registro)
+
+def pedestrian(pid: int, monitor: Monitor, duracion: float = None, registro = None) -> None:
+    anunciar(pid, PEDESTRIAN, LLEGA, monitor, registro)
+    if monitor.wants_enter_pedestrian() is False:
+        anunciar(pid, PEDESTRIAN, DESCARTADO, monitor, registro)
+        return
+    anunciar(pid, PEDESTRIAN, ENTRA, monitor, registro)
+    if duracion is not None:
+        time.sleep(duracion)
+    else:
+        delay_pedestrian()
+    anunciar(pid, PEDESTRIAN, SALIENDO, monitor, registro)
     monitor.leaves_pedestrian()
-    print(f"pedestrian {pid} out of the bridge. {monitor}")
+    anunciar(pid, PEDESTRIAN, SALE, monitor, registro)
 
+def cruzar(monitor: Monitor, clase: int, duracion: float, registros: list = None) -> bool:
+    """
+    Un coche o peatón sin mensajes ni registro, para medir (benchmark.py, multipuente.py): entra, tarda duracion
+    segundos en cruzar y sale. Con registros apunta (clase, llegada, entrada, salida). Devuelve False si se va sin entrar.
+    """
+    llegada = time.perf_counter()
+    entra = monitor.wants_enter_pedestrian() if clase == PEDESTRIAN else monitor.wants_enter_car(clase)
+    if entra is False:
+        return False
+    entrada = time.perf_counter()
+    time.sleep(duracion)
+    salida = time.perf_counter()
+    if clase == PEDESTRIAN:
+        monitor.leaves_pedestrian()
+    else:
+        monitor.leaves_car(clase)
+    if registros is not None:
+        registros.append((clase, llegada, entrada, salida))
+    return True
 
 
-def gen_pedestrian(monitor: Monitor) -> None:
+
+#con el backend 'asyncio' los coches y peatones son corrutinas: lo mismo que car() y pedestrian(), pero con await
+async def car_asincrono(cid: int, direction: int, monitor: MonitorAsincrono, duracion: float = None, registro = None) -> None:
+    anunciar(cid, direction, LLEGA, monitor, registro)
+    if not await monitor.wants_enter_car(direction):
+        anunciar(cid, direction, DESCARTADO, monitor, registro)
+        return
+    anunciar(cid, direction, ENTRA, monitor, registro)
+    await asyncio.sleep(duracion if duracion is not None else random.random() * FACTOR_COCHES)
+    anunciar(cid, direction, SALIENDO, monitor, registro)
+    await monitor.leaves_car(direction)
+    anunciar(cid, direction, SALE, monitor, registro)
+
+async def pedestrian_asincrono(pid: int, monitor: MonitorAsincrono, duracion: float = None, registro = None) -> None:
+    anunciar(pid, PEDESTRIAN, LLEGA, monitor, registro)
+    if not await monitor.wants_enter_pedestrian():
+        anunciar(pid, PEDESTRIAN, DESCARTADO, monitor, registro)
+        return
+    anunciar(pid, PEDESTRIAN, ENTRA, monitor, registro)
+    await asyncio.sleep(duracion if duracion is not None else random.random() * FACTOR_PEATONES)
+    anunciar(pid, PEDESTRIAN, SALIENDO, monitor, registro)
+    await monitor.leaves_pedestrian()
+    anunciar(pid, PEDESTRIAN, SALE, monitor, registro)
+
+
+
+def gen_pedestrian(monitor: Monitor, cola = None, semilla: int = None, registro = None) -> None:
+    """
+    Si nos pasan una cola (modo pool), en vez de crear un proceso por peaton dejamos el trabajo en la cola
+    y sera alguno de los workers el que lo ejecute.
+    Cada generador tiene su propio generador de numeros aleatorios: con la misma semilla se repiten los mismos
+    instantes de llegada y las mismas duraciones (es lo que reproduce simulacion.py).
+    Con un monitor del backend 'hilos' cada peaton es un hilo en vez de un proceso.
+    """
+    Agente = Thread if monitor.backend == 'hilos' else Process
+    rnd = random.Random(semilla)
     pid = 0
     plst = []
     for _ in range(NPED):
         pid += 1
-        p = Process(target=pedestrian, args=(pid, monitor))
-        p.start()
-        plst.append(p)
-        time.sleep(random.expovariate(1/TIME_PED))
+        duracion = rnd.random() * FACTOR_PEATONES
+        if cola is None:
+            p = Agente(target=pedestrian, args=(pid, monitor, duracion, registro))
+            p.start()
+            plst.append(p)
+        else:
+            cola.put(('pedestrian', pid, None, duracion))
+        time.sleep(rnd.expovariate(1/TIME_PED))
 
     for p in plst:
         p.join()
 
-def gen_cars(direction: int, time_cars, monitor: Monitor) -> None:
+def gen_cars(direction: int, time_cars, monitor: Monitor, cola = None, semilla: int = None, registro = None) -> None:
+    Agente = Thread if monitor.backend == 'hilos' else Process
+    rnd = random.Random(semilla)
     cid = 0
     plst = []
     for _ in range(NCARS):
         cid += 1
-        p = Process(target=car, args=(cid, direction, monitor))
-        p.start()
-        plst.append(p)
-        time.sleep(random.expovariate(1/time_cars))
+        duracion = rnd.random() * FACTOR_COCHES
+        if cola is None:
+            p = Agente(target=car, args=(cid, direction, monitor, duracion, registro))
+            p.start()
+            plst.append(p)
+        else:
+            cola.put(('car', cid, direction, duracion))
+        time.sleep(rnd.expovariate(1/time_cars))
 
     for p in plst:
         p.join()
 
-def main():
-    monitor = Monitor()
-    gcars_north = Process(target=gen_cars, args=(NORTH, TIME_CARS_NORTH, monitor))
-    gcars_south = Process(target=gen_cars, args=(SOUTH, TIME_CARS_SOUTH, monitor))
-    gped = Process(target=gen_pedestrian, args=(monitor,))
+async def gen_pedestrian_asincrono(monitor: MonitorAsincrono, semilla: int = None, registro = None) -> None:
+    """gen_pedestrian con el backend 'asyncio': cada peaton es una tarea del bucle de eventos."""
+    rnd = random.Random(semilla)
+    tareas = []
+    for pid in range(1, NPED + 1):
+        duracion = rnd.random() * FACTOR_PEATONES
+        tareas.append(asyncio.create_task(pedestrian_asincrono(pid, monitor, duracion, registro)))
+        await asyncio.sleep(rnd.expovariate(1/TIME_PED))
+    await asyncio.gather(*tareas)
+
+async def gen_cars_asincrono(direction: int, time_cars, monitor: MonitorAsincrono, semilla: int = None, registro = None) -> None:
+    rnd = random.Random(semilla)
+    tareas = []
+    for cid in range(1, NCARS + 1):
+        duracion = rnd.random() * FACTOR_COCHES
+        tareas.append(asyncio.create_task(car_asincrono(cid, direction, monitor, duracion, registro)))
+        await asyncio.sleep(rnd.expovariate(1/time_cars))
+    await asyncio.gather(*tareas)
+
+def worker(cola, monitor: Monitor, nhilos: int = HILOS_POR_WORKER, registro = None) -> None:
+    """
+    Proceso de larga duracion del modo pool. Cada worker tiene nhilos hilos que van sacando trabajos de la cola
+    y ejecutan car() o pedestrian(). Al tener varios hilos, aunque un coche se quede bloqueado esperando en el monitor,
+    el resto de agentes del worker siguen avanzando.
+    Cada hilo termina cuando saca de la cola un None.
+    """
+    def atender() -> None:
+        while True:
+            trabajo = cola.get()
+            if trabajo is None:
+                break
+            tipo, aid, direction, duracion = trabajo
+            if tipo == 'car':
+                car(aid, direction, monitor, duracion, registro)
+            else:
+                pedestrian(aid, monitor, duracion, registro)
+
+    hilos = [Thread(target=atender) for _ in range(nhilos)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+def agente_preforkado(llegadas: tuple, siguiente, turno, listos, salida, monitor: Monitor, registro = None) -> None:
+    """
+    Un agente de Preforkados: avisa en listos, espera en salida y, cuando se le suelta, hace de la siguiente llegada
+    que queda. llegadas = (ids, clases, duraciones) son arrays compartidos, que con spawn no se copian a cada hijo.
+    """
+    listos.release()
+    salida.acquire()
+    with turno:
+        i = siguiente[0]
+        siguiente[0] = i + 1
+    ids, clases, duraciones = llegadas
+    if clases[i] == PEDESTRIAN:
+        pedestrian(ids[i], monitor, duraciones[i], registro)
+    else:
+        car(ids[i], clases[i], monitor, duraciones[i], registro)
+
+class Preforkados():
+    def __init__(self, llegadas, monitor: Monitor, registro = None):
+        """
+        Un agente por cada llegada (t, clase, duracion), creados ya y parados hasta que se les suelta (ver soltar):
+        procesos, o hilos con el backend 'hilos'. Cada uno avisa en listos cuando está esperando en salida.
+        Los agentes no tienen llegada propia: al soltar uno, coge la siguiente que queda (siguiente), así que
+        solo se despierta una vez, cuando le toca, y no al empezar y luego otra vez en su instante de llegada.
+        Los agentes reciben solo lo que necesitan (agente_preforkado), no este objeto: con spawn se copia todo
+        lo que se les pasa, y la lista de agentes ya arrancados no se puede copiar.
+        """
+        hilos = monitor.backend == 'hilos'
+        Agente = Thread if hilos else Process
+        llegadas = list(llegadas)
+        self.instantes = [t for t, _, _ in llegadas]
+        ids = RawArray('i', len(llegadas))
+        clases = RawArray('b', len(llegadas))
+        duraciones = RawArray('d', len(llegadas))
+        cuantos = [0, 0, 0]
+        for i, (_, clase, duracion) in enumerate(llegadas):
+            cuantos[clase] += 1
+            ids[i], clases[i], duraciones[i] = cuantos[clase], clase, duracion
+        self.listos = threading.Semaphore(0) if hilos else Semaphore(0)
+        self.salida = threading.Semaphore(0) if hilos else Semaphore(0)
+        turno = threading.Lock() if hilos else Lock()
+        siguiente = RawArray('i', 1)                        #la próxima llegada que coge un agente al salir (con turno)
+        #se guardan también aquí: con spawn, si el padre suelta un semáforo antes de que lo abra un hijo, se borra
+        self.argumentos = argumentos = ((ids, clases, duraciones), siguiente, turno, self.listos, self.salida, monitor,
+                                        registro)
+        self.agentes = [Agente(target=agente_preforkado, args=argumentos) for _ in llegadas]
+        for a in self.agentes:
+            a.start()
+
+    def esperar(self) -> None:
+        """Espera a que todos los agentes estén parados en la salida."""
+        for _ in self.agentes:
+            self.listos.acquire()
+
+    def soltar(self, inicio: float = None) -> float:
+        """
+        Suelta a cada agente en su instante de llegada, contando desde inicio (por defecto, ahora), y devuelve inicio.
+        Los que llegan a la vez salen a la vez. Hay que haber llamado antes a esperar.
+        """
+        inicio = time.monotonic() if inicio is None else inicio
+        for t in self.instantes:
+            espera = inicio + t - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            self.salida.release()
+        return inicio
+
+    def terminar(self) -> None:
+        for a in self.agentes:
+            a.join()
+
+#con semilla, los tres generadores usan semilla, semilla+1 y semilla+2 (norte, sur y peatones)
+def semilla_sur(semilla: int = None):
+    return None if semilla is None else semilla + 1
+
+def semilla_peatones(semilla: int = None):
+    return None if semilla is None else semilla + 2
+
+def main(semilla: int = None, registro = None):
+    """Con BACKEND = 'hilos' los generadores y los agentes son hilos; con 'asyncio', corrutinas (ver main_asincrono)."""
+    if BACKEND == 'asyncio':
+        asyncio.run(main_asincrono(semilla, registro))
+        return
+    if PREFORK:
+        main_prefork(semilla, registro)
+        return
+    monitor = crear_monitor(BACKEND, **opciones())
+    muestreador = empezar_muestreo(monitor)
+    Generador = Thread if BACKEND == 'hilos' else Process
+    gcars_north = Generador(target=gen_cars, args=(NORTH, TIME_CARS_NORTH, monitor, None, semilla, registro))
+    gcars_south = Generador(target=gen_cars, args=(SOUTH, TIME_CARS_SOUTH, monitor, None, semilla_sur(semilla), registro))
+    gped = Generador(target=gen_pedestrian, args=(monitor, None, semilla_peatones(semilla), registro))
     gcars_north.start()
     gcars_south.start()
     gped.start()
     gcars_north.join()
     gcars_south.join()
     gped.join()
+    terminar_muestreo(muestreador)
     # print("Ya no hay mas gente esperando ni dentro del puente.")
 
+async def main_asincrono(semilla: int = None, registro = None):
+    monitor = MonitorAsincrono(**opciones())
+    muestreador = empezar_muestreo(monitor)
+    await asyncio.gather(gen_cars_asincrono(NORTH, TIME_CARS_NORTH, monitor, semilla, registro),
+                         gen_cars_asincrono(SOUTH, TIME_CARS_SOUTH, monitor, semilla_sur(semilla), registro),
+                         gen_pedestrian_asincrono(monitor, semilla_peatones(semilla), registro))
+    terminar_muestreo(muestreador)
+
+def main_pool(nworkers: int = NWORKERS, nhilos: int = HILOS_POR_WORKER, semilla: int = None, registro = None):
+    """
+    Igual que main(), pero los generadores no crean procesos: meten los coches y peatones en una cola
+    que atienden nworkers procesos con nhilos hilos cada uno. El monitor se comparte entre procesos, así que
+    aquí el backend siempre es 'procesos'.
+    """
+    monitor = Monitor(**opciones())
+    muestreador = empezar_muestreo(monitor)
+    cola = Queue()
+    workers = [Process(target=worker, args=(cola, monitor, nhilos, registro)) for _ in range(nworkers)]
+    for w in workers:
+        w.start()
+    gcars_north = Process(target=gen_cars, args=(NORTH, TIME_CARS_NORTH, monitor, cola, semilla))
+    gcars_south = Process(target=gen_cars, args=(SOUTH, TIME_CARS_SOUTH, monitor, cola, semilla_sur(semilla)))
+    gped = Process(target=gen_pedestrian, args=(monitor, cola, semilla_peatones(semilla)))
+    gcars_north.start()
+    gcars_south.start()
+    gped.start()
+    gcars_north.join()
+    gcars_south.join()
+    gped.join()
+    for _ in range(nworkers * nhilos):                  #un None por cada hilo para que todos terminen
+        cola.put(None)
+    for w in workers:
+        w.join()
+    terminar_muestreo(muestreador)
+
+def main_prefork(semilla: int = None, registro = None):
+    """
+    main() con PREFORK = True: las mismas llegadas que sortearían los generadores, pero todos los coches y peatones
+    se crean antes de empezar (Preforkados), así que crearlos no retrasa ninguna llegada. Cuando ya están todos
+    esperando, se les va soltando en su instante de llegada.
+    """
+    import trazas
+    monitor = crear_monitor(BACKEND, **opciones())
+    agentes = Preforkados(trazas.desde_generadores(NCARS, NPED, semilla), monitor, registro)
+    agentes.esperar()
+    muestreador = empezar_muestreo(monitor)
+    agentes.soltar()
+    agentes.terminar()
+    terminar_muestreo(muestreador)
+
 
 if __name__ == '__main__':
-    main()
+    registro = None
+    if REGISTRO is not None:
+        from registro import Registro, anillos
+        registro = Registro(nanillos=anillos('procesos' if MODO == 'pool' else BACKEND))
+        registro.empezar_volcado(REGISTRO, IMPRIMIR)
+    if MODO == 'pool':
+        main_pool(semilla=SEMILLA, registro=registro)
+    else:
+        main(semilla=SEMILLA, registro=registro)
+    if registro is not None:
+        perdidos = registro.terminar_volcado()
+        if perdidos:
+            print(f"{perdidos} sucesos perdidos en {REGISTRO} (se han sobrescrito antes de volcarlos)", file=sys.stderr)
@@ -9,7 +9,8 @@ Solution to the one-way tunnel
 
 import time
 import random
-from multiprocessing import Lock, Condition, Process
+from threading import Thread
+from multiprocessing import Lock, Condition, Process, Queue
 from multiprocessing import Value
 
 SOUTH = 1
@@ -23,6 +24,13 @@ TIME_PED = 5 # a new pedestrian enters each 5s
 TIME_IN_BRIDGE_CARS = (1, 0.5) # normal 1s, 0.5s
 TIME_IN_BRIDGE_PEDESTRIAN = (30, 10) # normal 1s, 0.5s
 
+#modo de ejecucion: 'procesos' lanza un proceso por cada coche o peaton (como en la plantilla),
+#'pool' reparte los coches y peatones entre NWORKERS procesos fijos que atienden HILOS_POR_WORKER agentes a la vez cada uno.
+MODO = 'procesos'
+SEMILLA = None                                          #con una semilla fija se repiten las llegadas (ver main)
+NWORKERS = 4
+HILOS_POR_WORKER = 32
+
 """
 Esta solución propuesta es efectiva, en el sentido que satisface el objetivo de la práctica. 
 Sin embargo, hay 1 objetivo que no satisface, que es el de la inanición.
@@ -95,7 +103,7 @@ class Monitor():
                 self.pasanPeatones.notify_all()                                     #y, analogamente, avisar a los peatones.
         else:
             self.cochesSurDentro.value = self.cochesSurDentro.value -1
-            if self.cochesSurDentro == 0:
+            if self.cochesSurDentro.value == 0:
                 self.pasanNorte.notify_all()
                 self.pasanPeatones.notify_all()
         
@@ -131,20 +139,26 @@ class Monitor():
         return f'Monitor: {self.patata.value}'
 
 #completamos estas funciones, para darles un delay a los coches o peatores respectivamente. Suponemos que un peaton tarda mas en cruzar que un coche (delay mas alto)
-def delay_car_north(factor = 0.15) -> None:
+FACTOR_COCHES = 0.15
+FACTOR_PEATONES = 0.3
+
+def delay_car_north(factor = FACTOR_COCHES) -> None:
     time.sleep(random.random() * factor)
 
-def delay_car_south(factor = 0.15) -> None:
+def delay_car_south(factor = FACTOR_COCHES) -> None:
     time.sleep(random.random() * factor)
 
-def delay_pedestrian(factor = 0.3) -> None:
+def delay_pedestrian(factor = FACTOR_PEATONES) -> None:
     time.sleep(random.random() * factor)
 
-def car(cid: int, direction: int, monitor: Monitor)  -> None:
+#si nos dan la duracion (la sortean los generadores), el coche o peaton tarda eso en cruzar en vez de sortearla con el delay.
+def car(cid: int, direction: int, monitor: Monitor, duracion: float = None)  -> None:
     print(f"car {cid} heading {direction} wants to enter. {monitor}")
     monitor.wants_enter_car(direction)
     print(f"car {cid} heading {direction} enters the bridge. {monitor}")
-    if direction==NORTH :
+    if duracion is not None:
+        time.sleep(duracion)
+    elif direction==NORTH :
         delay_car_north()
     else:
         delay_car_south()
@@ -152,48 +166,98 @@ def car(cid: int, direction: int, monitor: Monitor)  -> None:
     monitor.leaves_car(direction)
     print(f"car {cid} heading {direction} out of the bridge. {monitor}")
 
-def pedestrian(pid: int, monitor: Monitor) -> None:
+def pedestrian(pid: int, monitor: Monitor, duracion: float = None) -> None:
     print(f"pedestrian {pid} wants to enter. {monitor}")
     monitor.wants_enter_pedestrian()
     print(f"pedestrian {pid} enters the bridge. {monitor}")
-    delay_pedestrian()
+    if duracion is not None:
+        time.sleep(duracion)
+    else:
+        delay_pedestrian()
     print(f"pedestrian {pid} leaving the bridge. {monitor}")
     monitor.leaves_pedestrian()
     print(f"pedestrian {pid} out of the bridge. {monitor}")
 
 
 
-def gen_pedestrian(monitor: Monitor) -> None:
+def gen_pedestrian(monitor: Monitor, cola = None, semilla: int = None) -> None:
+    """
+    Si nos pasan una cola (modo pool), en vez de crear un proceso por peaton dejamos el trabajo en la cola
+    y sera alguno de los workers el que lo ejecute.
+    Cada generador tiene su propio generador de numeros aleatorios: con la misma semilla se repiten los mismos
+    instantes de llegada y las mismas duraciones (es lo que reproduce simulacion.py).
+    """
+    rnd = random.Random(semilla)
     pid = 0
     plst = []
     for _ in range(NPED):
         pid += 1
-        p = Process(target=pedestrian, args=(pid, monitor))
-        p.start()
-        plst.append(p)
-        time.sleep(random.expovariate(1/TIME_PED))
+        duracion = rnd.random() * FACTOR_PEATONES
+        if cola is None:
+            p = Process(target=pedestrian, args=(pid, monitor, duracion))
+            p.start()
+            plst.append(p)
+        else:
+            cola.put(('pedestrian', pid, None, duracion))
+        time.sleep(rnd.expovariate(1/TIME_PED))
 
     for p in plst:
         p.join()
 
-def gen_cars(direction: int, time_cars, monitor: Monitor) -> None:
+def gen_cars(direction: int, time_cars, monitor: Monitor, cola = None, semilla: int = None) -> None:
+    rnd = random.Random(semilla)
     cid = 0
     plst = []
     for _ in range(NCARS):
         cid += 1
-        p = Process(target=car, args=(cid, direction, monitor))
-        p.start()
-        plst.append(p)
-        time.sleep(random.expovariate(1/time_cars))
+        duracion = rnd.random() * FACTOR_COCHES
+        if cola is None:
+            p = Process(target=car, args=(cid, direction, monitor, duracion))
+            p.start()
+            plst.append(p)
+        else:
+            cola.put(('car', cid, direction, duracion))
+        time.sleep(rnd.expovariate(1/time_cars))
 
     for p in plst:
         p.join()
 
-def main():
+def worker(cola, monitor: Monitor, nhilos: int = HILOS_POR_WORKER) -> None:
+    """
+    Proceso de larga duracion del modo pool. Cada worker tiene nhilos hilos que van sacando trabajos de la cola
+    y ejecutan car() o pedestrian(). Al tener varios hilos, aunque un coche se quede bloqueado esperando en el monitor,
+    el resto de agentes del worker siguen avanzando.
+    Cada hilo termina cuando saca de la cola un None.
+    """
+    def atender() -> None:
+        while True:
+            trabajo = cola.get()
+            if trabajo is None:
+                break
+            tipo, aid, direction, duracion = trabajo
+            if tipo == 'car':
+                car(aid, direction, monitor, duracion)
+            else:
+                pedestrian(aid, monitor, duracion)
+
+    hilos = [Thread(target=atender) for _ in range(nhilos)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+#con semilla, los tres generadores usan semilla, semilla+1 y semilla+2 (norte, sur y peatones)
+def semilla_sur(semilla: int = None):
+    return None if semilla is None else semilla + 1
+
+def semilla_peatones(semilla: int = None):
+    return None if semilla is None else semilla + 2
+
+def main(semilla: int = None):
     monitor = Monitor()
-    gcars_north = Process(target=gen_cars, args=(NORTH, TIME_CARS_NORTH, monitor))
-    gcars_south = Process(target=gen_cars, args=(SOUTH, TIME_CARS_SOUTH, monitor))
-    gped = Process(target=gen_pedestrian, args=(monitor,))
+    gcars_north = Process(target=gen_cars, args=(NORTH, TIME_CARS_NORTH, monitor, None, semilla))
+    gcars_south = Process(target=gen_cars, args=(SOUTH, TIME_CARS_SOUTH, monitor, None, semilla_sur(semilla)))
+    gped = Process(target=gen_pedestrian, args=(monitor, None, semilla_peatones(semilla)))
     gcars_north.start()
     gcars_south.start()
     gped.start()
@@ -202,6 +266,33 @@ def main():
     gped.join()
     # print("Ya no hay mas gente esperando ni dentro del puente.")
 
+def main_pool(nworkers: int = NWORKERS, nhilos: int = HILOS_POR_WORKER, semilla: int = None):
+    """
+    Igual que main(), pero los generadores no crean procesos: meten los coches y peatones en una cola
+    que atienden nworkers procesos con nhilos hilos cada uno.
+    """
+    monitor = Monitor()
+    cola = Queue()
+    workers = [Process(target=worker, args=(cola, monitor, nhilos)) for _ in range(nworkers)]
+    for w in workers:
+        w.start()
+    gcars_north = Process(target=gen_cars, args=(NORTH, TIME_CARS_NORTH, monitor, cola, semilla))
+    gcars_south = Process(target=gen_cars, args=(SOUTH, TIME_CARS_SOUTH, monitor, cola, semilla_sur(semilla)))
+    gped = Process(target=gen_pedestrian, args=(monitor, cola, semilla_peatones(semilla)))
+    gcars_north.start()
+    gcars_south.start()
+    gped.start()
+    gcars_north.join()
+    gcars_south.join()
+    gped.join()
+    for _ in range(nworkers * nhilos):                  #un None por cada hilo para que todos terminen
+        cola.put(None)
+    for w in workers:
+        w.join()
+
 
 if __name__ == '__main__':
-    main()
+    if MODO == 'pool':
+        main_pool(semilla=SEMILLA)
+    else:
+        main(semilla=SEMILLA)
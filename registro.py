@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Registro binario de sucesos del puente de Ambite.
+
+Cada vez que un coche o peatón cambia de estado (car() y pedestrian() con registro) se apunta un suceso de
+tamaño fijo en un buffer circular en memoria compartida: instante, id, clase, suceso y los contadores del monitor.
+Un proceso aparte lo va vaciando a un fichero (y, si se quiere, lo escribe por pantalla).
+
+Con el backend 'procesos' (o el modo pool) el buffer tiene NANILLOS anillos de CAPACIDAD sucesos. Cada proceso
+que apunta se queda con uno para él solo mientras vive, así que reservar hueco para un suceso no necesita ningún lock
+entre procesos (los hilos de un mismo proceso se lo reparten con un lock del proceso). Si hay más procesos apuntando
+a la vez que anillos, los que se quedan sin anillo propio comparten el 0, y ahí sí se reserva con lock.
+Si todo pasa en un proceso (backends 'hilos' y 'asyncio') hay un solo anillo, el compartido (ver anillos()).
+
+Uso: python registro.py FICHERO     escribe por pantalla los sucesos de un fichero ya volcado
+
+@author: alvarocamarafernandez
+"""
+
+import os
+import sys
+import time
+import ctypes
+import struct
+import threading
+from multiprocessing import Process, Event, Lock, Value, util
+from multiprocessing.sharedctypes import RawArray
+
+import practicaParalela_2 as puente
+
+#un suceso: número de secuencia (8 bytes) y luego instante, id, clase, suceso y los contadores (PATATA .. PEATONES_ESPERANDO)
+NCONTADORES = puente.PEATONES_ESPERANDO + 1
+SECUENCIA = struct.Struct('<Q')
+DATOS = struct.Struct(f'<diBB2x{4 * NCONTADORES}s')        #los contadores se copian tal cual, como bytes
+SUCESO = struct.Struct(f'<QdiBB2x{NCONTADORES}i')
+INSTANTE = struct.Struct('<d')                              #el instante, justo detrás de la secuencia
+TAM = SUCESO.size
+
+CAPACIDAD = 1 << 16                                         #sucesos que caben en cada anillo (unos 3.4MB)
+NANILLOS = 16                                               #anillos con el backend 'procesos'
+COMPARTIDO = 0                                              #el anillo de los procesos que no tienen uno propio
+
+
+def anillos(backend: str) -> int:
+    """Cuántos anillos hacen falta con un backend: uno por proceso con 'procesos', y si no uno solo."""
+    return NANILLOS if backend == 'procesos' else 1
+
+
+def soltar_anillo(lock, ocupados, anillo: int) -> None:
+    with lock:
+        ocupados[anillo] = 0
+
+
+class Registro():
+    def __init__(self, capacidad: int = CAPACIDAD, nanillos: int = 1):
+        """
+        Cada anillo tiene su cabeza (sucesos apuntados en él desde el principio), que solo cambia su dueño.
+        El suceso se escribe sin lock: primero se pone a 0 la secuencia del hueco, luego los datos y al final
+        la secuencia buena, que es lo que mira quien lee para saber si está completo (ver volcar).
+        self.lock solo se coge para repartir los anillos y para reservar en el compartido.
+        """
+        self.nanillos = nanillos
+        self.capacidad = capacidad                          #sucesos por anillo
+        self.buffer = RawArray('B', nanillos * self.capacidad * TAM)
+        self.lock = Lock()
+        self.cabezas = RawArray('Q', nanillos)
+        self.ocupados = RawArray('B', nanillos)             #1 si el anillo tiene dueño (el compartido nunca lo tiene)
+        self.perdidos = Value('Q', 0)                       #sucesos que se han sobrescrito antes de volcarlos
+        self.parar = Event()
+        self.volcador = None
+        self._propio = None                                 #(pid, anillo, lock de sus hilos) del proceso que apunta
+        self._vistas = {}
+
+    def __getstate__(self) -> dict:
+        """
+        Para pasarlo a un proceso arrancado con spawn: el volcador, las vistas y el anillo propio son de este proceso
+        (y no se pueden serializar), el hijo crea los suyos.
+        """
+        estado = self.__dict__.copy()
+        estado.update(volcador=None, _propio=None, _vistas={})
+        return estado
+
+    def _vista(self, contadores):
+        """
+        Vistas que se crean la primera vez que se usan en cada proceso (no se pueden heredar como el buffer):
+        el buffer como memoryview y los contadores del monitor como bytes.
+        """
+        vistas = self._vistas.get(id(contadores))
+        if vistas is None:
+            vistas = self._vistas[id(contadores)] = (memoryview(self.buffer),
+                                                     (ctypes.c_char * (4 * NCONTADORES)).from_buffer(contadores))
+        return vistas
+
+    def _coger_anillo(self) -> tuple:
+        """
+        La primera vez que apunta un proceso (un hijo hereda el anillo de su padre, pero no puede usarlo) se queda
+        con un anillo libre, que se suelta cuando el proceso termina. Si no queda ninguno, le toca el compartido.
+        """
+        with self.lock:
+            anillo = next((a for a in range(self.nanillos) if a != COMPARTIDO and not self.ocupados[a]), COMPARTIDO)
+            if anillo != COMPARTIDO:
+                self.ocupados[anillo] = 1
+        if anillo != COMPARTIDO:
+            util.Finalize(None, soltar_anillo, args=(self.lock, self.ocupados, anillo), exitpriority=0)
+        self._propio = (os.getpid(), anillo, self.lock if anillo == COMPARTIDO else threading.Lock())
+        return self._propio
+
+    def apuntar(self, aid: int, clase: int, suceso: int, contadores) -> None:
+        """contadores es el array compartido del monitor (Monitor.estado): se copian los primeros NCONTADORES sin lock."""
+        propio = self._propio
+        if propio is None or propio[0] != os.getpid():
+            propio = self._coger_anillo()
+        _, anillo, lock = propio
+        with lock:
+            n = self.cabezas[anillo]
+            self.cabezas[anillo] = n + 1
+        vista, crudo = self._vista(contadores)
+        pos = (anillo * self.capacidad + n % self.capacidad) * TAM
+        SECUENCIA.pack_into(vista, pos, 0)                  #a medias: quien lo esté leyendo verá que ha cambiado
+        DATOS.pack_into(vista, pos + SECUENCIA.size, time.monotonic(), aid, clase, suceso, crudo.raw)
+        SECUENCIA.pack_into(vista, pos, n + 1)
+
+    def volcar(self, fichero: str, imprimir: bool = False) -> None:
+        """
+        Va sacando los sucesos de cada anillo en orden y escribiéndolos en el fichero hasta que se pide parar
+        y ya no queda nada; lo de cada pasada se escribe ordenado por instante. Si un suceso todavía no está escrito
+        del todo (secuencia vieja, o 0 mientras se escribe), se vuelve a mirar más tarde; si ya se ha sobrescrito
+        (el anillo ha dado la vuelta, o la secuencia ha cambiado mientras se copiaba), se cuenta como perdido.
+        """
+        vista = memoryview(self.buffer)
+        siguientes = [0] * self.nanillos
+        with open(fichero, 'wb') as f:
+            while True:
+                parar = self.parar.is_set()                 #se mira antes que las cabezas para no perder los últimos
+                quedan = False
+                sucesos = []
+                for anillo in range(self.nanillos):
+                    cabeza = self.cabezas[anillo]
+                    siguiente = siguientes[anillo]
+                    while siguiente < cabeza:
+                        pos = (anillo * self.capacidad + siguiente % self.capacidad) * TAM
+                        secuencia, = SECUENCIA.unpack_from(vista, pos)
+                        if secuencia <= siguiente:          #todavía no está escrito
+                            break
+                        suceso = bytes(vista[pos:pos + TAM])
+                        if secuencia > siguiente + 1 or SECUENCIA.unpack_from(vista, pos)[0] != secuencia:
+                            self.perdidos.value += 1
+                        else:
+                            sucesos.append(suceso)
+                        siguiente += 1
+                    siguientes[anillo] = siguiente
+                    quedan = quedan or siguiente < cabeza
+                sucesos.sort(key=lambda suceso: INSTANTE.unpack_from(suceso, SECUENCIA.size))
+                for suceso in sucesos:
+                    f.write(suceso)
+                    if imprimir:
+                        print(texto(SUCESO.unpack(suceso)))
+                if parar and not quedan:
+                    break
+                time.sleep(0.01)
+
+    def empezar_volcado(self, fichero: str, imprimir: bool = False) -> None:
+        self.parar.clear()
+        self.volcador = Process(target=self.volcar, args=(fichero, imprimir))
+        self.volcador.start()
+
+    def terminar_volcado(self) -> int:
+        """Para el volcado cuando ya está todo en el fichero; devuelve cuántos sucesos se han perdido."""
+        self.parar.set()
+        self.volcador.join()
+        return self.perdidos.value
+
+
+def leer(fichero: str):
+    """Generador de los sucesos de un fichero: (secuencia en su anillo, instante, id, clase, suceso, contadores...)."""
+    with open(fichero, 'rb') as f:
+        yield from SUCESO.iter_unpack(f.read())
+
+
+def texto(suceso: tuple) -> str:
+    """Lo mismo que escribían car() y pedestrian() por pantalla."""
+    _, _, aid, clase, tipo, patata = suceso[:6]
+    return f"{puente.texto(aid, clase, tipo)} Monitor: {patata}"
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    for s in leer(sys.argv[1]):
+        print(texto(s))
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+El puente de Ambite como servicio: un Monitor en un proceso servidor, al que se le piden las entradas y salidas
+por un socket UNIX, así que varios generadores de carga lanzados por separado pueden compartir el mismo puente.
+
+Protocolo binario: cada petición son PETICION.size bytes (id, orden, clase) y cada respuesta RESPUESTA.size bytes
+(id, estado). La respuesta a ENTRAR llega cuando el agente ya está dentro del puente (o DESCARTADO si el monitor tiene
+plazo o cola_maxima y se ha ido sin entrar), y la de SALIR cuando ha salido.
+Por una misma conexión pueden ir muchas peticiones seguidas sin esperar respuesta (de muchos agentes a la vez),
+y las respuestas vuelven en el orden en que se resuelven, no en el que se pidieron: por eso llevan el id.
+
+El servidor es un bucle de asyncio con el MonitorAsincrono: cada ENTRAR es una corrutina que espera su turno,
+y los SALIR (que nunca esperan) se atienden en cuanto se leen. Si una conexión se cierra con agentes dentro,
+el servidor los saca él para que el puente no se quede bloqueado.
+
+El cliente (Cliente) tiene los mismos métodos que el Monitor, así que car(), pedestrian() y los generadores
+de practicaParalela_2.py funcionan con él sin cambios (con hilos). Mantiene NCONEXIONES conexiones abiertas
+que comparten todos sus hilos: cada hilo usa siempre la misma, y sus peticiones van por ella junto con las de
+los demás hilos. Cliente.lote() manda muchas peticiones de golpe y espera todas las respuestas.
+
+Uso: python servidor.py servir [RUTA]               arranca el servidor
+     python servidor.py generar [RUTA] [SEMILLA]    lanza los tres generadores contra un servidor ya arrancado
+
+@author: alvarocamarafernandez
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import asyncio
+import itertools
+from threading import Thread, Lock, local
+
+import practicaParalela_2 as puente
+from practicaParalela_2 import NORTH, SOUTH, PEDESTRIAN
+
+RUTA = '/tmp/puente_ambite.sock'
+NCONEXIONES = 4
+LECTURA = 1 << 16                                           #bytes que se leen del socket de una vez
+
+PETICION = struct.Struct('<IBB')                            #id, orden y clase (NORTH, SOUTH o PEDESTRIAN)
+RESPUESTA = struct.Struct('<IB')                            #id y estado
+ENTRAR = 0
+SALIR = 1
+HECHO = 0
+ERROR = 1                                                   #orden o clase que no existen
+CERRADA = 2                                                 #la conexión se cerró antes de responder (solo en el cliente)
+DESCARTADO = 3                                              #se ha ido sin entrar (plazo agotado o cola llena): no hay que mandar SALIR
+CLASES = (NORTH, SOUTH, PEDESTRIAN)
+
+
+async def entrar(monitor: puente.MonitorAsincrono, clase: int) -> bool:
+    if clase == PEDESTRIAN:
+        return await monitor.wants_enter_pedestrian()
+    return await monitor.wants_enter_car(clase)
+
+
+async def salir(monitor: puente.MonitorAsincrono, clase: int) -> None:
+    if clase == PEDESTRIAN:
+        await monitor.leaves_pedestrian()
+    else:
+        await monitor.leaves_car(clase)
+
+
+async def atender(monitor: puente.MonitorAsincrono, lector, escritor) -> None:
+    """
+    Una conexión. dentro cuenta los agentes de cada clase que han entrado por ella y no han salido,
+    para sacarlos si la conexión se cierra sin que lo hagan.
+    """
+    dentro = [0, 0, 0]
+    pendientes = set()
+
+    async def admitir(pid: int, clase: int) -> None:
+        if await entrar(monitor, clase):
+            dentro[clase] += 1
+            estado = HECHO
+        else:
+            estado = DESCARTADO
+        if not escritor.is_closing():
+            escritor.write(RESPUESTA.pack(pid, estado))
+
+    resto = b''
+    try:
+        while True:
+            datos = await lector.read(LECTURA)
+            if not datos:
+                break
+            datos = resto + datos
+            fin = len(datos) - len(datos) % PETICION.size
+            for pid, orden, clase in PETICION.iter_unpack(memoryview(datos)[:fin]):
+                if clase not in CLASES or orden not in (ENTRAR, SALIR) or (orden == SALIR and dentro[clase] == 0):
+                    escritor.write(RESPUESTA.pack(pid, ERROR))
+                elif orden == SALIR:
+                    dentro[clase] -= 1
+                    await salir(monitor, clase)
+                    escritor.write(RESPUESTA.pack(pid, HECHO))
+                else:
+                    tarea = asyncio.create_task(admitir(pid, clase))
+                    pendientes.add(tarea)
+                    tarea.add_done_callback(pendientes.discard)
+            resto = datos[fin:]
+            await escritor.drain()
+    except ConnectionError:
+        pass
+    finally:
+        escritor.close()
+        if pendientes:                                      #los que aún esperan entrar, entran y salen
+            await asyncio.gather(*pendientes)
+        for clase in CLASES:
+            for _ in range(dentro[clase]):
+                await salir(monitor, clase)
+
+
+async def servir_asincrono(ruta: str = RUTA, monitor: puente.MonitorAsincrono = None) -> None:
+    """Sin monitor, uno como el de main() con el backend 'asyncio' (puente.opciones()), muestreado si hay MUESTREO."""
+    muestreador = None
+    if monitor is None:
+        monitor = puente.MonitorAsincrono(**puente.opciones())
+        muestreador = puente.empezar_muestreo(monitor)
+    if os.path.exists(ruta):                                #el socket de un servidor anterior que no lo borró
+        os.unlink(ruta)
+    servidor = await asyncio.start_unix_server(lambda lector, escritor: atender(monitor, lector, escritor), ruta)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        puente.terminar_muestreo(muestreador)
+
+
+def servir(ruta: str = RUTA) -> None:
+    try:
+        asyncio.run(servir_asincrono(ruta))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(ruta):
+            os.unlink(ruta)
+
+
+class Conexion():
+    def __init__(self, ruta: str = RUTA, intentos: int = 50):
+        """
+        Una conexión con el servidor y un hilo que lee las respuestas. Cada petición pendiente es un Lock cogido
+        que el lector suelta cuando llega su respuesta. Mientras el servidor arranca, se reintenta la conexión.
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        for intento in range(intentos):
+            try:
+                self.socket.connect(ruta)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if intento == intentos - 1:
+                    raise
+                time.sleep(0.1)
+        self.enviando = Lock()
+        self.ids = itertools.count()
+        self.pendientes = {}                                #id -> Lock que suelta el lector
+        self.estados = {}                                   #id -> estado de la respuesta, hasta que lo recoge quien pidió
+        self.lector = Thread(target=self._leer, daemon=True)
+        self.lector.start()
+
+    def _leer(self) -> None:
+        resto = b''
+        try:
+            while True:
+                datos = self.socket.recv(LECTURA)
+                if not datos:
+                    break
+                datos = resto + datos
+                fin = len(datos) - len(datos) % RESPUESTA.size
+                for pid, estado in RESPUESTA.iter_unpack(memoryview(datos)[:fin]):
+                    self.estados[pid] = estado
+                    self.pendientes.pop(pid).release()
+                resto = datos[fin:]
+        except OSError:
+            pass
+        for pid in list(self.pendientes):                   #nadie va a responder ya a lo que quede
+            self.estados[pid] = CERRADA
+            self.pendientes.pop(pid).release()
+
+    def pedir(self, peticiones: list) -> list:
+        """
+        Manda todas las peticiones (orden, clase) de una vez y espera a que lleguen todas las respuestas.
+        Devuelve, para cada petición, si se ha hecho (False si era un ENTRAR y el agente se ha ido sin entrar).
+        """
+        datos = bytearray()
+        esperas = []
+        for orden, clase in peticiones:
+            pid = next(self.ids) & 0xFFFFFFFF
+            espera = Lock()
+            espera.acquire()
+            self.pendientes[pid] = espera                   #antes de mandarla, que la respuesta puede llegar enseguida
+            esperas.append((pid, espera))
+            datos += PETICION.pack(pid, orden, clase)
+        with self.enviando:
+            self.socket.sendall(datos)
+        hechas = []
+        for pid, espera in esperas:
+            espera.acquire()
+            estado = self.estados.pop(pid)
+            if estado == CERRADA:
+                raise ConnectionError("el servidor ha cerrado la conexión")
+            if estado not in (HECHO, DESCARTADO):
+                raise ValueError(f"petición rechazada por el servidor (estado {estado})")
+            hechas.append(estado == HECHO)
+        return hechas
+
+    def cerrar(self) -> None:
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+        self.lector.join()
+
+
+class Cliente():
+    def __init__(self, ruta: str = RUTA, nconexiones: int = NCONEXIONES):
+        """
+        nconexiones conexiones persistentes que se reparten los hilos por turnos la primera vez que piden algo.
+        Un agente entra y sale siempre por la misma conexión (la de su hilo), que es la que el servidor vacía
+        si se cierra. backend = 'hilos' hace que gen_cars y gen_pedestrian lancen hilos.
+        """
+        self.backend = 'hilos'
+        self.conexiones = [Conexion(ruta) for _ in range(nconexiones)]
+        self.turno = itertools.count()
+        self.propia = local()
+
+    def _conexion(self) -> Conexion:
+        conexion = getattr(self.propia, 'conexion', None)
+        if conexion is None:
+            conexion = self.propia.conexion = self.conexiones[next(self.turno) % len(self.conexiones)]
+        return conexion
+
+    def lote(self, peticiones: list) -> list:
+        """
+        Muchas peticiones (orden, clase) de golpe por la conexión de este hilo. El servidor puede resolverlas en
+        cualquier orden, así que en un mismo lote no puede ir el SALIR de un agente detrás de su ENTRAR.
+        Devuelve lo mismo que Conexion.pedir.
+        """
+        return self._conexion().pedir(peticiones)
+
+    def wants_enter_car(self, direction: int) -> bool:
+        return self._conexion().pedir(((ENTRAR, direction),))[0]
+
+    def leaves_car(self, direction: int) -> None:
+        self._conexion().pedir(((SALIR, direction),))
+
+    def wants_enter_pedestrian(self) -> bool:
+        return self._conexion().pedir(((ENTRAR, PEDESTRIAN),))[0]
+
+    def leaves_pedestrian(self) -> None:
+        self._conexion().pedir(((SALIR, PEDESTRIAN),))
+
+    def cerrar(self) -> None:
+        for conexion in self.conexiones:
+            conexion.cerrar()
+
+    def __repr__(self) -> str:
+        return f'Cliente: {len(self.conexiones)} conexiones'
+
+
+def generar(ruta: str = RUTA, semilla: int = None) -> None:
+    """main() de practicaParalela_2.py con hilos, pero contra el puente del servidor."""
+    cliente = Cliente(ruta)
+    generadores = [Thread(target=puente.gen_cars, args=(NORTH, puente.TIME_CARS_NORTH, cliente, None, semilla)),
+                   Thread(target=puente.gen_cars, args=(SOUTH, puente.TIME_CARS_SOUTH, cliente, None, puente.semilla_sur(semilla))),
+                   Thread(target=puente.gen_pedestrian, args=(cliente, None, puente.semilla_peatones(semilla)))]
+    for g in generadores:
+        g.start()
+    for g in generadores:
+        g.join()
+    cliente.cerrar()
+
+
+if __name__ == '__main__':
+    args = sys.argv[2:]
+    orden = sys.argv[1] if len(sys.argv) > 1 else None
+    if orden == 'servir':
+        servir(args[0] if args else RUTA)
+    elif orden == 'generar':
+        generar(args[0] if args else RUTA, int(args[1]) if len(args) > 1 else None)
+    else:
+        print(__doc__)
+        sys.exit(1)
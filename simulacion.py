@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Simulación por eventos discretos del puente de Ambite, con reloj virtual.
+
+Se usan las mismas llegadas (TIME_CARS_NORTH, TIME_CARS_SOUTH, TIME_PED) y duraciones (FACTOR_COCHES,
+FACTOR_PEATONES) que los generadores de practicaParalela_2.py, sorteadas en el mismo orden: con la misma semilla,
+la simulación y main(semilla) ven exactamente los mismos instantes de llegada y las mismas duraciones.
+Para decidir quién entra se usan los mismos predicados que el Monitor, pero sin procesos ni esperas reales.
+
+Uso: python simulacion.py [semilla] [ncoches] [npeatones] [--simple] [--silencio]
+
+@author: alvarocamarafernandez
+"""
+
+import sys
+import time
+import heapq
+import random
+from collections import deque
+
+import practicaParalela_2 as puente
+from practicaParalela_2 import NORTH, SOUTH, PEDESTRIAN, LLEGA, ENTRA, SALE
+
+DENTRO = (puente.NORTE_DENTRO, puente.SUR_DENTRO, puente.PEATONES_DENTRO)
+ESPERANDO = (puente.NORTE_ESPERANDO, puente.SUR_ESPERANDO, puente.PEATONES_ESPERANDO)
+
+
+class MonitorVirtual():
+    """
+    El estado es una lista normal (no hace falta memoria compartida) y los predicados son los mismos métodos
+    de practicaParalela_2.Monitor, así que se admite a los coches y peatones con la misma lógica.
+    """
+    adelanteNorte = puente.Monitor.adelanteNorte
+    adelanteSur = puente.Monitor.adelanteSur
+    adelantePeatones = puente.Monitor.adelantePeatones
+    esperandoCochesNorte = puente.Monitor.esperandoCochesNorte
+    esperandoCochesSur = puente.Monitor.esperandoCochesSur
+    esperandoPeatones = puente.Monitor.esperandoPeatones
+
+    def __init__(self, cotas: tuple = None):
+        self.estado = [0] * puente.NCONTADORES
+        self.estado[puente.COTA_ACTUAL_NORTE], self.estado[puente.COTA_ACTUAL_SUR], self.estado[puente.COTA_ACTUAL_PEATONES] = \
+            cotas if cotas is not None else (puente.COTA_COCHES_NORTE, puente.COTA_COCHES_SUR, puente.COTA_PEATONES)
+
+
+class MonitorVirtualSimple(MonitorVirtual):
+    """La política de practicaParalela_con_inanicion.py: sin cotas, nadie tiene prioridad."""
+    def esperandoCochesNorte(self) -> bool:
+        return True
+
+    def esperandoCochesSur(self) -> bool:
+        return True
+
+    def esperandoPeatones(self) -> bool:
+        return True
+
+
+def llegadas(ncoches: int = puente.NCARS, npeatones: int = puente.NPED, semilla: int = None, tiempos: tuple = None) -> list:
+    """
+    Las tres corrientes de llegadas como en gen_cars / gen_pedestrian: (clase, cuántos, tiempo medio entre llegadas,
+    factor de la duración, generador aleatorio). La primera llegada de cada corriente es en t=0.
+    tiempos = (norte, sur, peatones) cambia los tiempos medios entre llegadas; por defecto, los TIME_* de practicaParalela_2.py.
+    """
+    norte, sur, peatones = tiempos if tiempos is not None else (puente.TIME_CARS_NORTH, puente.TIME_CARS_SOUTH, puente.TIME_PED)
+    return [(NORTH, ncoches, norte, puente.FACTOR_COCHES, random.Random(semilla)),
+            (SOUTH, ncoches, sur, puente.FACTOR_COCHES, random.Random(puente.semilla_sur(semilla))),
+            (PEDESTRIAN, npeatones, peatones, puente.FACTOR_PEATONES, random.Random(puente.semilla_peatones(semilla)))]
+
+
+def sucesos(ncoches: int = puente.NCARS, npeatones: int = puente.NPED, semilla: int = None, monitor = None,
+            tiempos: tuple = None, traza = None):
+    """
+    Generador de los sucesos (t, suceso, clase, id, duracion) en orden de tiempo virtual.
+    Con una traza (trazas.py, o cualquier iterable de (t, clase, duracion) ordenado) las llegadas salen de ella
+    en vez de sortearse, y ncoches, npeatones, semilla y tiempos no se usan.
+    Igual que en el Monitor, cada agente espera primero a que su grupo no tenga que ceder la prioridad (esperan*)
+    y luego a que el puente esté libre para él (pasan*). Cuando el puente queda libre y pueden entrar dos grupos,
+    entra el que tenga más gente esperando (lo mismo que hace el modo selectivo del Monitor).
+    """
+    m = MonitorVirtual() if monitor is None else monitor
+    estado = m.estado
+    prioridad = (m.esperandoCochesNorte, m.esperandoCochesSur, m.esperandoPeatones)
+    adelante = (m.adelanteNorte, m.adelanteSur, m.adelantePeatones)
+    esperan = (deque(), deque(), deque())                   #agentes dormidos en esperan* de cada clase
+    pasan = (deque(), deque(), deque())                     #agentes dormidos en pasan* de cada clase
+
+    pendientes = []                                         #montículo de (t, orden, suceso, clase, id, duracion)
+    orden = 0
+    if traza is None:
+        corrientes = llegadas(ncoches, npeatones, semilla, tiempos)
+        for clase, n, _, _, _ in corrientes:
+            if n > 0:
+                heapq.heappush(pendientes, (0.0, orden, LLEGA, clase, 1, 0.0))
+                orden += 1
+    else:                                                   #de la traza solo hay en el montículo la siguiente llegada
+        traza = iter(traza)
+        ids = [0, 0, 0]
+        siguiente = next(traza, None)
+        if siguiente is not None:
+            t, clase, duracion = siguiente
+            ids[clase] += 1
+            heapq.heappush(pendientes, (t, orden, LLEGA, clase, ids[clase], duracion))
+            orden += 1
+
+    while pendientes:
+        t, _, suceso, clase, aid, duracion = heapq.heappop(pendientes)
+        if suceso == LLEGA and traza is not None:
+            siguiente = next(traza, None)
+            if siguiente is not None:
+                t_siguiente, clase_siguiente, duracion_siguiente = siguiente
+                ids[clase_siguiente] += 1
+                heapq.heappush(pendientes, (t_siguiente, orden, LLEGA, clase_siguiente, ids[clase_siguiente], duracion_siguiente))
+                orden += 1
+            yield t, LLEGA, clase, aid, duracion
+            estado[ESPERANDO[clase]] += 1
+            esperan[clase].append((aid, duracion))
+        elif suceso == LLEGA:
+            _, n, media, factor, rnd = corrientes[clase]
+            duracion = rnd.random() * factor                #mismo orden que en gen_cars: primero la duracion,
+            if aid < n:                                     #luego el tiempo hasta el siguiente
+                heapq.heappush(pendientes, (t + rnd.expovariate(1/media), orden, LLEGA, clase, aid + 1, 0.0))
+                orden += 1
+            yield t, LLEGA, clase, aid, duracion
+            estado[ESPERANDO[clase]] += 1
+            esperan[clase].append((aid, duracion))
+        else:
+            estado[DENTRO[clase]] -= 1
+            yield t, SALE, clase, aid, duracion
+
+        #admitimos a todos los que puedan avanzar, hasta que no cambie nada
+        cambio = True
+        while cambio:
+            cambio = False
+            for c in (NORTH, SOUTH, PEDESTRIAN):
+                if esperan[c] and prioridad[c]():
+                    pasan[c].extend(esperan[c])
+                    esperan[c].clear()
+            elegida = None
+            for c in (NORTH, SOUTH, PEDESTRIAN):
+                if pasan[c] and adelante[c]() and (elegida is None or estado[ESPERANDO[c]] > estado[ESPERANDO[elegida]]):
+                    elegida = c
+            if elegida is not None:
+                cola = pasan[elegida]
+                while cola:
+                    aid, duracion = cola.popleft()
+                    estado[DENTRO[elegida]] += 1
+                    estado[ESPERANDO[elegida]] -= 1
+                    heapq.heappush(pendientes, (t + duracion, orden, SALE, elegida, aid, duracion))
+                    orden += 1
+                    yield t, ENTRA, elegida, aid, duracion
+                cambio = True
+
+
+def registros(ncoches: int = puente.NCARS, npeatones: int = puente.NPED, semilla: int = None, monitor = None,
+              tiempos: tuple = None) -> list:
+    """Los registros (clase, llegada, entrada, salida) de una simulación, como los que usa metricas.py."""
+    llegada = {}
+    entrada = {}
+    resultado = []
+    for t, suceso, clase, aid, _ in sucesos(ncoches, npeatones, semilla, monitor, tiempos):
+        if suceso == LLEGA:
+            llegada[clase, aid] = t
+        elif suceso == ENTRA:
+            entrada[clase, aid] = t
+        else:
+            resultado.append((clase, llegada.pop((clase, aid)), entrada.pop((clase, aid)), t))
+    return resultado
+
+
+def texto(t: float, suceso: int, clase: int, aid: int) -> str:
+    """El mismo mensaje que escriben car() y pedestrian(), con el tiempo virtual delante."""
+    return f"{t:10.4f} {puente.texto(aid, clase, suceso)}"
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    semilla = int(args[0]) if len(args) > 0 else None
+    ncoches = int(args[1]) if len(args) > 1 else puente.NCARS
+    npeatones = int(args[2]) if len(args) > 2 else puente.NPED
+    monitor = MonitorVirtualSimple() if '--simple' in sys.argv else MonitorVirtual()
+    silencio = '--silencio' in sys.argv
+
+    t0 = time.perf_counter()
+    nllegadas = 0
+    tfin = 0.0
+    for t, suceso, clase, aid, _ in sucesos(ncoches, npeatones, semilla, monitor):
+        tfin = t
+        if suceso == LLEGA:
+            nllegadas += 1
+        if not silencio:
+            print(texto(t, suceso, clase, aid))
+    real = time.perf_counter() - t0
+    print(f"{nllegadas} llegadas, {tfin:.1f}s de tiempo virtual en {real:.2f}s reales "
+          f"({nllegadas / real * 60:.0f} llegadas por minuto)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
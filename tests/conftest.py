@@ -0,0 +1,5 @@
+import os
+import sys
+
+#los módulos del puente son scripts sueltos en la raíz del repositorio, no un paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
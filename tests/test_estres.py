@@ -0,0 +1,14 @@
+import pytest
+
+import benchmark
+
+
+def test_estres(capsys):
+    """benchmark.py estres, pequeño: con cada backend y combinación de ESTRES nada falla (si no, sale con 1)."""
+    try:
+        benchmark.estres(n=20, nagentes=8)
+    except SystemExit as e:
+        pytest.fail(f"estres ha salido con {e.code}:\n{capsys.readouterr().out}")
+    lineas = capsys.readouterr().out.splitlines()
+    assert len(lineas) == 3 * 2 * len(benchmark.ESTRES)
+    assert all(linea.endswith('OK') for linea in lineas)
@@ -0,0 +1,15 @@
+import re
+
+import pytest
+
+import evaluador
+
+
+@pytest.mark.parametrize('semilla', [0, 3])
+def test_comprobar(capsys, semilla):
+    """evaluador.py comprobar: con las mismas llegadas, las esperas coinciden con las de simulacion.py."""
+    evaluador.comprobar(semilla)
+    diferencias = dict(re.findall(r'^(\w+): diferencia máxima en las esperas con simulacion.py (\S+)s$',
+                                  capsys.readouterr().out, re.MULTILINE))
+    assert set(diferencias) == {'cotas', 'simple'}
+    assert all(float(d) < 1e-9 for d in diferencias.values())
@@ -0,0 +1,39 @@
+import struct
+
+import pytest
+
+import trazas
+
+
+def f4(x: float) -> float:
+    """La duración se guarda como float de 4 bytes."""
+    return struct.unpack('<f', struct.pack('<f', x))[0]
+
+
+@pytest.mark.parametrize('llegadas', [
+    list(trazas.desde_generadores(40, 10, semilla=1)),
+    [(i * 0.001, i % 3, 0.5) for i in range(trazas.BLOQUE + 5)],           #más de un bloque al grabar
+], ids=['generadores', 'bloques'])
+def test_grabar_y_leer(tmp_path, llegadas):
+    """Lo que se graba con grabar() se lee igual con Traza: por índice, iterando y por columnas."""
+    fichero = str(tmp_path / 'llegadas.trz')
+    assert trazas.grabar(fichero, llegadas) == len(llegadas)
+    traza = trazas.Traza(fichero)
+    esperadas = [(t, clase, f4(duracion)) for t, clase, duracion in llegadas]
+    assert len(traza) == len(llegadas)
+    assert list(traza) == esperadas
+    assert traza[0] == esperadas[0] and traza[-1] == esperadas[-1]
+    with pytest.raises(IndexError):
+        traza[len(llegadas)]
+    t, clase, duracion = traza.columnas()
+    assert t.tolist() == [e[0] for e in esperadas]
+    assert clase.tolist() == [e[1] for e in esperadas]
+    assert duracion.tolist() == [e[2] for e in esperadas]
+
+
+def test_traza_incompleta(tmp_path):
+    fichero = tmp_path / 'llegadas.trz'
+    trazas.grabar(str(fichero), [(0.0, 0, 0.5), (0.1, 1, 0.5)])
+    fichero.write_bytes(fichero.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        trazas.Traza(str(fichero))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Trazas de llegadas del puente de Ambite: grabarlas en un fichero binario y reproducirlas.
+
+Una traza es la lista de llegadas (instante, clase, duración del cruce) ordenada por instante, en registros de tamaño
+fijo (REGISTRO) detrás de una cabecera (CABECERA). Se lee con mmap: abrir una traza no lee ni crea nada por registro,
+y cada llegada se desempaqueta solo cuando se pide. Con numpy, Traza.columnas() da las tres columnas sin copiarlas.
+
+Una traza se puede reproducir en la ejecución real con procesos (reproducir, en vez de gen_cars / gen_pedestrian)
+o en la simulación (simulacion.sucesos(traza=...)), así que dos ejecuciones ven exactamente las mismas llegadas.
+
+Uso: python trazas.py <orden> [argumentos]
+
+    grabar FICHERO [SEMILLA] [NCOCHES] [NPEATONES]
+                    graba las llegadas que sortearían los generadores de practicaParalela_2.py con esa semilla
+    registro REGISTRO FICHERO
+                    saca la traza de una ejecución ya hecha, a partir de su registro binario (registro.py)
+    ver FICHERO     escribe las llegadas por pantalla
+    vivo FICHERO [ESCALA] [REGISTRO]
+                    reproduce la traza en la ejecución real (un agente de BACKEND por llegada, o modo pool según MODO);
+                    con REGISTRO los sucesos van a ese fichero binario (registro.py) en vez de por pantalla
+    simular FICHERO reproduce la traza en la simulación
+
+@author: alvarocamarafernandez
+"""
+
+import sys
+import time
+import mmap
+import heapq
+import asyncio
+import struct
+from threading import Thread
+from multiprocessing import Process, Queue
+
+import practicaParalela_2 as puente
+from practicaParalela_2 import NORTH, SOUTH, PEDESTRIAN, LLEGA, ENTRA, SALIENDO
+
+CABECERA = struct.Struct('<4sHxxQ')                         #'TRZA', versión y número de llegadas
+MAGIA = b'TRZA'
+VERSION = 1
+REGISTRO = struct.Struct('<dfB3x')                          #instante (s), duración (s) y clase, 16 bytes
+BLOQUE = 4096                                               #registros que se escriben de una vez
+
+
+def grabar(fichero: str, llegadas) -> int:
+    """Escribe las llegadas (t, clase, duracion), que tienen que venir ordenadas por t. Devuelve cuántas ha escrito."""
+    n = 0
+    with open(fichero, 'wb') as f:
+        f.write(CABECERA.pack(MAGIA, VERSION, 0))
+        bloque = bytearray()
+        for t, clase, duracion in llegadas:
+            bloque += REGISTRO.pack(t, duracion, clase)
+            n += 1
+            if n % BLOQUE == 0:
+                f.write(bloque)
+                bloque.clear()
+        f.write(bloque)
+        f.seek(0)
+        f.write(CABECERA.pack(MAGIA, VERSION, n))       #el número de llegadas se sabe al final
+    return n
+
+
+class Traza():
+    def __init__(self, fichero: str):
+        """Abre la traza con mmap; no se lee nada hasta que se pide una llegada."""
+        with open(fichero, 'rb') as f:
+            self.mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, version, self.n = CABECERA.unpack_from(self.mapa, 0)
+        if magia != MAGIA or version != VERSION:
+            raise ValueError(f"{fichero} no es una traza (versión {VERSION})")
+        if len(self.mapa) != CABECERA.size + self.n * REGISTRO.size:
+            raise ValueError(f"{fichero} está incompleta")
+        self.datos = memoryview(self.mapa)[CABECERA.size:]
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i: int) -> tuple:
+        """La llegada i como (t, clase, duracion)."""
+        if not -self.n <= i < self.n:
+            raise IndexError(i)
+        t, duracion, clase = REGISTRO.unpack_from(self.datos, (i % self.n) * REGISTRO.size)
+        return t, clase, duracion
+
+    def __iter__(self):
+        for t, duracion, clase in REGISTRO.iter_unpack(self.datos):
+            yield t, clase, duracion
+
+    def columnas(self) -> tuple:
+        """(t, clase, duracion) como arrays de numpy que apuntan al fichero, sin copiarlo (hace falta numpy)."""
+        import numpy as np
+        tipo = np.dtype([('t', '<f8'), ('duracion', '<f4'), ('clase', 'u1'), ('_', 'V3')])
+        registros = np.frombuffer(self.datos, dtype=tipo, count=self.n)
+        return registros['t'], registros['clase'], registros['duracion']
+
+    def cerrar(self) -> None:
+        self.datos.release()
+        self.mapa.close()
+
+
+def desde_generadores(ncoches: int = puente.NCARS, npeatones: int = puente.NPED, semilla: int = None,
+                      tiempos: tuple = None):
+    """
+    Las llegadas que sortearían gen_cars / gen_pedestrian con esa semilla (las mismas que usa simulacion.py),
+    juntando las tres corrientes por orden de llegada.
+    """
+    import simulacion
+    corrientes = simulacion.llegadas(ncoches, npeatones, semilla, tiempos)
+    pendientes = [(0.0, clase, 1) for clase, n, _, _, _ in corrientes if n > 0]
+    heapq.heapify(pendientes)
+    while pendientes:
+        t, clase, aid = heapq.heappop(pendientes)
+        _, n, media, factor, rnd = corrientes[clase]
+        duracion = rnd.random() * factor                    #mismo orden que en gen_cars
+        if aid < n:
+            heapq.heappush(pendientes, (t + rnd.expovariate(1/media), clase, aid + 1))
+        yield t, clase, duracion
+
+
+def desde_registro(fichero: str) -> list:
+    """
+    Las llegadas de una ejecución real a partir de su registro binario: el instante de cada LLEGA (desde la primera)
+    y, como duración, lo que pasó entre su ENTRA y su SALIENDO. Los agentes que no llegaron a salir no se cuentan.
+    """
+    import registro
+    llegada, entrada, llegadas = {}, {}, []
+    for _, t, aid, clase, suceso, *_ in registro.leer(fichero):
+        if suceso == LLEGA:
+            llegada[clase, aid] = t
+        elif suceso == ENTRA:
+            entrada[clase, aid] = t
+        elif suceso == SALIENDO and (clase, aid) in llegada:
+            llegadas.append((llegada.pop((clase, aid)), clase, t - entrada.pop((clase, aid))))
+    llegadas.sort()
+    inicio = llegadas[0][0] if llegadas else 0.0
+    return [(t - inicio, clase, duracion) for t, clase, duracion in llegadas]
+
+
+def reproducir(traza, monitor, cola = None, registro = None, escala: float = 1.0) -> None:
+    """
+    Hace de los tres generadores a la vez, pero con las llegadas de la traza en vez de sortearlas: lanza cada coche
+    o peatón en su instante (multiplicado por escala) con su duración. Como gen_cars, con cola (modo pool) deja
+    el trabajo en la cola, y con un monitor del backend 'hilos' lanza hilos en vez de procesos.
+    """
+    Agente = Thread if monitor.backend == 'hilos' else Process
+    ids = [0, 0, 0]
+    plst = []
+    t0 = time.perf_counter()
+    for t, clase, duracion in traza:
+        espera = t0 + t * escala - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        ids[clase] += 1
+        if cola is not None:
+            cola.put(('pedestrian', ids[clase], None, duracion * escala) if clase == PEDESTRIAN else
+                     ('car', ids[clase], clase, duracion * escala))
+        elif clase == PEDESTRIAN:
+            p = Agente(target=puente.pedestrian, args=(ids[clase], monitor, duracion * escala, registro))
+            p.start()
+            plst.append(p)
+        else:
+            p = Agente(target=puente.car, args=(ids[clase], clase, monitor, duracion * escala, registro))
+            p.start()
+            plst.append(p)
+    for p in plst:
+        p.join()
+
+
+async def reproducir_asincrono(traza, monitor, registro = None, escala: float = 1.0) -> None:
+    """reproducir() con el backend 'asyncio': una corrutina por agente en vez de un hilo o proceso."""
+    ids = [0, 0, 0]
+    tareas = []
+    t0 = time.perf_counter()
+    for t, clase, duracion in traza:
+        espera = t0 + t * escala - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        ids[clase] += 1
+        if clase == PEDESTRIAN:
+            agente = puente.pedestrian_asincrono(ids[clase], monitor, duracion * escala, registro)
+        else:
+            agente = puente.car_asincrono(ids[clase], clase, monitor, duracion * escala, registro)
+        tareas.append(asyncio.create_task(agente))
+    await asyncio.gather(*tareas)
+
+
+def vivo(fichero: str, escala: float = 1.0, registro = None) -> None:
+    """
+    main() / main_pool() de practicaParalela_2.py (según MODO), pero con las llegadas de la traza: el monitor es
+    el mismo que crearían ellos (BACKEND y las mismas opciones; en modo pool, siempre 'procesos').
+    """
+    traza = Traza(fichero)
+    if puente.MODO == 'pool':
+        monitor = puente.Monitor(**puente.opciones())
+    else:
+        monitor = puente.crear_monitor(puente.BACKEND, **puente.opciones())
+    muestreador = puente.empezar_muestreo(monitor)
+    if puente.MODO != 'pool' and puente.BACKEND == 'asyncio':
+        asyncio.run(reproducir_asincrono(traza, monitor, registro, escala))
+    elif puente.MODO != 'pool':
+        reproducir(traza, monitor, None, registro, escala)
+    else:
+        cola = Queue()
+        workers = [Process(target=puente.worker, args=(cola, monitor, puente.HILOS_POR_WORKER, registro))
+                   for _ in range(puente.NWORKERS)]
+        for w in workers:
+            w.start()
+        reproducir(traza, monitor, cola, registro, escala)
+        for _ in range(puente.NWORKERS * puente.HILOS_POR_WORKER):
+            cola.put(None)
+        for w in workers:
+            w.join()
+    puente.terminar_muestreo(muestreador)
+
+
+def simular(fichero: str) -> None:
+    import simulacion
+    for t, suceso, clase, aid, _ in simulacion.sucesos(monitor=simulacion.MonitorVirtual(), traza=Traza(fichero)):
+        print(simulacion.texto(t, suceso, clase, aid))
+
+
+def texto(llegada: tuple) -> str:
+    t, clase, duracion = llegada
+    nombre = {NORTH: 'norte', SOUTH: 'sur', PEDESTRIAN: 'peaton'}[clase]
+    return f"{t:10.4f} {nombre:6} {duracion:.4f}"
+
+
+if __name__ == '__main__':
+    args = sys.argv[2:]
+    orden = sys.argv[1] if len(sys.argv) > 1 else None
+    if orden == 'grabar' and args:
+        semilla = int(args[1]) if len(args) > 1 else None
+        ncoches = int(args[2]) if len(args) > 2 else puente.NCARS
+        npeatones = int(args[3]) if len(args) > 3 else puente.NPED
+        t0 = time.perf_counter()
+        n = grabar(args[0], desde_generadores(ncoches, npeatones, semilla))
+        print(f"{n} llegadas en {args[0]} ({time.perf_counter() - t0:.2f}s)", file=sys.stderr)
+    elif orden == 'registro' and len(args) == 2:
+        print(f"{grabar(args[1], desde_registro(args[0]))} llegadas en {args[1]}", file=sys.stderr)
+    elif orden == 'ver' and args:
+        for llegada in Traza(args[0]):
+            print(texto(llegada))
+    elif orden == 'vivo' and args:
+        registro = None
+        if len(args) > 2:                                   #como REGISTRO en practicaParalela_2.py (y con IMPRIMIR)
+            from registro import Registro, anillos
+            registro = Registro(nanillos=anillos('procesos' if puente.MODO == 'pool' else puente.BACKEND))
+            registro.empezar_volcado(args[2], puente.IMPRIMIR)
+        vivo(args[0], float(args[1]) if len(args) > 1 else 1.0, registro)
+        if registro is not None:
+            perdidos = registro.terminar_volcado()
+            if perdidos:
+                print(f"{perdidos} sucesos perdidos en {args[2]} (se han sobrescrito antes de volcarlos)", file=sys.stderr)
+    elif orden == 'simular' and args:
+        simular(args[0])
+    else:
+        print(__doc__)
+        sys.exit(1)